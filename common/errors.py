@@ -34,3 +34,52 @@ class WeatherNotFoundError(NotFound):
         NotFound.__init__(self, detail=None, code=None)
         if detail is None:
             self.detail = {'error_code': 1003, 'message': 'Weather not found'}
+
+
+class InvalidHistoryRangeError(ValidationError):
+    def __init__(self, detail=None, code=None):
+        ValidationError.__init__(self, detail=None, code=None)
+        if detail is None:
+            self.detail = {'error_code': 1004, 'message': "'from', 'to' or 'step' is not valid"}
+
+
+class InvalidCursorError(ValidationError):
+    def __init__(self, detail=None, code=None):
+        ValidationError.__init__(self, detail=None, code=None)
+        if detail is None:
+            self.detail = {'error_code': 1005, 'message': "'cursor' is not valid"}
+
+
+class InvalidGranularityError(ValidationError):
+    def __init__(self, detail=None, code=None):
+        ValidationError.__init__(self, detail=None, code=None)
+        if detail is None:
+            self.detail = {'error_code': 1006, 'message': "'granularity' is not valid"}
+
+
+class InvalidKioskIdError(ValidationError):
+    def __init__(self, detail=None, code=None):
+        ValidationError.__init__(self, detail=None, code=None)
+        if detail is None:
+            self.detail = {'error_code': 1007, 'message': "'kioskId' is not valid"}
+
+
+class InvalidFieldsError(ValidationError):
+    def __init__(self, detail=None, code=None):
+        ValidationError.__init__(self, detail=None, code=None)
+        if detail is None:
+            self.detail = {'error_code': 1008, 'message': "'fields' is not valid"}
+
+
+class InvalidNearbyQueryError(ValidationError):
+    def __init__(self, detail=None, code=None):
+        ValidationError.__init__(self, detail=None, code=None)
+        if detail is None:
+            self.detail = {'error_code': 1009, 'message': "'lat', 'lon', 'radius', 'minBikes', 'minDocks' or 'limit' is not valid"}  # noqa
+
+
+class InvalidKioskIdsError(ValidationError):
+    def __init__(self, detail=None, code=None):
+        ValidationError.__init__(self, detail=None, code=None)
+        if detail is None:
+            self.detail = {'error_code': 1010, 'message': "'kioskIds' is not valid"}
@@ -0,0 +1,37 @@
+from django.db import connection
+from django.utils import timezone
+from pymongo.errors import BulkWriteError
+
+
+def get_database():
+    # the pymongo Database behind Djongo's connection, so native queries hit the same (test) database
+    connection.ensure_connection()
+    return connection.connection
+
+
+def to_mongo_datetime(value):
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def from_mongo_datetime(value):
+    if value is not None and timezone.is_naive(value):
+        return timezone.make_aware(value, timezone.utc)
+    return value
+
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def insert_many_unordered(collection, documents: list) -> list:
+    """Inserts with one unordered bulk write, skipping duplicate keys; returns the documents actually inserted."""
+    if not documents:
+        return []
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details['writeErrors']
+        if any(error['code'] != DUPLICATE_KEY_ERROR for error in write_errors):
+            raise
+        duplicated_indexes = {error['index'] for error in write_errors}
+        return [document for index, document in enumerate(documents) if index not in duplicated_indexes]
+    return documents
@@ -0,0 +1,11 @@
+from collections.abc import Mapping
+
+
+class DocumentSerializerMixin:
+    """Represents a stored document as it is, from a model instance or a repository dict.
+
+    The document is the whole representation, so the field machinery is skipped.
+    """
+
+    def to_representation(self, instance):
+        return instance['document'] if isinstance(instance, Mapping) else instance.document
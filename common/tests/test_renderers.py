@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from dateutil import tz
+
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from common import renderers
+
+
+class TestORJSONRenderer(TestCase):
+
+    def setUp(self):
+        self.renderer = renderers.ORJSONRenderer()
+
+    def assert_same_as_json_renderer(self, data, accepted_media_type=None):
+        self.assertEqual(self.renderer.render(data, accepted_media_type),
+                         JSONRenderer().render(data, accepted_media_type))
+
+    def test_same_as_json_renderer(self):
+        self.assert_same_as_json_renderer({
+            'at': datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc()),
+            'utc': datetime(2021, 6, 25, 20, 0, 0, 123000, tzinfo=timezone.utc),
+            'naive': datetime(2021, 6, 25, 20, 0, 0),
+            'tokyo': datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.gettz('Asia/Tokyo')),
+            'name': 'Municipal Services Building Plaza \u00e9 \u2028 \u2029 "quoted" \\ \n',
+            'coordinates': [-75.16374, 39.95378],
+            'bikes': [{'dockNumber': 7, 'isElectric': False, 'battery': None}],
+            'nested': ({'a': 1}, {'b': 2.5}),
+        })
+
+    def test_non_str_keys(self):
+        self.assert_same_as_json_renderer({3004: 'a', 3005: 'b'})
+
+    def test_falls_back_to_json_renderer(self):
+        self.assert_same_as_json_renderer({'count': 2 ** 70, 'price': Decimal('1.50')})
+        self.assert_same_as_json_renderer({'a': [1, 2]}, accepted_media_type='application/json; indent=4')
+
+    def test_none(self):
+        self.assertEqual(self.renderer.render(None), b'')
+
+    def test_json_renderer(self):
+        self.assertIsInstance(renderers.json_renderer(), renderers.ORJSONRenderer)
+        with override_settings(REST_FRAMEWORK={'DEFAULT_RENDERER_CLASSES': [
+                'rest_framework.renderers.BrowsableAPIRenderer', 'rest_framework.renderers.JSONRenderer']}):
+            self.assertIs(type(renderers.json_renderer()), JSONRenderer)
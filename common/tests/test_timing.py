@@ -0,0 +1,142 @@
+from datetime import datetime
+from dateutil import tz
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from unittest import mock
+
+from common import timing
+from stations import timeline
+from stations.models import Station
+from weathers.models import Weather
+
+
+def command_event(request_id, duration_micros):
+    return SimpleNamespace(request_id=request_id, duration_micros=duration_micros, command_name='find',
+                           database_name='indegother', command={'find': 'station', 'filter': {'kioskId': 3000}})
+
+
+class TestTiming(TestCase):
+
+    def setUp(self):
+        timing.reset_histograms()
+
+    def tearDown(self):
+        timing.stop()
+
+    def test_phases(self):
+        timing.start()
+        with timing.phase('resolve'):
+            pass
+        timing.add('db', 0.002)
+        timing.add('db', 0.001)
+        phases = timing.stop()
+        self.assertEqual(list(phases), ['resolve', 'db'])
+        self.assertAlmostEqual(phases['db'], 0.003)
+
+    def test_phases_outside_requests(self):
+        with timing.phase('resolve'):
+            pass
+        timing.add('db', 0.002)
+        self.assertIsNone(timing.stop())
+
+    def test_server_timing(self):
+        self.assertEqual(timing.server_timing({'auth': 0.0005, 'db': 0.00125, 'total': 0.01}, db_commands=2),
+                         'auth;dur=0.500, db;dur=1.250;desc="2 commands", total;dur=10.000')
+
+    def test_exposition(self):
+        timing.observe('api/v1/stations/', {'total': 0.003})
+        timing.observe('api/v1/stations/', {'total': 20.0})
+        exposition = timing.exposition()
+        labels = 'endpoint="api/v1/stations/",phase="total"'
+        self.assertIn('# TYPE http_request_phase_seconds histogram', exposition)
+        self.assertIn(f'http_request_phase_seconds_bucket{{{labels},le="0.0025"}} 0', exposition)
+        self.assertIn(f'http_request_phase_seconds_bucket{{{labels},le="0.005"}} 1', exposition)
+        self.assertIn(f'http_request_phase_seconds_bucket{{{labels},le="10.0"}} 1', exposition)
+        self.assertIn(f'http_request_phase_seconds_bucket{{{labels},le="+Inf"}} 2', exposition)
+        self.assertIn(f'http_request_phase_seconds_sum{{{labels}}} 20.003', exposition)
+        self.assertIn(f'http_request_phase_seconds_count{{{labels}}} 2', exposition)
+
+
+@override_settings(SLOW_QUERY_MS=100, SLOW_QUERY_SAMPLE_RATE=0.5)
+class TestCommandTimer(TestCase):
+
+    def setUp(self):
+        self.listener = timing.CommandTimer()
+        timing.start()
+
+    def tearDown(self):
+        timing.stop()
+
+    def test_adds_db_phase(self):
+        for request_id in (1, 2):
+            self.listener.started(command_event(request_id, 0))
+            self.listener.succeeded(command_event(request_id, 1500))
+        self.assertEqual(timing.db_commands(), 2)
+        self.assertAlmostEqual(timing.stop()['db'], 0.003)
+
+    @mock.patch('common.timing.random.random', return_value=0.2)
+    def test_logs_sampled_slow_commands(self, random_mock):
+        with self.assertLogs('common.timing', 'WARNING') as logs:
+            self.listener.started(command_event(1, 0))
+            self.listener.succeeded(command_event(1, 250000))
+            self.listener.started(command_event(2, 0))
+            self.listener.succeeded(command_event(2, 5000))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Slow MongoDB find on indegother: 250.0 ms', logs.output[0])
+        self.assertIn("'kioskId': 3000", logs.output[0])
+
+    @mock.patch('common.timing.random.random', return_value=0.7)
+    def test_skips_unsampled_slow_commands(self, random_mock):
+        with mock.patch.object(timing.logger, 'warning') as warning_mock:
+            self.listener.started(command_event(1, 0))
+            self.listener.failed(command_event(1, 250000))
+        warning_mock.assert_not_called()
+        self.assertEqual(timing.db_commands(), 1)
+
+
+class TestServerTimingMiddleware(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        timing.reset_histograms()
+        user = User.objects.create_user('test', 'test@example.com', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        Station.objects.create(kioskId=3000, at=at, document={'dummy': 'document'})
+        Weather.objects.create(at=at, document={'dummy': 'document'})
+
+    @override_settings(STATION_PRERENDERED_RESPONSES=False)
+    def test_server_timing_header(self):
+        response = self.client.get('/api/v1/stations/?at=2021-06-25T19:00:00', format='json')
+        self.assertEqual(response.status_code, 200)
+        phases = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        for name in ('auth', 'resolve', 'serialize', 'render', 'total'):
+            self.assertIn(name, phases)
+
+    def test_metrics(self):
+        self.client.get('/api/v1/stations/?at=2021-06-25T19:00:00', format='json')
+        self.client.get('/api/v1/stations/3000?at=2021-06-25T19:00:00', format='json')
+
+        response = self.client.get('/api/v1/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        content = response.content.decode()
+        self.assertIn('http_request_phase_seconds_count{endpoint="api/v1/stations/",phase="total"} 1', content)
+        self.assertIn('http_request_phase_seconds_count{endpoint="api/v1/stations/<kioskId>",phase="total"} 1',
+                      content)
+
+    def test_metrics_without_token(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/v1/metrics').status_code, 401)
+
+    @override_settings(REQUEST_TIMING=False)
+    def test_disabled(self):
+        response = self.client.get('/api/v1/stations/?at=2021-06-25T19:00:00', format='json')
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('api/v1/stations/', timing.exposition())
@@ -1,9 +1,14 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import requests
 
 from django.test import TestCase
 from unittest import mock
 
-from common import utils
+from common import errors, utils
 
 
 class MockResponse:
@@ -16,9 +21,91 @@ class MockResponse:
         return self.json_data
 
 
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubHandler.connections += 1
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        if self.path == '/not-found':
+            status, body = 404, b'{}'
+        elif self.path == '/not-json':
+            status, body = 200, b'not json'
+        else:
+            status, body = 200, json.dumps({'path': self.path}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
 class TestUtil(TestCase):
     @mock.patch.object(requests.Session, 'get')
     def test_call_external_api(self, get_mock):
         json_value = {'dummy': 'data'}
         get_mock.return_value = MockResponse(json_value, 200)
         self.assertEqual(utils.call_external_api(''), json_value)
+
+    def test_get_session_is_shared(self):
+        self.assertIs(utils.get_session(), utils.get_session())
+
+
+class TestUtilWithStubServer(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubHandler.delay = 0.0
+        StubHandler.connections = 0
+
+    def test_call_external_api(self):
+        self.assertEqual(utils.call_external_api(f'{self.url}/phl'), {'path': '/phl'})
+
+    def test_call_external_api_reuses_connection(self):
+        for _ in range(3):
+            utils.call_external_api(f'{self.url}/phl')
+        self.assertLessEqual(StubHandler.connections, 1)
+
+    def test_call_external_api_error_status(self):
+        with self.assertRaises(errors.ExternalAPIError):
+            utils.call_external_api(f'{self.url}/not-found')
+
+    def test_call_external_api_invalid_json(self):
+        with self.assertRaises(errors.ExternalAPIError):
+            utils.call_external_api(f'{self.url}/not-json')
+
+    def test_call_indego_station_and_openweathermap_apis_concurrently(self):
+        StubHandler.delay = 0.5
+
+        with mock.patch('common.utils.call_indego_station_api',
+                        lambda: utils.call_external_api(f'{self.url}/phl')), \
+                mock.patch('common.utils.call_openweathermap_api',
+                           lambda: utils.call_external_api(f'{self.url}/weather')):
+            started = time.monotonic()
+            station_json, weather_json = utils.call_indego_station_and_openweathermap_apis()
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(station_json, {'path': '/phl'})
+        self.assertEqual(weather_json, {'path': '/weather'})
+        self.assertLess(elapsed, 0.9)
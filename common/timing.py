@@ -0,0 +1,203 @@
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from pymongo import monitoring
+from rest_framework.authentication import TokenAuthentication
+
+logger = logging.getLogger(__name__)
+
+# Phase timings of the current request, kept per thread. Phases are timed by the views (`resolve`,
+# `serialize`), the authentication class (`auth`) and the middleware (`render`, `total`), while `db` adds
+# up every MongoDB command of the request, Djongo's and native ones alike, so it overlaps the others.
+_local = threading.local()
+
+# Histogram buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC = 'http_request_phase_seconds'
+
+
+def start():
+    _local.phases = {}
+    _local.db_commands = 0
+    _local.pending = {}
+
+
+def stop() -> dict:
+    phases = getattr(_local, 'phases', None)
+    _local.phases = None
+    return phases
+
+
+@contextmanager
+def phase(name: str):
+    phases = getattr(_local, 'phases', None)
+    if phases is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(name, time.perf_counter() - started)
+
+
+def add(name: str, seconds: float):
+    phases = getattr(_local, 'phases', None)
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+def db_commands() -> int:
+    return getattr(_local, 'db_commands', 0)
+
+
+def server_timing(phases: dict, db_commands: int = 0) -> str:
+    metrics = []
+    for name, seconds in phases.items():
+        metric = f'{name};dur={seconds * 1000:.3f}'
+        if name == 'db':
+            metric += f';desc="{db_commands} commands"'
+        metrics.append(metric)
+    return ', '.join(metrics)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Adds the duration of MongoDB commands to the `db` phase and logs a sample of the slow ones."""
+
+    def started(self, event):
+        pending = getattr(_local, 'pending', None)
+        if pending is not None and settings.SLOW_QUERY_MS is not None:
+            pending[event.request_id] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        self.finished(event)
+
+    def failed(self, event):
+        self.finished(event)
+
+    def finished(self, event):
+        seconds = event.duration_micros / 1e6
+        if getattr(_local, 'phases', None) is not None:
+            add('db', seconds)
+            _local.db_commands += 1
+
+        pending = getattr(_local, 'pending', None)
+        command = pending.pop(event.request_id, None) if pending is not None else None
+        if command is None or seconds * 1000 < settings.SLOW_QUERY_MS:
+            return
+        if random.random() < settings.SLOW_QUERY_SAMPLE_RATE:
+            database_name, document = command
+            logger.warning('Slow MongoDB %s on %s: %.1f ms %.1000r',
+                           event.command_name, database_name, seconds * 1000, document)
+
+
+_registered = []
+
+
+def register():
+    # has to run before the MongoClient is created, which only ever times the commands of clients created after it
+    if not _registered:
+        listener = CommandTimer()
+        monitoring.register(listener)
+        _registered.append(listener)
+
+
+class TimedTokenAuthentication(TokenAuthentication):
+
+    def authenticate(self, request):
+        with phase('auth'):
+            return super().authenticate(request)
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        index = bisect_left(BUCKETS, seconds)
+        if index < len(BUCKETS):
+            self.counts[index] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+_lock = threading.Lock()
+_histograms = {}
+
+
+def observe(endpoint: str, phases: dict):
+    with _lock:
+        for name, seconds in phases.items():
+            histogram = _histograms.get((endpoint, name))
+            if histogram is None:
+                histogram = _histograms[(endpoint, name)] = Histogram()
+            histogram.observe(seconds)
+
+
+def reset_histograms():
+    with _lock:
+        _histograms.clear()
+
+
+def exposition() -> str:
+    """The histograms of this process in the Prometheus text format."""
+    lines = [f'# HELP {METRIC} Time spent per endpoint and phase of a request', f'# TYPE {METRIC} histogram']
+    with _lock:
+        for (endpoint, name), histogram in sorted(_histograms.items()):
+            labels = f'endpoint="{_escape(endpoint)}",phase="{_escape(name)}"'
+            cumulative = 0
+            for bucket, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'{METRIC}_bucket{{{labels},le="{bucket}"}} {cumulative}')
+            lines.append(f'{METRIC}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{METRIC}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{METRIC}_count{{{labels}}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ServerTimingMiddleware:
+    """Times each request, sends the phases in a Server-Timing header and folds them into the histograms.
+
+    Histograms are kept per URL route, so requests that do not resolve to a view are timed but not recorded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_TIMING:
+            return self.get_response(request)
+
+        start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            commands = db_commands()
+            phases = stop()
+        phases['total'] = time.perf_counter() - started
+
+        response['Server-Timing'] = server_timing(phases, commands)
+        match = request.resolver_match
+        if match is not None:
+            observe(match.route, phases)
+        return response
+
+    def process_template_response(self, request, response):
+        # called between the view and the rendering of its response
+        if getattr(_local, 'phases', None) is not None:
+            rendering = time.perf_counter()
+            response.add_post_render_callback(lambda response: add('render', time.perf_counter() - rendering))
+        return response
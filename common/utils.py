@@ -1,19 +1,36 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from urllib3.util import Retry
 from requests.adapters import HTTPAdapter
 
 from common import errors
 
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    # one long-lived session per process, so TCP/TLS connections are kept alive between ingests
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                retries = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retries)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
 
 def call_external_api(url: str) -> str:
     try:
-        session = requests.Session()
-        retries = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-        session.mount("https://", HTTPAdapter(max_retries=retries))
-
         header = {'content-type': "Application/json"}
-        response = session.get(url=url, headers=header, stream=True, timeout=(10.0, 30.0))
+        response = get_session().get(url=url, headers=header, timeout=(10.0, 30.0))
         response.raise_for_status()
         response_json = response.json()
 
@@ -34,3 +51,11 @@ def call_openweathermap_api() -> str:
     appid = os.environ['OPENWEATHERAPI_APPID']
     url = 'https://api.openweathermap.org/data/2.5/weather?q=Philadelphia&appid=' + appid
     return call_external_api(url)
+
+
+def call_indego_station_and_openweathermap_apis() -> tuple:
+    # both feeds are fetched at the same time, so an ingest waits only for the slower one
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        station_future = executor.submit(call_indego_station_api)
+        weather_future = executor.submit(call_openweathermap_api)
+        return station_future.result(), weather_future.result()
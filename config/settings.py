@@ -46,7 +46,12 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'common.timing.TimedTokenAuthentication',
+    ],
+    # the first JSON renderer is also used for prerendered and streamed responses
+    'DEFAULT_RENDERER_CLASSES': [
+        'common.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler',
@@ -59,6 +64,7 @@ SPECTACULAR_SETTINGS = {
 }
 
 MIDDLEWARE = [
+    'common.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -116,6 +122,39 @@ else:
         }
     }
 
+# Stations
+# 'row': one document per station and ingest tick (default)
+# 'snapshot': one document per ingest tick holding every station keyed by kioskId
+#             (run `manage.py backfill_station_snapshots` to convert existing rows)
+# 'normalized': static kiosk metadata once per version and the dynamic properties per station and tick
+#               (run `manage.py backfill_normalized_stations` to convert existing rows)
+# 'delta': one document per station whose document changed since the previous tick, plus a marker per tick
+#          (a full keyframe every STATION_DELTA_KEYFRAME_INTERVAL ticks bounds the changes read per snapshot)
+STATION_STORAGE_MODE = os.environ.get('STATION_STORAGE_MODE', 'row')
+STATION_DELTA_KEYFRAME_INTERVAL = 60
+# 'orm': read 'row' storage through Djongo (default), 'pymongo': read it with native pymongo queries
+STATION_READ_BACKEND = os.environ.get('STATION_READ_BACKEND', 'orm')
+# Render GET response bodies once at ingest time and serve them as they are
+# (run `manage.py prerender_station_responses` for snapshots stored before).
+# Off by default, as it stores every snapshot a second time.
+STATION_PRERENDERED_RESPONSES = os.environ.get('STATION_PRERENDERED_RESPONSES', '0') == '1'
+# GET responses are cached per resolved snapshot (and kioskId), shared by every token
+STATION_RESPONSE_CACHE_TIMEOUT = 60*60*24
+# Cache-Control max-age of GET responses, which are conditional on an ETag of the resolved snapshot.
+# A resolved snapshot never changes, but a retention run can make the same URL resolve to another one,
+# so only snapshots retention has already thinned their bucket to, and not within max-age of
+# STATION_RETENTION_HORIZON_DAYS, are cached without revalidation.
+STATION_SNAPSHOT_MAX_AGE = 60*60*24
+# Stream the station list response station by station instead of building it in memory
+# (streamed responses are not cached)
+STATION_LIST_STREAMING = os.environ.get('STATION_LIST_STREAMING', '0') == '1'
+# Retention applied by `manage.py apply_station_retention`: every snapshot of the last
+# STATION_RETENTION_FULL_DAYS, then one per STATION_RETENTION_DOWNSAMPLE_MINUTES up to
+# STATION_RETENTION_HORIZON_DAYS, none beyond (daily rollups are kept)
+STATION_RETENTION_FULL_DAYS = 7
+STATION_RETENTION_DOWNSAMPLE_MINUTES = 60
+STATION_RETENTION_HORIZON_DAYS = 365
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -150,13 +189,19 @@ LOGGING = {
         },
     },
     'loggers': {
-        'django.db.backends': {
+        'common.timing': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': 'WARNING',
         },
     },
 }
 
+# Phase timings of every request, sent in a Server-Timing header and exposed by `api/v1/metrics`
+REQUEST_TIMING = os.environ.get('REQUEST_TIMING', '1') == '1'
+# A sample of the MongoDB commands slower than SLOW_QUERY_MS are logged (None disables it)
+SLOW_QUERY_MS = 100
+SLOW_QUERY_SAMPLE_RATE = 0.1
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
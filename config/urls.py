@@ -24,6 +24,13 @@ urlpatterns = [
     path('api/v1/indego-data-fetch-and-store-it-db', views.StationCreateAPIView.as_view()),
     path('api/v1/stations/', views.StationListRetrieveAPIView.as_view()),
     path('api/v1/stations/<kioskId>', views.StationRetrieveAPIView.as_view()),
+    path('api/v1/stations/<kioskId>/history', views.StationHistoryAPIView.as_view()),
+    path('api/v1/stations/<kioskId>/rollups', views.StationRollupAPIView.as_view()),
+    path('api/v1/stations-cache-stats', views.StationResponseCacheStatsAPIView.as_view()),
+    path('api/v1/stations-export', views.StationExportAPIView.as_view()),
+    path('api/v1/stations-nearby', views.StationNearbyAPIView.as_view()),
+    path('api/v1/stations-batch', views.StationBatchAPIView.as_view()),
+    path('api/v1/metrics', views.MetricsAPIView.as_view()),
 
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
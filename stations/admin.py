@@ -1,5 +1,11 @@
 from django.contrib import admin
 
-from .models import Station
+from .models import Kiosk, RenderedSnapshot, Station, StationChange, StationSnapshot, StationState, StationTick
 
 admin.site.register(Station)
+admin.site.register(StationSnapshot)
+admin.site.register(RenderedSnapshot)
+admin.site.register(Kiosk)
+admin.site.register(StationState)
+admin.site.register(StationTick)
+admin.site.register(StationChange)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class StationsConfig(AppConfig):
     name = 'stations'
+
+    def ready(self):
+        from common import timing
+        timing.register()
@@ -0,0 +1,226 @@
+import copy
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+from queue import Empty, Queue
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from pymongo import monitoring
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from common import mongo
+from . import importer, prerender, timeline
+from .repositories import get_station_repository
+
+# Load and latency benchmark of the ingest, list and single-station endpoints, driven in-process through
+# the whole Django stack by `manage.py benchmark_station_api` against a seeded throwaway database.
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), 'tests', 'indego_sample.json')
+ENDPOINTS = ['list', 'station', 'ingest']
+PERCENTILES = [50, 95, 99]
+
+
+class QueryCounter(monitoring.CommandListener):
+    """Counts the MongoDB commands issued by the current thread, Djongo's and native ones alike.
+
+    Commands are published on the thread running them, so counts are per request even under concurrency.
+    Has to be registered before the MongoClient is created.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self) -> int:
+        return getattr(self._local, 'count', 0)
+
+    def started(self, event):
+        self._local.count = self.count + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def features_of(stations: int, rng: random.Random) -> list:
+    """`stations` GeoJSON features modelled on the sample feed, with distinct kiosks spread around it."""
+    with open(SAMPLE_PATH) as f:
+        templates = json.load(f)['features']
+
+    features = []
+    for index in range(stations):
+        feature = copy.deepcopy(templates[index % len(templates)])
+        properties = feature['properties']
+        properties['id'] = properties['kioskId'] = 3000 + index
+        lon, lat = feature['geometry']['coordinates'][:2]
+        feature['geometry']['coordinates'] = [lon + rng.uniform(-0.05, 0.05), lat + rng.uniform(-0.05, 0.05)]
+        features.append(feature)
+    return features
+
+
+def next_tick(features: list, rng: random.Random) -> list:
+    # availability moves a little between ticks, like the live feed
+    features = copy.deepcopy(features)
+    for feature in features:
+        properties = feature['properties']
+        total = properties['totalDocks']
+        properties['bikesAvailable'] = max(0, min(total, properties['bikesAvailable'] + rng.randint(-1, 1)))
+        properties['docksAvailable'] = total - properties['bikesAvailable']
+    return features
+
+
+def weather_document(rng: random.Random) -> dict:
+    return {'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky', 'icon': '01d'}],
+            'main': {'temp': rng.uniform(270, 305), 'humidity': rng.randint(20, 90)},
+            'wind': {'speed': rng.uniform(0, 10)}, 'name': 'Philadelphia'}
+
+
+def seed(stations: int, ticks: int, end, interval: timedelta, rng: random.Random) -> list:
+    """Stores `ticks` snapshots of `stations` stations ending at `end`, like an archive import; returns the ats."""
+    database, repository = mongo.get_database(), get_station_repository()
+    features = features_of(stations, rng)
+    ats = [end - interval * (ticks - 1 - index) for index in range(ticks)]
+    for batch in importer.batched(ats, 20):
+        rows = []
+        for at in batch:
+            features = next_tick(features, rng)
+            rows.append((at, [{'kioskId': feature['properties']['kioskId'], 'at': at, 'document': feature}
+                              for feature in features],
+                         {'at': at, 'document': weather_document(rng)}, None))
+        importer.write_ticks(database, repository, rows)
+    timeline.bump_generation()
+    if settings.STATION_PRERENDERED_RESPONSES:
+        for at in ats:
+            prerender.render_snapshot(at)
+    return ats
+
+
+def percentile(sorted_values: list, rank: float) -> float:
+    # nearest-rank
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(rank / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(timings: list, queries: list, errors: int, duration: float) -> dict:
+    timings = sorted(timings)
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'duration_s': duration,
+        'throughput_rps': len(timings) / duration if duration else None,
+        'latency_ms': {
+            **{f'p{rank}': percentile(timings, rank) for rank in PERCENTILES},
+            'mean': sum(timings) / len(timings) if timings else None,
+            'max': timings[-1] if timings else None,
+        },
+        'queries_per_request': {
+            'mean': sum(queries) / len(queries) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+def run(requests: list, token: str, concurrency: int, counter: QueryCounter, expected_status: int) -> dict:
+    """Sends `requests` ((method, url) pairs) from `concurrency` threads, each with its own client."""
+    queue = Queue()
+    for request in requests:
+        queue.put(request)
+    lock = threading.Lock()
+    timings, queries, errors = [], [], []
+
+    def worker():
+        client = APIClient(raise_request_exception=False)
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        try:
+            while True:
+                try:
+                    method, url = queue.get_nowait()
+                except Empty:
+                    return
+                counter.reset()
+                started = time.perf_counter()
+                response = getattr(client, method)(url, format='json')
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    timings.append(elapsed)
+                    queries.append(counter.count)
+                    if response.status_code != expected_status:
+                        errors.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(timings, queries, len(errors), time.perf_counter() - started)
+
+
+def benchmark(ats: list, kioskIds: list, requests: int, concurrency: int, warmup: int, rng: random.Random,
+              counter: QueryCounter) -> dict:
+    """Results per endpoint; warm-up requests are sent first and left out."""
+    user, _ = User.objects.get_or_create(username='benchmark')
+    token, _ = Token.objects.get_or_create(user=user)
+
+    def list_request():
+        return 'get', '/api/v1/stations/?' + urlencode({'at': rng.choice(ats).isoformat()})
+
+    def station_request():
+        return 'get', f'/api/v1/stations/{rng.choice(kioskIds)}?' + urlencode({'at': rng.choice(ats).isoformat()})
+
+    def ingest_request():
+        return 'post', '/api/v1/indego-data-fetch-and-store-it-db'
+
+    features = [station['document'] for station in get_station_repository().stations_at(ats[-1])]
+    lock = threading.Lock()
+
+    def fetched():
+        # stands in for the Indego and OpenWeatherMap APIs, so that only the ingest itself is measured
+        nonlocal features
+        with lock:
+            features = next_tick(features, rng)
+            return {'type': 'FeatureCollection', 'features': features}, weather_document(rng)
+
+    results = {}
+    plans = {'list': (list_request, 200), 'station': (station_request, 200), 'ingest': (ingest_request, 201)}
+    with mock.patch('common.utils.call_indego_station_and_openweathermap_apis', side_effect=fetched):
+        for endpoint in ENDPOINTS:
+            make_request, expected_status = plans[endpoint]
+            run([make_request() for _ in range(warmup)], token.key, concurrency, counter, expected_status)
+            results[endpoint] = run([make_request() for _ in range(requests)], token.key, concurrency, counter,
+                                    expected_status)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """(endpoint, metric, baseline, current, change in %, regressed) rows for p95 latency and throughput."""
+    rows = []
+    for endpoint, current in results['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if previous is None:
+            continue
+        for metric, before, after, lower_is_better in [
+                ('p95 ms', previous['latency_ms']['p95'], current['latency_ms']['p95'], True),
+                ('rps', previous['throughput_rps'], current['throughput_rps'], False)]:
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            regressed = change > threshold if lower_is_better else change < -threshold
+            rows.append((endpoint, metric, before, after, change, regressed))
+    return rows
@@ -0,0 +1,47 @@
+import sys
+import zipfile
+from array import array
+
+from .timeline import EPOCH, MILLISECOND
+
+# Columnar export of the numeric station properties as a NumPy .npz archive (one .npy per column),
+# written with the standard library only: `numpy.load(path)['bikesAvailable']`.
+MISSING = -1
+METRICS = ['bikesAvailable', 'docksAvailable', 'electricBikesAvailable']
+COLUMNS = [
+    # name, typecode of array.array, NumPy descr
+    ('at', 'q', '<M8[ms]'),
+    ('kioskId', 'i', '<i4'),
+] + [(metric, 'i', '<i4') for metric in METRICS]
+
+
+def collect_columns(rows) -> dict:
+    """Typed arrays from (kioskId, at, properties) rows; missing or non-integer counters become -1."""
+    columns = {name: array(typecode) for name, typecode, _ in COLUMNS}
+    for kioskId, at, properties in rows:
+        columns['at'].append((at - EPOCH) // MILLISECOND)
+        columns['kioskId'].append(int(kioskId))
+        for metric in METRICS:
+            value = properties.get(metric)
+            columns[metric].append(value if isinstance(value, int) and not isinstance(value, bool) else MISSING)
+    return columns
+
+
+def write_npz(columns: dict, fileobj):
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, _, descr in COLUMNS:
+            with archive.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                member.write(_npy_header(descr, len(columns[name])))
+                values = columns[name]
+                if sys.byteorder == 'big':
+                    values = array(values.typecode, values)
+                    values.byteswap()
+                member.write(values.tobytes())
+
+
+def _npy_header(descr: str, length: int) -> bytes:
+    # format version 1.0, see numpy.lib.format
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({length},), }}"
+    padding = 64 - (10 + len(header) + 1) % 64
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    return b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header
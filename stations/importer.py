@@ -0,0 +1,170 @@
+import json
+import os
+import tarfile
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import PurePosixPath
+
+import django
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from common import mongo
+from weathers.models import Weather
+from weathers.serializers import WeatherSerializer
+from . import rollups
+from .serializers import StationSerializer, as_aware
+
+# Historical backfill from archived API responses, in a directory or a tarball laid out as
+#   stations/<at>.json  Indego GeoJSON station status
+#   weathers/<at>.json  OpenWeatherMap current weather
+# where <at> is an ISO 8601 datetime (e.g. stations/2019-09-01T10:00:00.json).
+STATIONS_DIRECTORY = 'stations'
+WEATHERS_DIRECTORY = 'weathers'
+
+
+class WeatherImportSerializer(WeatherSerializer):
+    # `at` uniqueness is left to the at_unique index, so that validation needs no database
+    at = serializers.DateTimeField()
+
+
+class Archive:
+    """Complete ticks (at, stations JSON, weather JSON) of an archive, skipping `skip_ats`."""
+
+    def __init__(self, path, skip_ats=frozenset()):
+        self.path = path
+        self.skip_ats = skip_ats
+        self.skipped = 0
+        self.incomplete = 0
+
+    def __iter__(self):
+        if os.path.isdir(self.path):
+            return self._iter_directory()
+        return self._iter_tarball()
+
+    def _iter_directory(self):
+        files = {}
+        for kind in (STATIONS_DIRECTORY, WEATHERS_DIRECTORY):
+            directory = os.path.join(self.path, kind)
+            for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+                at = at_of(f'{kind}/{name}')
+                if at is not None:
+                    files.setdefault(at, {})[kind] = os.path.join(directory, name)
+
+        for at in sorted(files):
+            if len(files[at]) < 2:
+                self.incomplete += 1
+            elif at in self.skip_ats:
+                self.skipped += 1
+            else:
+                yield at, _read(files[at][STATIONS_DIRECTORY]), _read(files[at][WEATHERS_DIRECTORY])
+
+    def _iter_tarball(self):
+        # members are read sequentially, holding one file of a tick until its counterpart shows up
+        pending = {}
+        with tarfile.open(self.path, 'r:*') as archive:
+            for member in archive:
+                at = at_of(member.name) if member.isfile() else None
+                if at is None:
+                    continue
+                kind = PurePosixPath(member.name).parent.name
+                files = pending.setdefault(at, {})
+                files[kind] = None if at in self.skip_ats else archive.extractfile(member).read()
+                if len(files) < 2:
+                    continue
+
+                del pending[at]
+                if at in self.skip_ats:
+                    self.skipped += 1
+                else:
+                    yield at, files[STATIONS_DIRECTORY], files[WEATHERS_DIRECTORY]
+        self.incomplete += len(pending)
+
+
+def at_of(name: str):
+    path = PurePosixPath(name)
+    if path.suffix != '.json' or path.parent.name not in (STATIONS_DIRECTORY, WEATHERS_DIRECTORY):
+        return None
+    try:
+        at = parse_datetime(path.stem)
+    except ValueError:
+        return None
+    if at is None:
+        return None
+    return as_aware(at.replace(microsecond=at.microsecond // 1000 * 1000))  # MongoDB keeps milliseconds only
+
+
+def _read(path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_ticks(ticks) -> list:
+    """Validated (at, stations, weather, error) of a batch of ticks; runs in the worker processes."""
+    return [parse_tick(*tick) for tick in ticks]
+
+
+def parse_tick(at, stations_json, weather_json):
+    # same data and rules as StationCreateAPIView, apart from uniqueness which is enforced on insert
+    try:
+        station_list_data = [{'at': at, 'kioskId': feature['properties']['kioskId'], 'document': feature}
+                             for feature in json.loads(stations_json)['features']]
+        weather_data = {'at': at, 'document': json.loads(weather_json)}
+    except (ValueError, KeyError, TypeError) as e:
+        return at, None, None, f'Invalid JSON: {e!r}'
+
+    station_list_serializer = serializers.ListSerializer(child=StationSerializer(validators=[]),
+                                                         data=station_list_data)
+    if not station_list_serializer.is_valid():
+        return at, None, None, f'Invalid stations: {station_list_serializer.errors}'
+    weather_serializer = WeatherImportSerializer(data=weather_data)
+    if not weather_serializer.is_valid():
+        return at, None, None, f'Invalid weather: {weather_serializer.errors}'
+
+    return at, [dict(item) for item in station_list_serializer.validated_data], \
+        dict(weather_serializer.validated_data), None
+
+
+def parse_in_parallel(batches, workers: int):
+    """parse_ticks over batches in `workers` processes, in order, with a bounded number of batches in flight."""
+    if workers <= 1:
+        yield from map(parse_ticks, batches)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        futures = deque()
+        for batch in batches:
+            futures.append(executor.submit(parse_ticks, batch))
+            if len(futures) >= workers * 2:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+def write_ticks(database, repository, ticks) -> int:
+    """Stores valid ticks with unordered bulk inserts and returns the number of station rows inserted.
+
+    Weather is written last, as the marker of a fully imported tick.
+    """
+    inserted = repository.import_stations([station for _, stations, _, _ in ticks for station in stations])
+    rollups.update_rollups(database, inserted)
+    mongo.insert_many_unordered(
+        database[Weather._meta.db_table],
+        [{'uuid': uuid.uuid4(), 'at': mongo.to_mongo_datetime(weather['at']), 'document': weather['document']}
+         for _, _, weather, _ in ticks])
+    return len(inserted)
+
+
+def imported_ats(database) -> set:
+    return {mongo.from_mongo_datetime(at) for at in database[Weather._meta.db_table].distinct('at')}
@@ -0,0 +1,63 @@
+from pymongo import ASCENDING, IndexModel
+
+from weathers.models import Weather
+from .models import Kiosk, RenderedSnapshot, Station, StationChange, StationSnapshot, StationState, StationTick
+from .rollups import GRANULARITIES
+
+# Djongo does not create these without migrations, so they are managed with `manage.py station_indexes`.
+# (kioskId, at) is the seek index of single-station lookups ({kioskId: k, at: {$gte: t}} sorted by at)
+# and covers `first_station_at`, which projects `at` only.
+INDEXES = {
+    Station._meta.db_table: [
+        IndexModel([('kioskId', ASCENDING), ('at', ASCENDING)], name='kioskId_at_unique', unique=True),
+        IndexModel([('at', ASCENDING)], name='at'),
+    ],
+    Weather._meta.db_table: [
+        IndexModel([('at', ASCENDING)], name='at_unique', unique=True),
+    ],
+    StationSnapshot._meta.db_table: [
+        IndexModel([('at', ASCENDING)], name='at_unique', unique=True),
+    ],
+    RenderedSnapshot._meta.db_table: [
+        IndexModel([('at', ASCENDING)], name='at_unique', unique=True),
+    ],
+    StationState._meta.db_table: [
+        IndexModel([('kioskId', ASCENDING), ('at', ASCENDING)], name='kioskId_at_unique', unique=True),
+        IndexModel([('at', ASCENDING)], name='at'),
+    ],
+    Kiosk._meta.db_table: [
+        IndexModel([('digest', ASCENDING)], name='digest_unique', unique=True),
+    ],
+    StationTick._meta.db_table: [
+        IndexModel([('at', ASCENDING)], name='at_unique', unique=True),
+        IndexModel([('removed', ASCENDING), ('at', ASCENDING)], name='removed_at'),
+    ],
+    StationChange._meta.db_table: [
+        IndexModel([('kioskId', ASCENDING), ('at', ASCENDING)], name='kioskId_at_unique', unique=True),
+        IndexModel([('at', ASCENDING)], name='at'),
+    ],
+    **{
+        collection_name: [
+            IndexModel([('kioskId', ASCENDING), ('bucket', ASCENDING)], name='kioskId_bucket_unique', unique=True),
+        ]
+        for collection_name, _ in GRANULARITIES.values()
+    },
+}
+
+
+def missing_indexes(database) -> dict:
+    # indexes whose key pattern is not present yet, whatever their name
+    missing = {}
+    for collection_name, indexes in INDEXES.items():
+        existing_keys = [list(index['key']) for index in database[collection_name].index_information().values()]
+        missing_in_collection = [index for index in indexes if list(index.document['key'].items()) not in existing_keys]
+        if missing_in_collection:
+            missing[collection_name] = missing_in_collection
+    return missing
+
+
+def ensure_indexes(database) -> dict:
+    missing = missing_indexes(database)
+    for collection_name, indexes in missing.items():
+        database[collection_name].create_indexes(indexes)
+    return missing
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from common import mongo
+from stations import retention
+from stations.repositories import get_station_repository
+
+
+class Command(BaseCommand):
+    help = ('Downsamples snapshots older than STATION_RETENTION_FULL_DAYS to one per '
+            'STATION_RETENTION_DOWNSAMPLE_MINUTES and deletes those older than STATION_RETENTION_HORIZON_DAYS')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the snapshots that would be deleted')
+        parser.add_argument('--batch-size', type=int, default=100, help='Snapshots per delete (default: 100)')
+        parser.add_argument('--pause', type=float, default=0.5,
+                            help='Seconds between deletes, to leave room for the API (default: 0.5)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        database = mongo.get_database()
+        repository = get_station_repository()
+        ats = retention.expired_ats(repository, database, timezone.now(),
+                                    full_resolution=timedelta(days=settings.STATION_RETENTION_FULL_DAYS),
+                                    step=timedelta(minutes=settings.STATION_RETENTION_DOWNSAMPLE_MINUTES),
+                                    horizon=timedelta(days=settings.STATION_RETENTION_HORIZON_DAYS))
+        if options['dry_run']:
+            span = f' from {ats[0].isoformat()} to {ats[-1].isoformat()}' if ats else ''
+            self.stdout.write(f'{len(ats)} snapshots would be deleted{span}')
+            return
+
+        deleted = 0
+        for deleted in retention.delete_ats(repository, database, ats, options['batch_size'], options['pause']):
+            self.stdout.write(f'{deleted}/{len(ats)} snapshots deleted')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} snapshots'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from common import mongo
+from stations import importer, indexes
+from stations.models import Station
+from stations.repositories import StationNormalizedRepository
+
+
+class Command(BaseCommand):
+    help = 'Converts `station` rows into `kiosk` templates and `station_state` documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-rows', action='store_true',
+                            help='Delete `station` rows once their state is stored')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert (default: 1000)')
+
+    def handle(self, *args, **options):
+        database = mongo.get_database()
+        # rows converted by an interrupted run are skipped by the unique indexes
+        indexes.ensure_indexes(database)
+        rows = database[Station._meta.db_table]
+        repository = StationNormalizedRepository()
+
+        converted = total = 0
+        cursor = rows.find({}, {'kioskId': 1, 'at': 1, 'document': 1}, batch_size=options['batch_size'])
+        for batch in importer.batched(cursor, options['batch_size']):
+            stations = [{'kioskId': row['kioskId'], 'at': mongo.from_mongo_datetime(row['at']),
+                         'document': row['document']}
+                        for row in batch]
+            converted += len(repository.import_stations(stations))
+            total += len(batch)
+            if options['delete_rows']:
+                rows.delete_many({'_id': {'$in': [row['_id'] for row in batch]}})
+
+        self.stdout.write(self.style.SUCCESS(f'Converted {converted} rows ({total - converted} already converted)'))
@@ -0,0 +1,35 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from common import mongo
+from stations.models import Station, StationSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Converts `station` rows into one `station_snapshot` document per ingest tick'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-rows', action='store_true',
+                            help='Delete `station` rows once their snapshot is stored')
+
+    def handle(self, *args, **options):
+        database = mongo.get_database()
+        rows = database[Station._meta.db_table]
+        snapshots = database[StationSnapshot._meta.db_table]
+        snapshots.create_index('at', unique=True)
+
+        converted = skipped = 0
+        cursor = rows.find({}, {'_id': 0, 'kioskId': 1, 'at': 1, 'document': 1}).sort('at', 1)
+        for at, group in groupby(cursor, key=lambda row: row['at']):
+            if snapshots.count_documents({'at': at}, limit=1):
+                skipped += 1
+            else:
+                StationSnapshot.objects.create(
+                    at=mongo.from_mongo_datetime(at),
+                    stations={str(row['kioskId']): row['document'] for row in group})
+                converted += 1
+            if options['delete_rows']:
+                rows.delete_many({'at': at})
+
+        self.stdout.write(self.style.SUCCESS(f'Converted {converted} ticks ({skipped} already converted)'))
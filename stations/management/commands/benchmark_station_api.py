@@ -0,0 +1,106 @@
+import json
+import random
+import subprocess
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from pymongo import monitoring
+
+from common import mongo
+from stations import benchmark, indexes
+from stations.repositories import get_station_repository
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database with a synthetic history, then measures latency, throughput and MongoDB '
+            'commands per request of the list, single-station and ingest endpoints and stores them as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stations', type=int, default=150, help='Stations per snapshot (default: 150)')
+        parser.add_argument('--ticks', type=int, default=288, help='Seeded snapshots, 5 minutes apart (default: 288)')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint (default: 200)')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per endpoint (default: 20)')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients (default: 4)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the history and requests')
+        parser.add_argument('--output', help='JSON results file (default: benchmark-<commit>.json)')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Change in percent reported as a regression by --compare (default: 10)')
+        parser.add_argument('--keepdb', action='store_true', help='Keep and reuse the seeded database between runs')
+
+    def handle(self, *args, **options):
+        if min(options['stations'], options['ticks'], options['requests'], options['concurrency']) < 1:
+            raise CommandError('--stations, --ticks, --requests and --concurrency must be positive')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        # before any MongoClient is created, so that every command is counted
+        counter = benchmark.QueryCounter()
+        monitoring.register(counter)
+
+        rng = random.Random(options['seed'])
+        # the in-process clients of the test framework, on a test database left alone by the API
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            indexes.ensure_indexes(mongo.get_database())
+            repository = get_station_repository()
+            ats = sorted(repository.all_ats())
+            if not ats:
+                self.stdout.write(f'Seeding {options["ticks"]} snapshots of {options["stations"]} stations...')
+                ats = benchmark.seed(options['stations'], options['ticks'], timezone.now() - timedelta(days=1),
+                                     timedelta(minutes=5), rng)
+            kioskIds = sorted({station['kioskId'] for station in repository.stations_at(ats[-1])})
+            endpoints = benchmark.benchmark(ats, kioskIds, options['requests'], options['concurrency'],
+                                            options['warmup'], rng, counter)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        commit = self.commit()
+        results = {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'settings': {name: getattr(settings, name) for name in [
+                'STATION_STORAGE_MODE', 'STATION_READ_BACKEND', 'STATION_PRERENDERED_RESPONSES',
+                'STATION_LIST_STREAMING']},
+            'parameters': {name: options[name] for name in [
+                'stations', 'ticks', 'requests', 'warmup', 'concurrency', 'seed']},
+            'endpoints': endpoints,
+        }
+        output = options['output'] or f'benchmark-{(commit or "unknown")[:12]}.json'
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        self.stdout.write(f'{"endpoint":<10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"rps":>10}'
+                          f'{"queries":>10}{"errors":>8}')
+        for endpoint, result in endpoints.items():
+            latency = result['latency_ms']
+            self.stdout.write(f'{endpoint:<10}{latency["p50"]:>10.2f}{latency["p95"]:>10.2f}{latency["p99"]:>10.2f}'
+                              f'{result["throughput_rps"]:>10.1f}{result["queries_per_request"]["mean"]:>10.1f}'
+                              f'{result["errors"]:>8}')
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+        if baseline is not None:
+            self.stdout.write(f'Compared with {baseline.get("commit") or options["compare"]}:')
+            for endpoint, metric, before, after, change, regressed in benchmark.compare(
+                    results, baseline, options['threshold']):
+                line = f'{endpoint:<10}{metric:<8}{before:>10.2f}{after:>10.2f}{change:>+9.1f}%'
+                self.stdout.write(self.style.ERROR(line + '  regression') if regressed else line)
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
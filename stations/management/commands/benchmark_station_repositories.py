@@ -0,0 +1,44 @@
+import time
+from statistics import median
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stations.repositories import StationMongoRowRepository, StationRowRepository
+
+
+class Command(BaseCommand):
+    help = 'Compares the ORM and pymongo read paths on the query shapes used by the station GET endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100)
+
+    def handle(self, *args, **options):
+        orm, native = StationRowRepository(), StationMongoRowRepository()
+        ats = sorted(native.all_ats())
+        if not ats:
+            raise CommandError('No stations stored yet')
+        at = ats[len(ats) // 2]
+        stations = list(native.stations_at(at))
+        kioskId = stations[0]['kioskId']
+
+        shapes = {
+            'first snapshot on or after': lambda repository: repository.first_at(at),
+            'all stations at a time': lambda repository: list(repository.stations_at(at)),
+            'one kiosk on or after': lambda repository: repository.station_on_or_after(kioskId, at),
+            'weather at a time': lambda repository: repository.weather_at(at),
+        }
+        self.stdout.write(f'{len(ats)} snapshots, {len(stations)} stations at {at.isoformat()}, '
+                          f'{options["iterations"]} iterations (median ms)')
+        self.stdout.write(f'{"query":<30}{"orm":>10}{"pymongo":>10}{"speedup":>10}')
+        for name, query in shapes.items():
+            orm_ms = self.measure(query, orm, options['iterations'])
+            native_ms = self.measure(query, native, options['iterations'])
+            self.stdout.write(f'{name:<30}{orm_ms:>10.3f}{native_ms:>10.3f}{orm_ms / native_ms:>9.1f}x')
+
+    def measure(self, query, repository, iterations) -> float:
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            query(repository)
+            timings.append((time.perf_counter() - started) * 1000)
+        return median(timings)
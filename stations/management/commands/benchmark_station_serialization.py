@@ -0,0 +1,74 @@
+import json
+import random
+import time
+from statistics import median
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from common.renderers import ORJSONRenderer
+from stations import benchmark
+from stations.serializers import StationSerializer
+from stations.station_weather_serializers import StationListWeatherSerializer
+from weathers.serializers import WeatherSerializer
+
+
+def field_stations_response(snapshot) -> dict:
+    # the station list response built through the ModelSerializer field machinery, as before the fast path,
+    # with one child serializer for every station like StationListSerializer
+    child = StationSerializer()
+    return {
+        'at': snapshot['at'],
+        'stations': [serializers.ModelSerializer.to_representation(child, station)['document']
+                     for station in snapshot['stations']],
+        'weather': serializers.ModelSerializer.to_representation(WeatherSerializer(), snapshot['weather'])['document'],
+    }
+
+
+class Command(BaseCommand):
+    help = ('Compares the field-by-field serialization and JSONRenderer with the fast-path serializers '
+            'and ORJSONRenderer on a synthetic station list snapshot')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stations', type=int, default=200, help='Stations in the snapshot (default: 200)')
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options['stations'] < 1 or options['iterations'] < 1:
+            raise CommandError('--stations and --iterations must be positive')
+
+        rng = random.Random(0)
+        at = timezone.now().replace(microsecond=0)
+        snapshot = {
+            'at': at,
+            'stations': [{'kioskId': feature['properties']['kioskId'], 'at': at, 'document': feature}
+                         for feature in benchmark.features_of(options['stations'], rng)],
+            'weather': {'at': at, 'document': benchmark.weather_document(rng)},
+        }
+        json_renderer, orjson_renderer = JSONRenderer(), ORJSONRenderer()
+        if json.loads(json_renderer.render(field_stations_response(snapshot))) != json.loads(
+                orjson_renderer.render(StationListWeatherSerializer(snapshot).data)):
+            raise CommandError('The fast path renders a different response')
+
+        shapes = {
+            'serialize': (lambda: field_stations_response(snapshot),
+                          lambda: StationListWeatherSerializer(snapshot).data),
+            'serialize and render': (lambda: json_renderer.render(field_stations_response(snapshot)),
+                                     lambda: orjson_renderer.render(StationListWeatherSerializer(snapshot).data)),
+        }
+        self.stdout.write(f'{options["stations"]} stations, {options["iterations"]} iterations (median ms)')
+        self.stdout.write(f'{"step":<30}{"fields":>10}{"fast":>10}{"speedup":>10}')
+        for name, (before, after) in shapes.items():
+            before_ms = self.measure(before, options['iterations'])
+            after_ms = self.measure(after, options['iterations'])
+            self.stdout.write(f'{name:<30}{before_ms:>10.3f}{after_ms:>10.3f}{before_ms / after_ms:>9.1f}x')
+
+    def measure(self, build, iterations) -> float:
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            build()
+            timings.append((time.perf_counter() - started) * 1000)
+        return median(timings)
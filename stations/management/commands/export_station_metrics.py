@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from stations import export
+from stations.repositories import get_station_repository
+
+
+class Command(BaseCommand):
+    help = 'Exports numeric station properties over a time range as a NumPy .npz archive of typed columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the .npz file to write')
+        parser.add_argument('--from', dest='from_at', required=True, help='Start Datetime, inclusive')
+        parser.add_argument('--to', dest='to_at', required=True, help='End Datetime, inclusive')
+        parser.add_argument('--kioskId', type=int, help='Only this station (default: every station)')
+
+    def handle(self, *args, **options):
+        from_at, to_at = parse_datetime(options['from_at']), parse_datetime(options['to_at'])
+        if from_at is None or to_at is None:
+            raise CommandError('--from and --to must be datetimes (e.g. 2019-09-01T10:00:00)')
+        from_at, to_at = [timezone.make_aware(at) if timezone.is_naive(at) else at for at in (from_at, to_at)]
+
+        rows = get_station_repository().iter_station_properties(options['kioskId'], from_at, to_at, export.METRICS)
+        columns = export.collect_columns(rows)
+        with open(options['output'], 'wb') as f:
+            export.write_npz(columns, f)
+
+        self.stdout.write(self.style.SUCCESS(f"Exported {len(columns['at'])} rows to {options['output']}"))
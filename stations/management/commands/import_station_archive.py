@@ -0,0 +1,64 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common import mongo
+from stations import importer, indexes, timeline
+from stations.repositories import get_station_repository
+
+
+class Command(BaseCommand):
+    help = ('Imports archived Indego and OpenWeatherMap responses (stations/<at>.json and weathers/<at>.json '
+            'in a directory or a tarball). Ticks whose weather is already stored are skipped, '
+            'so an interrupted import resumes where it stopped.')
+
+    PROGRESS_INTERVAL = 10  # seconds
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Directory or tarball of the archive')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes parsing and validating the files (default: number of CPUs)')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Ticks per worker batch and per bulk insert (default: 20)')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['path']):
+            raise CommandError(f"{options['path']} does not exist")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        database = mongo.get_database()
+        # duplicates of already imported data are skipped by the unique indexes
+        indexes.ensure_indexes(database)
+        repository = get_station_repository()
+        archive = importer.Archive(options['path'], skip_ats=importer.imported_ats(database))
+
+        ticks = rows = rejected = 0
+        started_at = last_report = time.monotonic()
+        for parsed in importer.parse_in_parallel(importer.batched(archive, options['batch_size']),
+                                                 options['workers']):
+            valid = [tick for tick in parsed if tick[3] is None]
+            for at, _, _, error in parsed:
+                if error is not None:
+                    self.stderr.write(f'Rejected {at.isoformat()}: {error}')
+            rows += importer.write_ticks(database, repository, valid)
+            ticks += len(valid)
+            rejected += len(parsed) - len(valid)
+
+            if time.monotonic() - last_report >= self.PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                self.stdout.write(f'{ticks} ticks, {rows} rows ({self.rate(rows, started_at):.0f} rows/s)')
+
+        # the imported ticks can precede known ones, so every process reloads its timeline
+        if ticks:
+            timeline.bump_generation()
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {ticks} ticks and {rows} rows in {elapsed:.1f}s ({self.rate(rows, started_at):.0f} rows/s); '
+            f'{archive.skipped} already imported, {rejected} rejected, {archive.incomplete} incomplete'))
+
+    @staticmethod
+    def rate(rows, started_at) -> float:
+        return rows / max(time.monotonic() - started_at, 1e-9)
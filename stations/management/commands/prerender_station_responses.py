@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from common import mongo
+from stations import prerender
+from stations.models import RenderedSnapshot
+from weathers.models import Weather
+
+
+class Command(BaseCommand):
+    help = 'Renders GET response bodies for stored snapshots which have none yet'
+
+    def handle(self, *args, **options):
+        database = mongo.get_database()
+        rendered_ats = set(database[RenderedSnapshot._meta.db_table].distinct('at'))
+        database[RenderedSnapshot._meta.db_table].create_index('at', unique=True)
+
+        rendered = 0
+        for at in database[Weather._meta.db_table].distinct('at'):
+            if at in rendered_ats:
+                continue
+            if prerender.render_snapshot(mongo.from_mongo_datetime(at)) is not None:
+                rendered += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} snapshots'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from common import mongo
+from stations import rollups
+from stations.repositories import get_station_repository
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the hourly and daily station rollups from the whole station history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-ticks', type=int, default=100, help='Ingest ticks folded per bulk write')
+
+    def handle(self, *args, **options):
+        ticks = rollups.rebuild_rollups(mongo.get_database(), get_station_repository(), options['batch_ticks'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups from {ticks} ticks'))
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import ASCENDING
+
+from common import mongo
+from stations.indexes import ensure_indexes, missing_indexes
+from stations.models import Station
+from weathers.models import Weather
+
+
+class Command(BaseCommand):
+    help = 'Creates (or verifies) the MongoDB indexes used by the station endpoints and explains their queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only verify, fail when an index is missing')
+        parser.add_argument('--explain', action='store_true', help='Report the winning plan of each view query')
+
+    def handle(self, *args, **options):
+        database = mongo.get_database()
+
+        if options['check']:
+            missing = missing_indexes(database)
+            for collection_name, indexes in missing.items():
+                for index in indexes:
+                    self.stdout.write(self.style.ERROR(f'missing {collection_name}.{index.document["name"]}'))
+            if missing:
+                raise CommandError('Some indexes are missing, run `manage.py station_indexes`')
+            self.stdout.write(self.style.SUCCESS('All indexes exist'))
+        else:
+            created = ensure_indexes(database)
+            for collection_name, indexes in created.items():
+                for index in indexes:
+                    self.stdout.write(f'created {collection_name}.{index.document["name"]}')
+            self.stdout.write(self.style.SUCCESS('All indexes exist'))
+
+        if options['explain']:
+            self.explain(database)
+
+    def explain(self, database):
+        stations = database[Station._meta.db_table]
+        weathers = database[Weather._meta.db_table]
+        latest = stations.find_one({}, {'_id': 0, 'kioskId': 1, 'at': 1}, sort=[('at', -1)])
+        if latest is None:
+            raise CommandError('No stations stored yet, nothing to explain')
+        at, kioskId = latest['at'], latest['kioskId']
+
+        queries = {
+            'list: first snapshot on or after':
+                stations.find({'at': {'$gte': at}}, {'_id': 0, 'at': 1}).sort('at', ASCENDING).limit(1),
+            'list: all stations at a time':
+                stations.find({'at': at}, {'_id': 0, 'kioskId': 1, 'document': 1}),
+            'single: first station at on or after':
+                stations.find({'kioskId': kioskId, 'at': {'$gte': at}}, {'_id': 0, 'at': 1})
+                .sort('at', ASCENDING).limit(1),
+            'single: one kiosk on or after':
+                stations.find({'kioskId': kioskId, 'at': {'$gte': at}}, {'_id': 0, 'at': 1, 'document': 1})
+                .sort('at', ASCENDING).limit(1),
+            'weather at a time':
+                weathers.find({'at': at}, {'_id': 0, 'document': 1}).limit(1),
+        }
+        for name, cursor in queries.items():
+            explained = cursor.explain()
+            stats = explained.get('executionStats', {})
+            self.stdout.write(
+                f'{name}: {describe_plan(explained["queryPlanner"]["winningPlan"])} '
+                f'(keys examined: {stats.get("totalKeysExamined", "?")}, '
+                f'docs examined: {stats.get("totalDocsExamined", "?")})')
+
+
+def describe_plan(plan: dict) -> str:
+    # e.g. 'LIMIT <- PROJECTION_COVERED <- IXSCAN kioskId_at_unique'
+    stage = plan['stage']
+    if 'indexName' in plan:
+        stage = f'{stage} {plan["indexName"]}'
+    children = plan.get('inputStages') or ([plan['inputStage']] if 'inputStage' in plan else [])
+    if not children:
+        return stage
+    return ' <- '.join([stage] + [describe_plan(child) for child in children])
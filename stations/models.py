@@ -21,3 +21,109 @@ class Station(models.Model):
 
     def __str__(self):
         return f'Station[UUID:{self.uuid}] kioskId: {self.kioskId}, at:{self.at}'
+
+
+class StationSnapshot(models.Model):
+
+    class Meta:
+        db_table = 'station_snapshot'
+
+    uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    at = models.DateTimeField(db_index=True, unique=True)
+    # every station feature of one ingest tick, keyed by str(kioskId)
+    stations = models.JSONField()
+
+    def __str__(self):
+        return f'StationSnapshot[UUID:{self.uuid}] at:{self.at}'
+
+
+class RenderedSnapshot(models.Model):
+
+    class Meta:
+        db_table = 'rendered_snapshot'
+
+    uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    at = models.DateTimeField(db_index=True, unique=True)
+    # JSON response bodies rendered once at ingest time, those of single stations up to their weather
+    stations_response = models.TextField()
+    station_responses = models.JSONField()
+    weather_response = models.TextField(null=True)
+
+    def __str__(self):
+        return f'RenderedSnapshot[UUID:{self.uuid}] at:{self.at}'
+
+
+class Kiosk(models.Model):
+
+    class Meta:
+        db_table = 'kiosk'
+
+    uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # one document per version of the static part of a station document, see stations.normalized
+    digest = models.CharField(max_length=40, unique=True)
+    kioskId = models.IntegerField(db_index=True, null=True)
+    template = models.JSONField()
+
+    def __str__(self):
+        return f'Kiosk[UUID:{self.uuid}] kioskId: {self.kioskId}, digest:{self.digest}'
+
+
+class StationState(models.Model):
+
+    class Meta:
+        db_table = 'station_state'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kioskId', 'at'],
+                name='station_state_kioskId_at_unique'
+            ),
+        ]
+
+    uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kioskId = models.IntegerField(db_index=True)
+    at = models.DateTimeField(db_index=True)
+    # digest of the Kiosk template, None when the whole document is in `document`
+    kiosk = models.CharField(max_length=40, null=True)
+    values = models.JSONField(null=True)
+    bikes = models.JSONField(null=True)
+    rawBikes = models.JSONField(null=True)
+    document = models.JSONField(null=True)
+
+    def __str__(self):
+        return f'StationState[UUID:{self.uuid}] kioskId: {self.kioskId}, at:{self.at}'
+
+
+class StationTick(models.Model):
+
+    class Meta:
+        db_table = 'station_tick'
+
+    uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    at = models.DateTimeField(db_index=True, unique=True)
+    # a keyframe tick has a StationChange for every station, the others for changed stations only
+    keyframe = models.BooleanField()
+    # kioskIds of the previous tick missing from this one
+    removed = models.JSONField()
+
+    def __str__(self):
+        return f'StationTick[UUID:{self.uuid}] at:{self.at}'
+
+
+class StationChange(models.Model):
+
+    class Meta:
+        db_table = 'station_change'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kioskId', 'at'],
+                name='station_change_kioskId_at_unique'
+            ),
+        ]
+
+    uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kioskId = models.IntegerField(db_index=True)
+    at = models.DateTimeField(db_index=True)
+    document = models.JSONField()
+
+    def __str__(self):
+        return f'StationChange[UUID:{self.uuid}] kioskId: {self.kioskId}, at:{self.at}'
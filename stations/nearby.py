@@ -0,0 +1,104 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from math import asin, cos, degrees, radians, sin, sqrt
+
+EARTH_RADIUS = 6371008.8  # mean radius in metres
+MAX_INDEXES = 8
+
+
+class SpatialIndex:
+    """Located stations of one snapshot, sorted by latitude for radius queries.
+
+    A query scans the latitude band of the radius only, then filters it on the haversine distance.
+    Snapshots are immutable, so an index never needs updating once built.
+    """
+
+    def __init__(self, stations):
+        located = []
+        for station in stations:
+            coordinates = _coordinates(station['document'])
+            if coordinates is not None:
+                located.append((coordinates, station))
+        located.sort(key=lambda item: item[0][0])
+
+        self._lats = array('d', [lat for (lat, _), _ in located])
+        self._lons = array('d', [lon for (_, lon), _ in located])
+        self._stations = [station for _, station in located]
+
+    def __len__(self):
+        return len(self._stations)
+
+    def within(self, lat, lon, radius) -> list:
+        """(distance in metres, station) of the stations within `radius` metres, nearest first."""
+        delta = degrees(radius / EARTH_RADIUS)
+        start, end = bisect_left(self._lats, lat - delta), bisect_right(self._lats, lat + delta)
+
+        found = []
+        for index in range(start, end):
+            distance = haversine(lat, lon, self._lats[index], self._lons[index])
+            if distance <= radius:
+                found.append((distance, self._stations[index]))
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+def haversine(lat1, lon1, lat2, lon2) -> float:
+    a = sin(radians(lat2 - lat1) / 2) ** 2 \
+        + cos(radians(lat1)) * cos(radians(lat2)) * sin(radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(1.0, sqrt(a)))
+
+
+def _coordinates(document):
+    # GeoJSON Point coordinates are [longitude, latitude]
+    try:
+        lon, lat = document['geometry']['coordinates'][:2]
+        return float(lat), float(lon)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+_lock = threading.Lock()
+_indexes = OrderedDict()
+
+
+def get_index(repository, at) -> SpatialIndex:
+    # process-local, for the most recently queried snapshots of each storage mode
+    key = (type(repository).__name__, at)
+    with _lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+
+    index = SpatialIndex(repository.stations_at(at))
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def reset_indexes():
+    with _lock:
+        _indexes.clear()
+
+
+def nearby_stations(repository, at, lat, lon, radius, min_bikes=0, min_docks=0, limit=None) -> list:
+    """{'distance', 'station'} of the stations of snapshot `at` within `radius` metres, nearest first."""
+    found = []
+    for distance, station in get_index(repository, at).within(lat, lon, radius):
+        properties = station['document'].get('properties', {})
+        if _count(properties, 'bikesAvailable') < min_bikes or _count(properties, 'docksAvailable') < min_docks:
+            continue
+        found.append({'distance': distance, 'station': station})
+        if limit is not None and len(found) >= limit:
+            break
+    return found
+
+
+def _count(properties, name) -> int:
+    value = properties.get(name)
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return 0
+    return value
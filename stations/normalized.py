@@ -0,0 +1,84 @@
+import copy
+import hashlib
+import json
+
+# Normalized storage of station documents: the static part of a GeoJSON feature (name, address, coordinates...)
+# is stored once per version in `kiosk`, keyed by its digest, while `station_state` keeps the dynamic
+# properties of every tick. The template holds the dynamic keys too, with None values, so that a rebuilt
+# document has the same keys in the same order as the ingested one.
+DYNAMIC_PROPERTIES = [
+    'bikesAvailable', 'docksAvailable', 'classicBikesAvailable', 'smartBikesAvailable', 'electricBikesAvailable',
+    'rewardBikesAvailable', 'rewardDocksAvailable', 'trikesAvailable',
+    'kioskStatus', 'kioskPublicStatus', 'kioskConnectionStatus',
+]
+BIKES = 'bikes'
+# bikes are packed into lists of their values when they have exactly these keys, in this order
+BIKE_KEYS = ['dockNumber', 'isElectric', 'isAvailable', 'battery']
+
+
+def split(document) -> tuple:
+    """(template, digest, state) of a station document; the template is None when it has no properties."""
+    properties = document.get('properties')
+    if not isinstance(properties, dict):
+        return None, None, {'document': document}
+
+    template = dict(document)
+    template['properties'] = {key: None if key in DYNAMIC_PROPERTIES or key == BIKES else value
+                              for key, value in properties.items()}
+    state = {'values': {key: properties[key] for key in DYNAMIC_PROPERTIES if key in properties}}
+    if BIKES in properties:
+        bikes = properties[BIKES]
+        if isinstance(bikes, list) and all(isinstance(bike, dict) and list(bike) == BIKE_KEYS for bike in bikes):
+            state['bikes'] = [[bike[key] for key in BIKE_KEYS] for bike in bikes]
+        else:
+            state['rawBikes'] = bikes
+
+    return template, digest_of(template), state
+
+
+def rebuild(template, state) -> dict:
+    if template is None:
+        return state['document']
+
+    document = copy.deepcopy(template)
+    properties = document['properties']
+    properties.update(state.get('values', {}))
+    if 'bikes' in state:
+        properties[BIKES] = [dict(zip(BIKE_KEYS, bike)) for bike in state['bikes']]
+    elif 'rawBikes' in state:
+        properties[BIKES] = state['rawBikes']
+    return document
+
+
+def digest_of(template) -> str:
+    # key order is part of the digest, as it is part of the rebuilt document
+    return hashlib.sha1(json.dumps(template, ensure_ascii=False, separators=(',', ':')).encode()).hexdigest()
+
+
+def project(value, fields):
+    """`value` reduced to dotted `fields` the way a MongoDB find projection does, in document order."""
+    tree = {}
+    for field in fields:
+        *parents, name = field.split('.')
+        node = tree
+        for parent in parents:
+            node = node.setdefault(parent, {})
+            if node is True:
+                break
+        else:
+            node[name] = True
+    return _project(value, tree)
+
+
+def _project(value, tree):
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value if isinstance(item, (dict, list))]
+    projected = {}
+    for key, item in value.items():
+        if key not in tree:
+            continue
+        if tree[key] is True:
+            projected[key] = item
+        elif isinstance(item, (dict, list)):
+            projected[key] = _project(item, tree[key])
+    return projected
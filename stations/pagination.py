@@ -0,0 +1,27 @@
+import base64
+import binascii
+
+from rest_framework.utils.urls import replace_query_param
+
+from common import errors
+from .timeline import EPOCH, MILLISECOND, ceil_millis
+
+CURSOR_QUERY_PARAM = 'cursor'
+
+
+def encode_cursor(at) -> str:
+    # opaque keyset cursor: the inclusive lower bound of the next page
+    return base64.urlsafe_b64encode(str(ceil_millis(at)).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        return EPOCH + int(base64.urlsafe_b64decode(cursor.encode())) * MILLISECOND
+    except (binascii.Error, ValueError, OverflowError):
+        raise errors.InvalidCursorError()
+
+
+def next_link(request, next_from) -> str:
+    if next_from is None:
+        return None
+    return replace_query_param(request.build_absolute_uri(), CURSOR_QUERY_PARAM, encode_cursor(next_from))
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from common import mongo, renderers
+from .models import RenderedSnapshot
+from .repositories import get_station_repository
+from .station_weather_serializers import StationListWeatherSerializer, StationWeatherSerializer
+from weathers.serializers import WeatherSerializer
+
+
+# Per-station bodies are stored without the weather, shared by every station of a snapshot and rendered once:
+# each body ends right before the weather value, which is spliced in at read time.
+WEATHER_PLACEHOLDER = b'null}'
+
+
+def render_snapshot(at) -> RenderedSnapshot:
+    # renders exactly what the GET endpoints would, from what has been stored for `at`
+    repository = get_station_repository()
+    stations = list(repository.stations_at(at))
+    weather = repository.weather_at(at)
+    if not stations or weather is None:
+        return None
+
+    renderer = renderers.json_renderer()
+    stations_response = renderer.render(StationListWeatherSerializer({
+        'at': at,
+        'stations': stations,
+        'weather': weather,
+    }).data)
+    weather_response = renderer.render(WeatherSerializer(weather).data)
+    station_responses = {
+        str(station['kioskId']): renderer.render(StationWeatherSerializer({
+            'at': at,
+            'station': station,
+            'weather': None,
+        }).data)[:-len(WEATHER_PLACEHOLDER)].decode()
+        for station in stations
+    }
+
+    return RenderedSnapshot.objects.create(
+        at=at, stations_response=stations_response.decode(), station_responses=station_responses,
+        weather_response=weather_response.decode())
+
+
+def accepts_rendered_response(request) -> bool:
+    return settings.STATION_PRERENDERED_RESPONSES and request.accepted_media_type == JSONRenderer.media_type
+
+
+def rendered_stations_response(at) -> HttpResponse:
+    rendered = _collection().find_one(
+        {'at': mongo.to_mongo_datetime(at)}, {'_id': 0, 'stations_response': 1})
+    if rendered is None:
+        return None
+    return HttpResponse(rendered['stations_response'], content_type=JSONRenderer.media_type)
+
+
+def rendered_station_response(kioskId, at) -> HttpResponse:
+    key = f'station_responses.{kioskId}'
+    rendered = _collection().find_one({'at': mongo.to_mongo_datetime(at)}, {'_id': 0, key: 1, 'weather_response': 1})
+    if rendered is None or str(kioskId) not in rendered.get('station_responses', {}):
+        return None
+    body = rendered['station_responses'][str(kioskId)]
+    # whole bodies, with the weather, for snapshots rendered before it was shared
+    if rendered.get('weather_response') is not None:
+        body = body + rendered['weather_response'] + '}'
+    return HttpResponse(body, content_type=JSONRenderer.media_type)
+
+
+def _collection():
+    return mongo.get_database()[RenderedSnapshot._meta.db_table]
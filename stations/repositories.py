@@ -0,0 +1,757 @@
+import copy
+import threading
+import uuid
+
+from django.conf import settings
+
+from common import mongo
+from weathers.models import Weather
+from . import normalized
+from .models import Kiosk, Station, StationChange, StationSnapshot, StationState, StationTick
+
+# Reads return plain dicts: {'kioskId', 'at', 'document'} for stations and {'at', 'document'} for weather,
+# which StationSerializer and WeatherSerializer represent the same way as model instances.
+# `fields` are dotted paths within the station document (e.g. ['properties.kioskId']) which the reads
+# project in MongoDB; None reads whole documents.
+
+
+def document_projection(prefix: str, fields) -> dict:
+    if fields is None:
+        return {prefix: 1}
+    return {f'{prefix}.{field}': 1 for field in fields}
+
+
+class StationRowRepository:
+    """One `station` document per kioskId and ingest tick, read through the Django ORM."""
+
+    def all_ats(self):
+        return [mongo.from_mongo_datetime(at) for at in mongo.get_database()[Station._meta.db_table].distinct('at')]
+
+    def first_at(self, at):
+        return Station.objects.filter(at__gte=at).order_by('at').values_list('at', flat=True).first()
+
+    # Djongo cannot select parts of a JSONField, so projected reads go through pymongo
+
+    def stations_at(self, at, fields=None):
+        if fields is not None:
+            return StationMongoRowRepository().stations_at(at, fields)
+        return Station.objects.filter(at=at).values('kioskId', 'at', 'document')
+
+    def iter_stations_at(self, at, fields=None):
+        if fields is not None:
+            return StationMongoRowRepository().iter_stations_at(at, fields)
+        return Station.objects.filter(at=at).values('kioskId', 'at', 'document').iterator()
+
+    def stations_of(self, kioskIds, at, fields=None):
+        if fields is not None:
+            return StationMongoRowRepository().stations_of(kioskIds, at, fields)
+        return Station.objects.filter(kioskId__in=[int(kioskId) for kioskId in kioskIds], at=at) \
+            .values('kioskId', 'at', 'document')
+
+    def station_on_or_after(self, kioskId, at, fields=None):
+        if fields is not None:
+            return StationMongoRowRepository().station_on_or_after(kioskId, at, fields)
+        return Station.objects.filter(kioskId=kioskId, at__gte=at).order_by('at') \
+            .values('kioskId', 'at', 'document').first()
+
+    def first_station_at(self, kioskId, at):
+        return Station.objects.filter(kioskId=kioskId, at__gte=at).order_by('at').values_list('at', flat=True).first()
+
+    def station_history(self, kioskId, from_at, to_at):
+        return Station.objects.filter(kioskId=kioskId, at__gte=from_at, at__lte=to_at).order_by('at') \
+            .values('kioskId', 'at', 'document').iterator()
+
+    def iter_station_properties(self, kioskId, from_at, to_at, fields, batch_size=1000):
+        # (kioskId, at, properties) with only `fields` of the properties read from MongoDB
+        query = {'at': {'$gte': mongo.to_mongo_datetime(from_at), '$lte': mongo.to_mongo_datetime(to_at)}}
+        if kioskId is not None:
+            query['kioskId'] = int(kioskId)
+        cursor = mongo.get_database()[Station._meta.db_table].find(
+            query,
+            {'_id': 0, 'kioskId': 1, 'at': 1, **{f'document.properties.{field}': 1 for field in fields}},
+            sort=[('kioskId', 1), ('at', 1)], batch_size=batch_size)
+        for station in cursor:
+            yield (station['kioskId'], mongo.from_mongo_datetime(station['at']),
+                   station.get('document', {}).get('properties', {}))
+
+    def weather_at(self, at):
+        return Weather.objects.filter(at=at).values('at', 'document').first()
+
+    def weathers_at(self, ats):
+        return {weather['at']: weather for weather in Weather.objects.filter(at__in=ats).values('at', 'document')}
+
+    def existing_pairs(self, kioskIds, ats):
+        return Station.objects.filter(kioskId__in=kioskIds, at__in=ats).values_list('kioskId', 'at')
+
+    def create(self, validated_data):
+        return Station.objects.bulk_create([Station(**item) for item in validated_data])
+
+    def import_stations(self, validated_data):
+        # one unordered bulk insert, where pairs already stored are skipped by the kioskId_at_unique index
+        documents = [{'uuid': uuid.uuid4(), 'kioskId': item['kioskId'], 'at': mongo.to_mongo_datetime(item['at']),
+                      'document': item['document']}
+                     for item in validated_data]
+        inserted = mongo.insert_many_unordered(mongo.get_database()[Station._meta.db_table], documents)
+        return [{'kioskId': document['kioskId'], 'at': mongo.from_mongo_datetime(document['at']),
+                 'document': document['document']}
+                for document in inserted]
+
+    def delete_ticks(self, ats) -> int:
+        return mongo.get_database()[Station._meta.db_table].delete_many(
+            {'at': {'$in': [mongo.to_mongo_datetime(at) for at in ats]}}).deleted_count
+
+
+class MongoRepositoryMixin:
+
+    def __init__(self):
+        self.database = mongo.get_database()
+
+    def weather_at(self, at):
+        weather = self.database[Weather._meta.db_table].find_one(
+            {'at': mongo.to_mongo_datetime(at)}, {'_id': 0, 'document': 1})
+        if weather is None:
+            return None
+        return {'at': at, 'document': weather['document']}
+
+    def weathers_at(self, ats):
+        weathers = self.database[Weather._meta.db_table].find(
+            {'at': {'$in': [mongo.to_mongo_datetime(at) for at in ats]}}, {'_id': 0, 'at': 1, 'document': 1})
+        return {mongo.from_mongo_datetime(weather['at']): {'at': mongo.from_mongo_datetime(weather['at']),
+                                                           'document': weather['document']}
+                for weather in weathers}
+
+
+class StationMongoRowRepository(MongoRepositoryMixin, StationRowRepository):
+    """Same `station` documents as StationRowRepository, read with pymongo instead of Djongo."""
+
+    def __init__(self):
+        super().__init__()
+        self.collection = self.database[Station._meta.db_table]
+
+    def first_at(self, at):
+        station = self.collection.find_one(
+            {'at': {'$gte': mongo.to_mongo_datetime(at)}}, {'_id': 0, 'at': 1}, sort=[('at', 1)])
+        if station is None:
+            return None
+        return mongo.from_mongo_datetime(station['at'])
+
+    def stations_at(self, at, fields=None):
+        return [{'kioskId': station['kioskId'], 'at': at, 'document': station.get('document', {})}
+                for station in self.collection.find(
+                    {'at': mongo.to_mongo_datetime(at)},
+                    {'_id': 0, 'kioskId': 1, **document_projection('document', fields)})]
+
+    def iter_stations_at(self, at, fields=None):
+        cursor = self.collection.find(
+            {'at': mongo.to_mongo_datetime(at)},
+            {'_id': 0, 'kioskId': 1, **document_projection('document', fields)},
+            batch_size=100)
+        for station in cursor:
+            yield {'kioskId': station['kioskId'], 'at': at, 'document': station.get('document', {})}
+
+    def stations_of(self, kioskIds, at, fields=None):
+        return [{'kioskId': station['kioskId'], 'at': at, 'document': station.get('document', {})}
+                for station in self.collection.find(
+                    {'kioskId': {'$in': [int(kioskId) for kioskId in kioskIds]}, 'at': mongo.to_mongo_datetime(at)},
+                    {'_id': 0, 'kioskId': 1, **document_projection('document', fields)})]
+
+    def station_on_or_after(self, kioskId, at, fields=None):
+        station = self.collection.find_one(
+            {'kioskId': int(kioskId), 'at': {'$gte': mongo.to_mongo_datetime(at)}},
+            {'_id': 0, 'kioskId': 1, 'at': 1, **document_projection('document', fields)},
+            sort=[('at', 1)])
+        if station is None:
+            return None
+        return {'kioskId': station['kioskId'], 'at': mongo.from_mongo_datetime(station['at']),
+                'document': station.get('document', {})}
+
+    def station_history(self, kioskId, from_at, to_at):
+        cursor = self.collection.find(
+            {'kioskId': int(kioskId),
+             'at': {'$gte': mongo.to_mongo_datetime(from_at), '$lte': mongo.to_mongo_datetime(to_at)}},
+            {'_id': 0, 'kioskId': 1, 'at': 1, 'document': 1},
+            sort=[('at', 1)], batch_size=100)
+        for station in cursor:
+            station['at'] = mongo.from_mongo_datetime(station['at'])
+            yield station
+
+    def first_station_at(self, kioskId, at):
+        station = self.collection.find_one(
+            {'kioskId': int(kioskId), 'at': {'$gte': mongo.to_mongo_datetime(at)}},
+            {'_id': 0, 'at': 1},
+            sort=[('at', 1)])
+        if station is None:
+            return None
+        return mongo.from_mongo_datetime(station['at'])
+
+
+class StationSnapshotRepository(MongoRepositoryMixin):
+    """One `station_snapshot` document per ingest tick, holding every station keyed by kioskId."""
+
+    def __init__(self):
+        super().__init__()
+        self.collection = self.database[StationSnapshot._meta.db_table]
+
+    def all_ats(self):
+        return [mongo.from_mongo_datetime(at) for at in self.collection.distinct('at')]
+
+    def first_at(self, at):
+        snapshot = self.collection.find_one(
+            {'at': {'$gte': mongo.to_mongo_datetime(at)}}, {'_id': 0, 'at': 1}, sort=[('at', 1)])
+        if snapshot is None:
+            return None
+        return mongo.from_mongo_datetime(snapshot['at'])
+
+    def stations_at(self, at, fields=None):
+        if fields is None:
+            snapshot = self.collection.find_one({'at': mongo.to_mongo_datetime(at)}, {'_id': 0, 'stations': 1})
+        else:
+            # kioskIds are keys, which a find projection cannot address, so every station of the
+            # snapshot is projected by an aggregation instead
+            snapshot = next(self.collection.aggregate([
+                {'$match': {'at': mongo.to_mongo_datetime(at)}},
+                {'$project': {'_id': 0, 'stations': {'$arrayToObject': {'$map': {
+                    'input': {'$objectToArray': '$stations'},
+                    'as': 'station',
+                    'in': {'k': '$$station.k', 'v': _nested_projection('$$station.v', fields)},
+                }}}}},
+            ]), None)
+        if snapshot is None:
+            return []
+        return [{'kioskId': int(kioskId), 'at': at, 'document': document}
+                for kioskId, document in snapshot['stations'].items()]
+
+    def iter_stations_at(self, at, fields=None):
+        # the snapshot is a single document, which is loaded as a whole anyway
+        return iter(self.stations_at(at, fields))
+
+    def stations_of(self, kioskIds, at, fields=None):
+        # only the requested stations of the snapshot, addressed by their keys
+        projection = {'_id': 0}
+        for kioskId in kioskIds:
+            projection.update(document_projection(f'stations.{int(kioskId)}', fields))
+        snapshot = self.collection.find_one({'at': mongo.to_mongo_datetime(at)}, projection)
+        if snapshot is None:
+            return []
+        return [{'kioskId': int(kioskId), 'at': at, 'document': document}
+                for kioskId, document in snapshot.get('stations', {}).items()]
+
+    def station_on_or_after(self, kioskId, at, fields=None):
+        key = f'stations.{kioskId}'
+        snapshot = self.collection.find_one(
+            {'at': {'$gte': mongo.to_mongo_datetime(at)}, key: {'$exists': True}},
+            {'_id': 0, 'at': 1, **document_projection(key, fields)},
+            sort=[('at', 1)])
+        if snapshot is None:
+            return None
+        return {'kioskId': int(kioskId), 'at': mongo.from_mongo_datetime(snapshot['at']),
+                'document': snapshot.get('stations', {}).get(str(kioskId), {})}
+
+    def station_history(self, kioskId, from_at, to_at):
+        key = f'stations.{kioskId}'
+        cursor = self.collection.find(
+            {'at': {'$gte': mongo.to_mongo_datetime(from_at), '$lte': mongo.to_mongo_datetime(to_at)},
+             key: {'$exists': True}},
+            {'_id': 0, 'at': 1, key: 1},
+            sort=[('at', 1)], batch_size=100)
+        for snapshot in cursor:
+            yield {'kioskId': int(kioskId), 'at': mongo.from_mongo_datetime(snapshot['at']),
+                   'document': snapshot['stations'][str(kioskId)]}
+
+    def first_station_at(self, kioskId, at):
+        snapshot = self.collection.find_one(
+            {'at': {'$gte': mongo.to_mongo_datetime(at)}, f'stations.{kioskId}': {'$exists': True}},
+            {'_id': 0, 'at': 1},
+            sort=[('at', 1)])
+        if snapshot is None:
+            return None
+        return mongo.from_mongo_datetime(snapshot['at'])
+
+    def iter_station_properties(self, kioskId, from_at, to_at, fields, batch_size=10):
+        # whole snapshots are read unless kioskId narrows the projection down to one sub-document
+        query = {'at': {'$gte': mongo.to_mongo_datetime(from_at), '$lte': mongo.to_mongo_datetime(to_at)}}
+        projection = {'_id': 0, 'at': 1, 'stations': 1}
+        if kioskId is not None:
+            query[f'stations.{kioskId}'] = {'$exists': True}
+            projection = {'_id': 0, 'at': 1,
+                          **{f'stations.{kioskId}.properties.{field}': 1 for field in fields}}
+        cursor = self.collection.find(query, projection, sort=[('at', 1)], batch_size=batch_size)
+        for snapshot in cursor:
+            at = mongo.from_mongo_datetime(snapshot['at'])
+            for station_kioskId, document in snapshot['stations'].items():
+                yield int(station_kioskId), at, document.get('properties', {})
+
+    def existing_pairs(self, kioskIds, ats):
+        snapshots = self.collection.find(
+            {'at': {'$in': [mongo.to_mongo_datetime(at) for at in ats]}},
+            {'_id': 0, 'at': 1, **{f'stations.{kioskId}': 1 for kioskId in kioskIds}})
+        return [(int(kioskId), mongo.from_mongo_datetime(snapshot['at']))
+                for snapshot in snapshots for kioskId in snapshot.get('stations', {})]
+
+    def create(self, validated_data):
+        if not validated_data:
+            return []
+        snapshot = StationSnapshot.objects.create(
+            at=validated_data[0]['at'],
+            stations={str(item['kioskId']): item['document'] for item in validated_data})
+        return [Station(kioskId=int(kioskId), at=snapshot.at, document=document)
+                for kioskId, document in snapshot.stations.items()]
+
+    def import_stations(self, validated_data):
+        # one unordered bulk insert of a snapshot per tick, where ticks already stored are skipped
+        # by the at_unique index
+        stations = {}
+        for item in validated_data:
+            stations.setdefault(mongo.to_mongo_datetime(item['at']), {})[str(item['kioskId'])] = item['document']
+        inserted = mongo.insert_many_unordered(
+            self.collection,
+            [{'uuid': uuid.uuid4(), 'at': at, 'stations': documents} for at, documents in stations.items()])
+        return [{'kioskId': int(kioskId), 'at': mongo.from_mongo_datetime(snapshot['at']), 'document': document}
+                for snapshot in inserted for kioskId, document in snapshot['stations'].items()]
+
+    def delete_ticks(self, ats) -> int:
+        return self.collection.delete_many({'at': {'$in': [mongo.to_mongo_datetime(at) for at in ats]}}).deleted_count
+
+
+class StationNormalizedRepository(MongoRepositoryMixin):
+    """Static kiosk metadata in `kiosk`, once per version, and the dynamic properties of every tick in `station_state`.
+
+    Documents are rebuilt from both, identical to the ingested ones.
+    """
+
+    STATE_FIELDS = {'_id': 0, 'kioskId': 1, 'at': 1, 'kiosk': 1, 'values': 1, 'bikes': 1, 'rawBikes': 1,
+                    'document': 1}
+
+    # digest -> template, shared by the instances as the template of a digest never changes
+    _templates = {}
+    _lock = threading.Lock()
+
+    def __init__(self):
+        super().__init__()
+        self.collection = self.database[StationState._meta.db_table]
+        self.kiosks = self.database[Kiosk._meta.db_table]
+
+    def all_ats(self):
+        return [mongo.from_mongo_datetime(at) for at in self.collection.distinct('at')]
+
+    def first_at(self, at):
+        state = self.collection.find_one(
+            {'at': {'$gte': mongo.to_mongo_datetime(at)}}, {'_id': 0, 'at': 1}, sort=[('at', 1)])
+        if state is None:
+            return None
+        return mongo.from_mongo_datetime(state['at'])
+
+    def stations_at(self, at, fields=None):
+        return self._rebuild(list(self.collection.find({'at': mongo.to_mongo_datetime(at)}, self.STATE_FIELDS)),
+                             fields)
+
+    def iter_stations_at(self, at, fields=None):
+        cursor = self.collection.find({'at': mongo.to_mongo_datetime(at)}, self.STATE_FIELDS, batch_size=100)
+        for states in _batches(cursor, 100):
+            yield from self._rebuild(states, fields)
+
+    def stations_of(self, kioskIds, at, fields=None):
+        return self._rebuild(list(self.collection.find(
+            {'kioskId': {'$in': [int(kioskId) for kioskId in kioskIds]}, 'at': mongo.to_mongo_datetime(at)},
+            self.STATE_FIELDS)), fields)
+
+    def station_on_or_after(self, kioskId, at, fields=None):
+        state = self.collection.find_one(
+            {'kioskId': int(kioskId), 'at': {'$gte': mongo.to_mongo_datetime(at)}}, self.STATE_FIELDS,
+            sort=[('at', 1)])
+        if state is None:
+            return None
+        return self._rebuild([state], fields)[0]
+
+    def first_station_at(self, kioskId, at):
+        state = self.collection.find_one(
+            {'kioskId': int(kioskId), 'at': {'$gte': mongo.to_mongo_datetime(at)}}, {'_id': 0, 'at': 1},
+            sort=[('at', 1)])
+        if state is None:
+            return None
+        return mongo.from_mongo_datetime(state['at'])
+
+    def station_history(self, kioskId, from_at, to_at):
+        cursor = self.collection.find(
+            {'kioskId': int(kioskId),
+             'at': {'$gte': mongo.to_mongo_datetime(from_at), '$lte': mongo.to_mongo_datetime(to_at)}},
+            self.STATE_FIELDS, sort=[('at', 1)], batch_size=100)
+        for states in _batches(cursor, 100):
+            yield from self._rebuild(states)
+
+    def iter_station_properties(self, kioskId, from_at, to_at, fields, batch_size=1000):
+        query = {'at': {'$gte': mongo.to_mongo_datetime(from_at), '$lte': mongo.to_mongo_datetime(to_at)}}
+        if kioskId is not None:
+            query['kioskId'] = int(kioskId)
+        cursor = self.collection.find(query, {'_id': 0, 'kioskId': 1, 'at': 1, 'kiosk': 1, 'values': 1,
+                                              'document.properties': 1},
+                                      sort=[('kioskId', 1), ('at', 1)], batch_size=batch_size)
+        for states in _batches(cursor, batch_size):
+            templates = self._templates_of(states)
+            for state in states:
+                if state.get('kiosk') is None:
+                    properties = state.get('document', {}).get('properties', {})
+                else:
+                    properties = {**templates[state['kiosk']]['properties'], **state.get('values', {})}
+                yield (state['kioskId'], mongo.from_mongo_datetime(state['at']),
+                       {field: properties.get(field) for field in fields})
+
+    def existing_pairs(self, kioskIds, ats):
+        states = self.collection.find(
+            {'kioskId': {'$in': [int(kioskId) for kioskId in kioskIds]},
+             'at': {'$in': [mongo.to_mongo_datetime(at) for at in ats]}},
+            {'_id': 0, 'kioskId': 1, 'at': 1})
+        return [(state['kioskId'], mongo.from_mongo_datetime(state['at'])) for state in states]
+
+    def create(self, validated_data):
+        self.import_stations(validated_data)
+        return [Station(**item) for item in validated_data]
+
+    def import_stations(self, validated_data):
+        # templates are only written when they change, and the states with one unordered bulk insert,
+        # where pairs already stored are skipped by the kioskId_at_unique index
+        states, templates = [], {}
+        for item in validated_data:
+            template, digest, state = normalized.split(item['document'])
+            if template is not None:
+                templates[digest] = {'uuid': uuid.uuid4(), 'digest': digest, 'kioskId': item['kioskId'],
+                                     'template': template}
+            states.append({'uuid': uuid.uuid4(), 'kioskId': item['kioskId'],
+                           'at': mongo.to_mongo_datetime(item['at']), 'kiosk': digest, **state})
+
+        stored = {kiosk['digest']
+                  for kiosk in self.kiosks.find({'digest': {'$in': list(templates)}}, {'_id': 0, 'digest': 1})}
+        mongo.insert_many_unordered(self.kiosks, [kiosk for digest, kiosk in templates.items() if digest not in stored])
+        with self._lock:
+            self._templates.update({digest: kiosk['template'] for digest, kiosk in templates.items()})
+        inserted = mongo.insert_many_unordered(self.collection, states)
+        return [{'kioskId': state['kioskId'], 'at': mongo.from_mongo_datetime(state['at']),
+                 'document': normalized.rebuild(self._templates.get(state['kiosk']), state)}
+                for state in inserted]
+
+    def delete_ticks(self, ats) -> int:
+        # templates are kept, as they are shared with the remaining ticks
+        return self.collection.delete_many({'at': {'$in': [mongo.to_mongo_datetime(at) for at in ats]}}).deleted_count
+
+    def _rebuild(self, states, fields=None) -> list:
+        templates = self._templates_of(states)
+        stations = []
+        for state in states:
+            document = normalized.rebuild(templates.get(state.get('kiosk')), state)
+            if fields is not None:
+                # projected after the rebuild, as documents do not exist as such in MongoDB
+                document = normalized.project(document, fields)
+            stations.append({'kioskId': state['kioskId'], 'at': mongo.from_mongo_datetime(state['at']),
+                             'document': document})
+        return stations
+
+    def _templates_of(self, states) -> dict:
+        digests = {state['kiosk'] for state in states if state.get('kiosk') is not None}
+        missing = digests - self._templates.keys()
+        if missing:
+            kiosks = self.kiosks.find({'digest': {'$in': list(missing)}}, {'_id': 0, 'digest': 1, 'template': 1})
+            with self._lock:
+                self._templates.update({kiosk['digest']: kiosk['template'] for kiosk in kiosks})
+        return self._templates
+
+
+class StationDeltaRepository(MongoRepositoryMixin):
+    """A `station_tick` marker per ingest tick and a `station_change` document per station changed since the previous.
+
+    Every STATION_DELTA_KEYFRAME_INTERVAL ticks, a keyframe tick stores every station, so that a snapshot is
+    rebuilt from the changes since the last keyframe. Markers are written after the changes and only changes
+    of a marked tick are read, so a tick interrupted before its marker is ignored.
+    A tick older than the latest one (an archive import, a concurrent ingest) is inserted in between,
+    turning the tick after it into a keyframe first.
+    """
+
+    # (at, {kioskId: document}, ticks since keyframe) of the latest tick written by this process
+    _latest = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        super().__init__()
+        self.ticks = self.database[StationTick._meta.db_table]
+        self.collection = self.database[StationChange._meta.db_table]
+
+    def all_ats(self):
+        return [mongo.from_mongo_datetime(at) for at in self.ticks.distinct('at')]
+
+    def first_at(self, at):
+        tick = self.ticks.find_one({'at': {'$gte': mongo.to_mongo_datetime(at)}}, {'_id': 0, 'at': 1}, sort=[('at', 1)])
+        if tick is None:
+            return None
+        return mongo.from_mongo_datetime(tick['at'])
+
+    def stations_at(self, at, fields=None):
+        for tick_at, stations in self._iter_snapshots(at, at, fields=fields):
+            return [{'kioskId': kioskId, 'at': tick_at, 'document': document} for kioskId, document in stations.items()]
+        return []
+
+    def iter_stations_at(self, at, fields=None):
+        # changes since the keyframe are folded into one snapshot anyway
+        return iter(self.stations_at(at, fields))
+
+    def stations_of(self, kioskIds, at, fields=None):
+        kioskIds = [int(kioskId) for kioskId in kioskIds]
+        for tick_at, stations in self._iter_snapshots(at, at, {'$in': kioskIds}, fields):
+            return [{'kioskId': kioskId, 'at': tick_at, 'document': stations[kioskId]}
+                    for kioskId in kioskIds if kioskId in stations]
+        return []
+
+    def station_on_or_after(self, kioskId, at, fields=None):
+        station_at = self.first_station_at(kioskId, at)
+        if station_at is None:
+            return None
+        for tick_at, stations in self._iter_snapshots(station_at, station_at, int(kioskId), fields):
+            if int(kioskId) in stations:
+                return {'kioskId': int(kioskId), 'at': tick_at, 'document': stations[int(kioskId)]}
+        return None
+
+    def first_station_at(self, kioskId, at):
+        # the first tick on or after `at` when the station is present, i.e. changed since its last removal,
+        # or else the next tick changing it
+        first_at = self.first_at(at)
+        if first_at is None:
+            return None
+        first_at = mongo.to_mongo_datetime(first_at)
+        last_change = self.collection.find_one(
+            {'kioskId': int(kioskId), 'at': {'$lte': first_at}}, {'_id': 0, 'at': 1}, sort=[('at', -1)])
+        last_removal = self.ticks.find_one(
+            {'removed': int(kioskId), 'at': {'$lte': first_at}}, {'_id': 0, 'at': 1}, sort=[('at', -1)])
+        if last_change is not None and (last_removal is None or last_change['at'] > last_removal['at']):
+            return mongo.from_mongo_datetime(first_at)
+
+        next_change = self.collection.find_one(
+            {'kioskId': int(kioskId), 'at': {'$gt': first_at}}, {'_id': 0, 'at': 1}, sort=[('at', 1)])
+        if next_change is None:
+            return None
+        return mongo.from_mongo_datetime(next_change['at'])
+
+    def station_history(self, kioskId, from_at, to_at):
+        for tick_at, stations in self._iter_snapshots(from_at, to_at, int(kioskId)):
+            if int(kioskId) in stations:
+                yield {'kioskId': int(kioskId), 'at': tick_at, 'document': stations[int(kioskId)]}
+
+    def iter_station_properties(self, kioskId, from_at, to_at, fields, batch_size=1000):
+        kioskId = None if kioskId is None else int(kioskId)
+        for tick_at, stations in self._iter_snapshots(from_at, to_at, kioskId,
+                                                      [f'properties.{field}' for field in fields]):
+            for station_kioskId, document in stations.items():
+                yield station_kioskId, tick_at, document.get('properties', {})
+
+    def existing_pairs(self, kioskIds, ats):
+        ticks = self.ticks.find({'at': {'$in': [mongo.to_mongo_datetime(at) for at in ats]}}, {'_id': 0, 'at': 1})
+        return [(station['kioskId'], station['at'])
+                for tick in ticks for station in self.stations_at(mongo.from_mongo_datetime(tick['at']))
+                if station['kioskId'] in kioskIds]
+
+    def create(self, validated_data):
+        self.import_stations(validated_data)
+        return [Station(**item) for item in validated_data]
+
+    def import_stations(self, validated_data):
+        """Writes the ticks of `validated_data`, skipping those already stored.
+
+        Ticks after the latest one are appended, older ones inserted in between.
+        Returns every station of the written ticks.
+        """
+        ticks = {}
+        for item in validated_data:
+            ticks.setdefault(mongo.to_mongo_datetime(item['at']), {})[int(item['kioskId'])] = item['document']
+
+        appended = []
+        with self._lock:
+            inserted = None
+            for at in sorted(ticks):
+                if self.ticks.count_documents({'at': at}, limit=1):
+                    continue
+                latest = self.ticks.find_one({}, {'_id': 0, 'at': 1}, sort=[('at', -1)])
+                if latest is None or at > latest['at']:
+                    self._append_tick(at, ticks[at])
+                else:
+                    inserted = self._insert_tick(at, ticks[at], inserted)
+                appended += [{'kioskId': kioskId, 'at': mongo.from_mongo_datetime(at), 'document': document}
+                             for kioskId, document in ticks[at].items()]
+        return appended
+
+    def delete_ticks(self, ats) -> int:
+        """Deletes ticks, turning the first remaining tick after each deleted one into a keyframe first.
+
+        The changes of that tick are relative to the deleted ones, so its whole snapshot is stored before,
+        and so are its removals, relative to the last remaining tick before, for `first_station_at`.
+        """
+        ats = sorted(mongo.to_mongo_datetime(at) for at in ats)
+        if not ats:
+            return 0
+        deleted = set(ats)
+        projection = {'_id': 0, 'at': 1, 'keyframe': 1}
+        previous_tick = self.ticks.find_one({'at': {'$lt': ats[0]}}, projection, sort=[('at', -1)])
+        next_tick = self.ticks.find_one({'at': {'$gt': ats[-1]}}, projection, sort=[('at', 1)])
+        ticks = [previous_tick] if previous_tick is not None else []
+        ticks += list(self.ticks.find({'at': {'$gte': ats[0], '$lte': ats[-1]}}, projection, sort=[('at', 1)]))
+        ticks += [next_tick] if next_tick is not None else []
+
+        kept_at = None
+        for previous, tick in zip([None] + ticks, ticks):
+            if tick['at'] in deleted:
+                continue
+            if previous is not None and previous['at'] in deleted:
+                stations = self._documents_at(tick['at'])
+                kept = set() if kept_at is None else set(self._documents_at(kept_at))
+                self._make_keyframe(tick, stations, kept - stations.keys())
+            kept_at = tick['at']
+
+        # markers first, so that the changes of a tick are never read without it
+        self.ticks.delete_many({'at': {'$in': ats}})
+        return self.collection.delete_many({'at': {'$in': ats}}).deleted_count
+
+    def _append_tick(self, at, stations: dict):
+        latest_at, previous, since_keyframe = self._latest_tick()
+        keyframe = latest_at is None or since_keyframe + 1 >= settings.STATION_DELTA_KEYFRAME_INTERVAL
+        self._write_tick(at, stations, previous, keyframe)
+        # copied, as the caller's documents could be modified afterwards
+        StationDeltaRepository._latest = (at, copy.deepcopy(stations), 0 if keyframe else since_keyframe + 1)
+
+    def _insert_tick(self, at, stations: dict, inserted=None) -> tuple:
+        """Writes a tick before the latest one, after turning the next tick into a keyframe.
+
+        The next tick is made self-contained before this one is marked, so that its snapshot never depends
+        on whether this one is read. `inserted` is what the previous call returned, which saves rebuilding
+        the previous tick when a batch of consecutive ticks is inserted. Returns (at, stations, ticks since
+        keyframe) of this tick.
+        """
+        previous = self.ticks.find_one({'at': {'$lt': at}}, {'_id': 0, 'at': 1}, sort=[('at', -1)])
+        if previous is None:
+            previous_stations, since_keyframe = {}, None
+        elif inserted is not None and inserted[0] == previous['at']:
+            _, previous_stations, since_keyframe = inserted
+        else:
+            previous_stations = self._documents_at(previous['at'])
+            keyframe = self.ticks.find_one({'keyframe': True, 'at': {'$lte': previous['at']}}, {'_id': 0, 'at': 1},
+                                           sort=[('at', -1)])
+            since_keyframe = self.ticks.count_documents({'at': {'$gt': keyframe['at'], '$lte': previous['at']}})
+
+        next_tick = self.ticks.find_one({'at': {'$gt': at}}, {'_id': 0, 'at': 1, 'keyframe': 1}, sort=[('at', 1)])
+        next_stations = self._documents_at(next_tick['at'])
+        self._make_keyframe(next_tick, next_stations, stations.keys() - next_stations.keys())
+
+        keyframe = since_keyframe is None or since_keyframe + 1 >= settings.STATION_DELTA_KEYFRAME_INTERVAL
+        self._write_tick(at, stations, previous_stations, keyframe)
+        # the next tick may be the latest one, now a keyframe
+        StationDeltaRepository._latest = None
+        return at, copy.deepcopy(stations), 0 if keyframe else since_keyframe + 1
+
+    def _write_tick(self, at, stations: dict, previous: dict, keyframe: bool):
+        changed = stations if keyframe else {kioskId: document for kioskId, document in stations.items()
+                                             if previous.get(kioskId) != document}
+        mongo.insert_many_unordered(
+            self.collection,
+            [{'uuid': uuid.uuid4(), 'kioskId': kioskId, 'at': at, 'document': document}
+             for kioskId, document in changed.items()])
+        self.ticks.insert_one({'uuid': uuid.uuid4(), 'at': at, 'keyframe': keyframe,
+                               'removed': sorted(previous.keys() - stations.keys())})
+
+    def _make_keyframe(self, tick, stations: dict, removed):
+        """Stores the whole snapshot of `tick`, whose changes are relative to a tick about to be deleted or inserted.
+
+        Its removals are replaced by `removed`, relative to the tick that will precede it, for `first_station_at`.
+        """
+        update = {'removed': sorted(removed)}
+        if not tick['keyframe']:
+            # its own changes are already stored, and skipped as duplicates
+            mongo.insert_many_unordered(
+                self.collection,
+                [{'uuid': uuid.uuid4(), 'kioskId': kioskId, 'at': tick['at'], 'document': document}
+                 for kioskId, document in stations.items()])
+            update['keyframe'] = True
+        self.ticks.update_one({'at': tick['at']}, {'$set': update})
+
+    def _documents_at(self, at) -> dict:
+        return {station['kioskId']: station['document'] for station in self.stations_at(mongo.from_mongo_datetime(at))}
+
+    def _latest_tick(self) -> tuple:
+        latest = self.ticks.find_one({}, {'_id': 0, 'at': 1}, sort=[('at', -1)])
+        if latest is None:
+            return None, {}, 0
+        if self._latest is not None and self._latest[0] == latest['at']:
+            return self._latest
+
+        # written by another process
+        keyframe = self.ticks.find_one({'keyframe': True, 'at': {'$lte': latest['at']}}, {'_id': 0, 'at': 1},
+                                       sort=[('at', -1)])
+        since_keyframe = self.ticks.count_documents({'at': {'$gt': keyframe['at'], '$lte': latest['at']}})
+        stations = {station['kioskId']: station['document']
+                    for station in self.stations_at(mongo.from_mongo_datetime(latest['at']))}
+        return latest['at'], stations, since_keyframe
+
+    def _iter_snapshots(self, from_at, to_at, kioskId=None, fields=None):
+        """(at, {kioskId: document}) of every tick between from_at and to_at (of `kioskId` only, a query operator too).
+
+        Starts from the last keyframe on or before from_at and folds the removals and changes of each tick.
+        The dict is updated in place from one tick to the next.
+        """
+        from_at, to_at = mongo.to_mongo_datetime(from_at), mongo.to_mongo_datetime(to_at)
+        keyframe = self.ticks.find_one({'keyframe': True, 'at': {'$lte': from_at}}, {'_id': 0, 'at': 1},
+                                       sort=[('at', -1)])
+        start_at = from_at if keyframe is None else keyframe['at']
+
+        ticks = self.ticks.find({'at': {'$gte': start_at, '$lte': to_at}},
+                                {'_id': 0, 'at': 1, 'keyframe': 1, 'removed': 1},
+                                sort=[('at', 1)])
+        query = {'at': {'$gte': start_at, '$lte': to_at}}
+        if kioskId is not None:
+            query['kioskId'] = kioskId
+        changes = self.collection.find(query,
+                                       {'_id': 0, 'kioskId': 1, 'at': 1, **document_projection('document', fields)},
+                                       sort=[('at', 1)], batch_size=1000)
+        change = next(changes, None)
+
+        stations = {}
+        for tick in ticks:
+            if tick['keyframe']:
+                stations = {}
+            for removed in tick['removed']:
+                stations.pop(removed, None)
+            # changes of an interrupted tick, without a marker, are skipped
+            while change is not None and change['at'] <= tick['at']:
+                if change['at'] == tick['at']:
+                    stations[change['kioskId']] = change.get('document', {})
+                change = next(changes, None)
+            if tick['at'] >= from_at:
+                yield mongo.from_mongo_datetime(tick['at']), stations
+
+
+def _batches(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _nested_projection(variable: str, fields) -> dict:
+    # {'properties': {'kioskId': '$$station.v.properties.kioskId'}} for ['properties.kioskId']
+    expression = {}
+    for field in fields:
+        *parents, name = field.split('.')
+        node = expression
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[name] = f'{variable}.{field}'
+    return expression
+
+
+def get_station_repository():
+    if settings.STATION_STORAGE_MODE == 'snapshot':
+        return StationSnapshotRepository()
+    if settings.STATION_STORAGE_MODE == 'normalized':
+        return StationNormalizedRepository()
+    if settings.STATION_STORAGE_MODE == 'delta':
+        return StationDeltaRepository()
+    if settings.STATION_READ_BACKEND == 'pymongo':
+        return StationMongoRowRepository()
+    return StationRowRepository()
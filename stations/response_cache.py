@@ -0,0 +1,171 @@
+import gzip
+import hashlib
+from datetime import timedelta
+
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from . import retention
+from .repositories import get_station_repository
+
+KEY_PREFIX = 'station_response'
+HITS_KEY = f'{KEY_PREFIX}:hits'
+MISSES_KEY = f'{KEY_PREFIX}:misses'
+
+# Cached bodies are compressed in an encoding the first time it is negotiated, at moderate levels as it happens
+# on the request path, and the variant is cached next to the plain body. In order of preference when equally
+# acceptable.
+COMPRESSORS = {
+    'br': lambda content: brotli.compress(content, quality=5),
+    'gzip': lambda content: gzip.compress(content, compresslevel=6, mtime=0),
+}
+MIN_COMPRESSED_SIZE = 1024
+
+
+def cacheable(request) -> bool:
+    # JSON is the same for every token, while the browsable API renders the user into the page
+    return request.accepted_renderer.format == 'json'
+
+
+def make_key(request, at, kioskId=None, fields=None) -> str:
+    # snapshots are immutable and JSON responses are shared by every token, so only the endpoint, the resolved
+    # snapshot, the kioskId(s), the projected fields and the negotiated media type make a difference
+    media_type = request.accepted_media_type.replace(' ', '')
+    return f'{KEY_PREFIX}:{request.path}:{media_type}:{at.isoformat()}:{kioskId or ""}:{",".join(fields or [])}'
+
+
+def get_or_build(request, key: str, build, at=None):
+    """Cached response for `key`, or the response from `build()` which is cached once rendered.
+
+    Called by the views after permission checks, so authentication is never bypassed.
+    Responses of other renderers than JSON are built for every request.
+    The body is sent in the encoding negotiated with Accept-Encoding.
+    Given the resolved snapshot `at`, the response carries validators derived from the key and
+    If-None-Match/If-Modified-Since are answered with a 304, before the cache is even looked up.
+    """
+    if not cacheable(request):
+        return build()
+
+    encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    etag = make_etag(key, encoding) if at is not None else None
+    if etag is not None:
+        conditional = get_conditional_response(request, etag=etag, last_modified=int(at.timestamp()))
+        if conditional is not None:
+            _set_validators(conditional, etag, at)
+            return conditional
+
+    cached = cache.get(key)
+    if cached is not None:
+        _count(HITS_KEY)
+        content, content_type, encoded = cached
+        if encoding is not None and encoding not in encoded:
+            encoded = {**encoded, encoding: compress(content, encoding)}
+            cache.set(key, (content, content_type, encoded), settings.STATION_RESPONSE_CACHE_TIMEOUT)
+        response = HttpResponse(content, content_type=content_type)
+        _encode(response, encoding, encoded)
+        response['X-Cache'] = 'HIT'
+        if etag is not None:
+            _set_validators(response, etag, at)
+        return response
+
+    _count(MISSES_KEY)
+    response = build()
+    response['X-Cache'] = 'MISS'
+    if etag is not None and response.status_code == 200:
+        _set_validators(response, etag, at)
+
+    def store(response):
+        # streamed bodies are never held in memory as a whole, so they are neither cached nor compressed
+        if response.status_code == 200 and not response.streaming:
+            encoded = {} if encoding is None else {encoding: compress(response.content, encoding)}
+            cache.set(key, (response.content, response['Content-Type'], encoded),
+                      settings.STATION_RESPONSE_CACHE_TIMEOUT)
+            _encode(response, encoding, encoded)
+
+    if hasattr(response, 'add_post_render_callback') and not response.is_rendered:
+        response.add_post_render_callback(store)
+    else:
+        store(response)
+    return response
+
+
+def make_etag(key: str, encoding) -> str:
+    # strong, as the bytes of a key and encoding never change: a resolved snapshot is immutable
+    return '"' + hashlib.sha1(f'{key}:{encoding or "identity"}'.encode()).hexdigest() + '"'
+
+
+def _set_validators(response, etag: str, at):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(at.timestamp())
+    # private, as a token is required. Until retention has thinned its bucket to it, or once the horizon is
+    # near, the URL of a snapshot can resolve to another one within max-age, so it is revalidated on every use.
+    max_age = settings.STATION_SNAPSHOT_MAX_AGE
+    if retention.settled(get_station_repository(), at, timezone.now(),
+                         full_resolution=timedelta(days=settings.STATION_RETENTION_FULL_DAYS),
+                         step=timedelta(minutes=settings.STATION_RETENTION_DOWNSAMPLE_MINUTES),
+                         horizon=timedelta(days=settings.STATION_RETENTION_HORIZON_DAYS),
+                         max_age=timedelta(seconds=max_age)):
+        response['Cache-Control'] = f'private, max-age={max_age}, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    """`content` in `encoding`, or None when not worth sending instead."""
+    if len(content) < MIN_COMPRESSED_SIZE:
+        return None
+    encoded = COMPRESSORS[encoding](content)
+    return encoded if len(encoded) < len(content) else None
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """Most acceptable of COMPRESSORS for an Accept-Encoding header, or None for the identity."""
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        qvalue = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[coding.strip().lower()] = qvalue
+
+    def qvalue_of(encoding):
+        return qvalues.get(encoding, qvalues.get('*', 0.0))
+
+    # max() keeps the first of equally acceptable encodings
+    encoding = max(COMPRESSORS, key=qvalue_of)
+    if qvalue_of(encoding) <= 0:
+        return None
+    return encoding
+
+
+def _encode(response, encoding, encoded: dict):
+    patch_vary_headers(response, ('Accept-Encoding', ))
+    if encoded.get(encoding) is not None:
+        response.content = encoded[encoding]
+        response['Content-Encoding'] = encoding
+
+
+def stats() -> dict:
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    return {'hits': hits, 'misses': misses}
+
+
+def _count(key: str):
+    if cache.add(key, 1, timeout=None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:  # evicted in between
+        cache.add(key, 1, timeout=None)
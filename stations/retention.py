@@ -0,0 +1,86 @@
+import time
+from datetime import timedelta
+
+from common import mongo
+from weathers.models import Weather
+from . import timeline
+from .importer import batched
+from .models import RenderedSnapshot
+
+# Tiered retention of snapshots:
+#   newer than `full_resolution`  every tick is kept
+#   older, up to `horizon`        the last tick of every `step` bucket is kept
+#   older than `horizon`          nothing is kept
+# The last tick is kept as `at` resolves on or after, so that a time inside a bucket still resolves to a snapshot
+# of that bucket, at most `step` later. Buckets are aligned on the epoch and only downsampled once wholly older
+# than `full_resolution`, so that a run keeps the ticks an earlier run kept and a later run deletes nothing more
+# until ticks age into the next tier.
+# Rollups are kept whatever the age of the ticks they were computed from, so
+# `manage.py rebuild_station_rollups` would lose the deleted ticks.
+
+
+def plan(ats, now, full_resolution: timedelta, step: timedelta, horizon: timedelta) -> list:
+    """Sorted ticks of `ats` to delete at `now`."""
+    horizon_from = now - horizon
+    deleted, buckets = [], {}
+    for at in sorted(ats):
+        if at < horizon_from:
+            deleted.append(at)
+        elif downsampled(at, now, full_resolution, step):
+            buckets.setdefault((at - timeline.EPOCH) // step, []).append(at)
+    for bucket_ats in buckets.values():
+        deleted += bucket_ats[:-1]
+    return sorted(deleted)
+
+
+def downsampled(at, now, full_resolution: timedelta, step: timedelta) -> bool:
+    """Whether the bucket of `at` is wholly older than `full_resolution` at `now`, so left alone up to the horizon."""
+    return bucket_of(at, step)[1] <= now - full_resolution
+
+
+def bucket_of(at, step: timedelta) -> tuple:
+    start = timeline.EPOCH + (at - timeline.EPOCH) // step * step
+    return start, start + step
+
+
+def settled(repository, at, now, full_resolution, step, horizon, max_age) -> bool:
+    """Whether the snapshot `at` is kept by retention for at least `max_age` from `now`.
+
+    That is, its bucket is downsampled and retention has already thinned it to `at` alone, and it is not
+    within `max_age` of the horizon.
+    """
+    if at < now - horizon + max_age or not downsampled(at, now, full_resolution, step):
+        return False
+    start, end = bucket_of(at, step)
+    return timeline.get_index(repository).count(repository, start, end) == 1
+
+
+def expired_ats(repository, database, now, full_resolution, step, horizon) -> list:
+    ats = set(repository.all_ats())
+    ats.update(mongo.from_mongo_datetime(at) for at in database[Weather._meta.db_table].distinct('at'))
+    return plan(ats, now, full_resolution, step, horizon)
+
+
+def delete_ats(repository, database, ats, batch_size: int, pause: float = 0):
+    """Deletes the stations, weather and prerendered responses of `ats` in batches, `pause` seconds apart.
+
+    Yields the number of ticks deleted so far after each batch. The ticks are first excluded from the
+    timeline and deleted only once every process has had a generation check, so that none keeps
+    resolving requests to deleted snapshots.
+    """
+    if not ats:
+        return
+    timeline.exclude_ats(ats)
+    time.sleep(timeline.GENERATION_CHECK_INTERVAL)
+
+    deleted = 0
+    for index, batch in enumerate(batched(ats, batch_size)):
+        if index and pause:
+            time.sleep(pause)
+        mongo_ats = [mongo.to_mongo_datetime(at) for at in batch]
+        repository.delete_ticks(batch)
+        database[Weather._meta.db_table].delete_many({'at': {'$in': mongo_ats}})
+        database[RenderedSnapshot._meta.db_table].delete_many({'at': {'$in': mongo_ats}})
+        timeline.release_ats(batch)
+        deleted += len(batch)
+        yield deleted
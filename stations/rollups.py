@@ -0,0 +1,84 @@
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from common import mongo
+
+# Per kiosk and per hour/day availability summaries, kept up to date by every ingest so that
+# aggregate reads cost one document per bucket instead of one decoded `station` document per tick.
+METRICS = ['bikesAvailable', 'docksAvailable', 'electricBikesAvailable']
+GRANULARITIES = {
+    'hour': ('station_rollup_hourly', lambda at: at.replace(minute=0, second=0, microsecond=0)),
+    'day': ('station_rollup_daily', lambda at: at.replace(hour=0, minute=0, second=0, microsecond=0)),
+}
+
+
+def bucket_of(granularity: str, at):
+    _, truncate = GRANULARITIES[granularity]
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+    return truncate(at.astimezone(timezone.utc))
+
+
+def update_rollups(database, stations):
+    """Folds stations ({'kioskId', 'at', 'document'}) into the rollups with one bulk write per granularity."""
+    for granularity, (collection_name, _) in GRANULARITIES.items():
+        operations = [_update_operation(granularity, station) for station in stations]
+        operations = [operation for operation in operations if operation is not None]
+        if operations:
+            database[collection_name].bulk_write(operations, ordered=False)
+
+
+def _update_operation(granularity: str, station):
+    properties = station['document'].get('properties', {})
+    update = {'$min': {}, '$max': {}, '$inc': {}}
+    for metric in METRICS:
+        value = properties.get(metric)
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        update['$min'][f'{metric}.min'] = value
+        update['$max'][f'{metric}.max'] = value
+        update['$inc'][f'{metric}.sum'] = value
+        update['$inc'][f'{metric}.count'] = 1
+    if not update['$inc']:
+        return None
+
+    bucket = mongo.to_mongo_datetime(bucket_of(granularity, station['at']))
+    return UpdateOne({'kioskId': int(station['kioskId']), 'bucket': bucket}, update, upsert=True)
+
+
+def find_rollups(database, granularity: str, kioskId, from_at, to_at) -> list:
+    collection_name, _ = GRANULARITIES[granularity]
+    rollups = database[collection_name].find(
+        {'kioskId': int(kioskId),
+         'bucket': {'$gte': mongo.to_mongo_datetime(bucket_of(granularity, from_at)),
+                    '$lte': mongo.to_mongo_datetime(to_at)}},
+        {'_id': 0},
+        sort=[('bucket', 1)])
+    return [_summary(rollup) for rollup in rollups]
+
+
+def _summary(rollup) -> dict:
+    summary = {'kioskId': rollup['kioskId'], 'bucket': mongo.from_mongo_datetime(rollup['bucket'])}
+    for metric in METRICS:
+        values = rollup.get(metric)
+        if values is None:
+            summary[metric] = None
+            continue
+        summary[metric] = {
+            'min': values['min'],
+            'max': values['max'],
+            'mean': values['sum'] / values['count'],
+            'count': values['count'],
+        }
+    return summary
+
+
+def rebuild_rollups(database, repository, batch_ticks: int = 100) -> int:
+    for collection_name, _ in GRANULARITIES.values():
+        database[collection_name].delete_many({})
+
+    ticks = sorted(repository.all_ats())
+    for start in range(0, len(ticks), batch_ticks):
+        stations = [station for at in ticks[start:start + batch_ticks] for station in repository.stations_at(at)]
+        update_rollups(database, stations)
+    return len(ticks)
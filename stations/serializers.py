@@ -1,9 +1,13 @@
+from django.utils import timezone
 from rest_framework import serializers, validators
+from rest_framework.settings import api_settings
 
+from common.serializers import DocumentSerializerMixin
 from .models import Station
+from .repositories import get_station_repository
 
 
-class StationSerializer(serializers.ModelSerializer):
+class StationSerializer(DocumentSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Station
@@ -21,14 +25,77 @@ class StationSerializer(serializers.ModelSerializer):
 
     document = serializers.DictField()
 
-    def to_representation(self, instance):
-        return super().to_representation(instance)['document']
-
 
 class StationListSerializer(serializers.ListSerializer):
 
-    child = StationSerializer()
+    # (kioskId, at) uniqueness is checked with one query for the whole batch in to_internal_value,
+    # instead of one UniqueTogetherValidator query per child
+    child = StationSerializer(validators=[])
+
+    def to_internal_value(self, data):
+        validated_data = super().to_internal_value(data)
+
+        message = validators.UniqueTogetherValidator.message.format(field_names='kioskId, at')
+        duplicated_indexes = self.find_duplicated_indexes(validated_data)
+        if duplicated_indexes:
+            raise serializers.ValidationError([
+                {api_settings.NON_FIELD_ERRORS_KEY: [message]} if index in duplicated_indexes else {}
+                for index in range(len(validated_data))
+            ], code='unique')
+
+        return validated_data
+
+    def find_duplicated_indexes(self, validated_data) -> set:
+        pairs = [(item['kioskId'], as_aware(item['at'])) for item in validated_data]
+        if not pairs:
+            return set()
+
+        existing_pairs = get_station_repository().existing_pairs(
+            {kioskId for kioskId, _ in pairs}, {at for _, at in pairs})
+        seen = {(kioskId, as_aware(at)) for kioskId, at in existing_pairs}
+
+        duplicated_indexes = set()
+        for index, pair in enumerate(pairs):
+            if pair in seen:
+                duplicated_indexes.add(index)
+            seen.add(pair)
+        return duplicated_indexes
 
     def create(self, validated_data):
-        books = [Station(**item) for item in validated_data]
-        return Station.objects.bulk_create(books)
+        return get_station_repository().create(validated_data)
+
+
+class MetricSummarySerializer(serializers.Serializer):
+
+    min = serializers.FloatField()
+    max = serializers.FloatField()
+    mean = serializers.FloatField()
+    count = serializers.IntegerField()
+
+
+class StationRollupSerializer(serializers.Serializer):
+
+    kioskId = serializers.IntegerField()
+    bucket = serializers.DateTimeField()
+    bikesAvailable = MetricSummarySerializer(allow_null=True)
+    docksAvailable = MetricSummarySerializer(allow_null=True)
+    electricBikesAvailable = MetricSummarySerializer(allow_null=True)
+
+
+class NearbyStationSerializer(serializers.Serializer):
+
+    distance = serializers.FloatField(help_text='Metres from the requested location')
+    station = StationSerializer()
+
+
+class StationNearbySerializer(serializers.Serializer):
+
+    at = serializers.DateTimeField()
+    stations = NearbyStationSerializer(many=True)
+
+
+def as_aware(value):
+    # Djongo hands back naive UTC datetimes while validated data is aware
+    if timezone.is_naive(value):
+        return timezone.make_aware(value, timezone.utc)
+    return value
@@ -2,7 +2,8 @@ from rest_framework import serializers
 from drf_spectacular.utils import extend_schema_field
 from drf_spectacular.types import OpenApiTypes
 
-from stations.serializers import StationSerializer, StationListSerializer
+from common import errors
+from stations.serializers import StationSerializer
 from weathers.serializers import WeatherSerializer
 
 
@@ -21,13 +22,13 @@ class StationListWeatherSerializer(serializers.Serializer):
 
     @extend_schema_field(serializers.ListField(child=serializers.DictField()))
     def get_stations(self, obj):
-        serializer = StationListSerializer(instance=obj['stations'])
-        return serializer.data
+        # one child for the whole snapshot, instead of a ListSerializer copying it
+        serializer = StationSerializer()
+        return [serializer.to_representation(station) for station in obj['stations']]
 
     @extend_schema_field(serializers.DictField())
     def get_weather(self, obj):
-        serializer = WeatherSerializer(instance=obj['weather'])
-        return serializer.data
+        return WeatherSerializer().to_representation(obj['weather'])
 
 
 class StationWeatherSerializer(serializers.Serializer):
@@ -45,10 +46,46 @@ class StationWeatherSerializer(serializers.Serializer):
 
     @extend_schema_field(serializers.DictField())
     def get_station(self, obj):
-        serializer = StationSerializer(instance=obj['station'])
-        return serializer.data
+        return StationSerializer().to_representation(obj['station'])
+
+    @extend_schema_field(serializers.DictField(allow_null=True))
+    def get_weather(self, obj):
+        # can be missing for a point of a station history
+        if obj['weather'] is None:
+            return None
+        return WeatherSerializer().to_representation(obj['weather'])
+
+
+class StationBatchWeatherSerializer(serializers.Serializer):
+
+    class Meta:
+        fields = ['at', 'stations', 'weather']
+
+    at = serializers.SerializerMethodField()
+    stations = serializers.SerializerMethodField()
+    weather = serializers.SerializerMethodField()
+
+    @extend_schema_field(OpenApiTypes.DATETIME)
+    def get_at(self, obj):
+        return obj['at']
+
+    @extend_schema_field(serializers.DictField(child=serializers.DictField()))
+    def get_stations(self, obj):
+        # kioskId -> station document, or the error body of a single station request for a missing one
+        serializer = StationSerializer()
+        return {str(kioskId): errors.StationNotFoundError().detail if station is None
+                else serializer.to_representation(station)
+                for kioskId, station in obj['stations'].items()}
 
     @extend_schema_field(serializers.DictField())
     def get_weather(self, obj):
-        serializer = WeatherSerializer(instance=obj['weather'])
-        return serializer.data
+        return WeatherSerializer().to_representation(obj['weather'])
+
+
+class StationHistorySerializer(serializers.Serializer):
+
+    class Meta:
+        fields = ['next', 'results']
+
+    next = serializers.URLField(allow_null=True)
+    results = StationWeatherSerializer(many=True)
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from common import renderers
+
+CHUNK_SIZE = 64 * 1024
+
+
+def accepts_streaming_response(request) -> bool:
+    return settings.STATION_LIST_STREAMING and request.accepted_media_type == JSONRenderer.media_type
+
+
+def station_list_response(at, stations, weather) -> StreamingHttpResponse:
+    """Streams the StationListWeatherSerializer output, encoding stations one by one.
+
+    The bytes are the same as the configured JSON renderer's; only one chunk is held in memory at a time.
+    """
+    return StreamingHttpResponse(_iter_station_list(at, stations, weather, renderers.json_renderer()),
+                                 content_type=JSONRenderer.media_type)
+
+
+def _iter_station_list(at, stations, weather, renderer):
+    buffer = [b'{"at":', renderer.render(at), b',"stations":[']
+    size = 0
+    for index, station in enumerate(stations):
+        if index:
+            buffer.append(b',')
+        encoded = renderer.render(station['document'])
+        buffer.append(encoded)
+        size += len(encoded)
+        if size >= CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    buffer += [b'],"weather":', renderer.render(weather['document']), b'}']
+    yield b''.join(buffer)
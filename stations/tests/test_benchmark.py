@@ -0,0 +1,57 @@
+import random
+from datetime import datetime, timedelta
+from dateutil import tz
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from .. import benchmark, timeline
+from ..models import Station
+
+
+class TestSummaries(TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 95), 95)
+        self.assertEqual(benchmark.percentile([7], 99), 7)
+        self.assertIsNone(benchmark.percentile([], 50))
+
+    def test_summarize(self):
+        summary = benchmark.summarize([3.0, 1.0, 2.0], [2, 4, 3], errors=1, duration=0.5)
+        self.assertEqual(summary['requests'], 3)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['throughput_rps'], 6)
+        self.assertEqual(summary['latency_ms'], {'p50': 2.0, 'p95': 3.0, 'p99': 3.0, 'mean': 2.0, 'max': 3.0})
+        self.assertEqual(summary['queries_per_request'], {'mean': 3, 'max': 4})
+
+    def test_compare(self):
+        def results(p95, rps):
+            return {'endpoints': {'list': {'latency_ms': {'p95': p95}, 'throughput_rps': rps}}}
+        rows = benchmark.compare(results(12.0, 90.0), results(10.0, 100.0), threshold=10)
+        self.assertEqual([(metric, round(change), regressed) for _, metric, _, _, change, regressed in rows],
+                         [('p95 ms', 20, True), ('rps', -10, False)])
+
+
+@override_settings(STATION_PRERENDERED_RESPONSES=False)
+class TestBenchmark(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+
+    def test_seed_and_benchmark(self):
+        rng = random.Random(0)
+        end = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        ats = benchmark.seed(5, 3, end, timedelta(minutes=5), rng)
+        self.assertEqual(ats, [end - timedelta(minutes=10), end - timedelta(minutes=5), end])
+        self.assertEqual(Station.objects.count(), 15)
+
+        results = benchmark.benchmark(ats, list(range(3000, 3005)), requests=4, concurrency=1, warmup=1, rng=rng,
+                                      counter=benchmark.QueryCounter())
+        self.assertEqual(list(results), benchmark.ENDPOINTS)
+        for result in results.values():
+            self.assertEqual(result['requests'], 4)
+            self.assertEqual(result['errors'], 0)
+        self.assertEqual(Station.objects.count(), 15 + 5 * 5)
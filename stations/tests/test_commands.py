@@ -0,0 +1,62 @@
+import json
+from datetime import datetime
+from dateutil import tz
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import RenderedSnapshot, Station, StationSnapshot
+from weathers.models import Weather
+
+
+class TestBackfillStationSnapshots(TestCase):
+
+    def setUp(self):
+        self.at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        self.later_at = datetime(2021, 6, 25, 21, 0, 0, tzinfo=tz.tzutc())
+        Station.objects.create(kioskId=3000, at=self.at, document={'kioskId': 3000})
+        Station.objects.create(kioskId=3001, at=self.at, document={'kioskId': 3001})
+        Station.objects.create(kioskId=3000, at=self.later_at, document={'kioskId': 3000})
+
+    def test_backfill(self):
+        call_command('backfill_station_snapshots', stdout=StringIO())
+        self.assertEqual(StationSnapshot.objects.count(), 2)
+        self.assertEqual(StationSnapshot.objects.get(at=self.at).stations,
+                         {'3000': {'kioskId': 3000}, '3001': {'kioskId': 3001}})
+        self.assertEqual(StationSnapshot.objects.get(at=self.later_at).stations, {'3000': {'kioskId': 3000}})
+        self.assertEqual(Station.objects.count(), 3)
+
+    def test_backfill_is_resumable(self):
+        call_command('backfill_station_snapshots', stdout=StringIO())
+        call_command('backfill_station_snapshots', stdout=StringIO())
+        self.assertEqual(StationSnapshot.objects.count(), 2)
+
+    def test_backfill_delete_rows(self):
+        call_command('backfill_station_snapshots', '--delete-rows', stdout=StringIO())
+        self.assertEqual(StationSnapshot.objects.count(), 2)
+        self.assertEqual(Station.objects.count(), 0)
+
+
+class TestPrerenderStationResponses(TestCase):
+
+    def setUp(self):
+        self.at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        Station.objects.create(kioskId=3000, at=self.at, document={'kioskId': 3000})
+        Station.objects.create(kioskId=3001, at=self.at, document={'kioskId': 3001})
+        Weather.objects.create(at=self.at, document={'dummy': 'document'})
+        Weather.objects.create(at=datetime(2021, 6, 25, 21, 0, 0, tzinfo=tz.tzutc()), document={'dummy': 'document'})
+
+    def test_prerender(self):
+        call_command('prerender_station_responses', stdout=StringIO())
+        self.assertEqual(RenderedSnapshot.objects.count(), 1)
+        rendered = RenderedSnapshot.objects.first()
+        self.assertEqual(rendered.at, self.at)
+        self.assertEqual(json.loads(rendered.stations_response)['stations'], [{'kioskId': 3000}, {'kioskId': 3001}])
+        self.assertEqual(json.loads(rendered.station_responses['3001'] + rendered.weather_response + '}'),
+                         {'at': '2021-06-25T20:00:00Z', 'station': {'kioskId': 3001}, 'weather': {'dummy': 'document'}})
+
+    def test_prerender_is_resumable(self):
+        call_command('prerender_station_responses', stdout=StringIO())
+        call_command('prerender_station_responses', stdout=StringIO())
+        self.assertEqual(RenderedSnapshot.objects.count(), 1)
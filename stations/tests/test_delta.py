@@ -0,0 +1,179 @@
+import copy
+import json
+from datetime import datetime, timedelta
+from dateutil import tz
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from common import mongo
+from weathers.models import Weather
+from .. import timeline
+from ..models import Station, StationChange, StationTick
+from ..repositories import StationDeltaRepository
+
+AT = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+
+
+def load_features():
+    with open('stations/tests/indego_sample.json') as f:
+        return json.load(f)['features']
+
+
+def tick_data(at, features):
+    return [{'kioskId': feature['properties']['kioskId'], 'at': at, 'document': feature} for feature in features]
+
+
+@override_settings(STATION_DELTA_KEYFRAME_INTERVAL=3)
+class TestStationDeltaRepository(TestCase):
+
+    def setUp(self):
+        StationDeltaRepository._latest = None
+        self.repository = StationDeltaRepository()
+        # 6 ticks: 3004 changes at 1, 3006 is removed at 2 and back at 4, a keyframe every 3 ticks
+        features = load_features()
+        self.ticks = []
+        for index in range(6):
+            at = AT + timedelta(minutes=5 * index)
+            if index == 1:
+                features[0]['properties']['bikesAvailable'] += 1
+            present = [feature for feature in features
+                       if index not in (2, 3) or feature['properties']['kioskId'] != 3006]
+            self.ticks.append((at, copy.deepcopy(present)))
+            self.repository.create(tick_data(at, present))
+
+    def documents_at(self, at):
+        return {station['kioskId']: station['document'] for station in self.repository.stations_at(at)}
+
+    def test_stations_at(self):
+        for at, features in self.ticks:
+            self.assertEqual(self.documents_at(at), {feature['properties']['kioskId']: feature for feature in features})
+        self.assertEqual(self.repository.stations_at(AT + timedelta(minutes=1)), [])
+
+    def test_stores_changes_only(self):
+        # keyframes at 0 and 3 (two stations), 3004 at 1, 3006 back at 4
+        self.assertEqual(StationChange.objects.count(), 3 + 1 + 2 + 1)
+        self.assertEqual([tick.keyframe for tick in StationTick.objects.order_by('at')],
+                         [True, False, False, True, False, False])
+        self.assertEqual(StationTick.objects.get(at=self.ticks[2][0]).removed, [3006])
+
+    def test_station_on_or_after(self):
+        station = self.repository.station_on_or_after(3006, self.ticks[2][0])
+        self.assertEqual(station['at'], self.ticks[4][0])
+        self.assertEqual(station['document'], self.ticks[4][1][2])
+        station = self.repository.station_on_or_after(3004, self.ticks[2][0] - timedelta(seconds=1))
+        self.assertEqual(station['at'], self.ticks[2][0])
+        self.assertEqual(station['document']['properties']['bikesAvailable'], 2)
+        self.assertIsNone(self.repository.station_on_or_after(3006, self.ticks[5][0] + timedelta(seconds=1)))
+        self.assertIsNone(self.repository.station_on_or_after(9999, AT))
+
+    def test_station_history(self):
+        history = list(self.repository.station_history(3006, AT, self.ticks[5][0]))
+        self.assertEqual([station['at'] for station in history],
+                         [self.ticks[index][0] for index in (0, 1, 4, 5)])
+
+    def test_iter_station_properties(self):
+        rows = list(self.repository.iter_station_properties(3004, AT, self.ticks[2][0], ['bikesAvailable']))
+        self.assertEqual(rows, [(3004, at, {'bikesAvailable': bikes})
+                                for (at, _), bikes in zip(self.ticks, [1, 2, 2])])
+
+    def test_existing_pairs(self):
+        self.assertEqual(sorted(self.repository.existing_pairs({3004, 3006}, {self.ticks[2][0]})),
+                         [(3004, self.ticks[2][0])])
+
+    def test_append_after_another_process(self):
+        StationDeltaRepository._latest = None
+        at = AT + timedelta(minutes=30)
+        self.repository.create(tick_data(at, self.ticks[5][1]))
+        self.assertEqual(StationChange.objects.filter(at=at).count(), 3)  # keyframe
+        self.assertEqual(self.documents_at(at), self.documents_at(self.ticks[5][0]))
+
+    def test_interrupted_tick_ignored(self):
+        at = AT + timedelta(minutes=28)
+        mongo.get_database()[StationChange._meta.db_table].insert_one(
+            {'kioskId': 3004, 'at': mongo.to_mongo_datetime(at), 'document': {'dummy': 'document'}})
+        StationDeltaRepository._latest = None
+        self.repository.create(tick_data(AT + timedelta(minutes=30), self.ticks[5][1]))
+        self.assertEqual(self.documents_at(AT + timedelta(minutes=30))[3004], self.ticks[5][1][0])
+
+    def test_skips_stored_ticks(self):
+        self.assertEqual(self.repository.import_stations(tick_data(AT, self.ticks[0][1])), [])
+
+    def test_inserts_earlier_ticks(self):
+        # between ticks 1 and 2, without 3005, then before the first one
+        features = copy.deepcopy(self.ticks[1][1])
+        features[0]['properties']['bikesAvailable'] += 5
+        between = [feature for feature in features if feature['properties']['kioskId'] != 3005]
+        between_at = self.ticks[1][0] + timedelta(minutes=1)
+        self.repository.create(tick_data(between_at, between))
+        self.repository.create(tick_data(AT - timedelta(minutes=5), self.ticks[0][1]))
+
+        for at, features in self.ticks + [(between_at, between), (AT - timedelta(minutes=5), self.ticks[0][1])]:
+            self.assertEqual(self.documents_at(at), {feature['properties']['kioskId']: feature for feature in features})
+        self.assertEqual(StationTick.objects.get(at=between_at).removed, [3005])
+        self.assertEqual(StationTick.objects.get(at=self.ticks[2][0]).removed, [3006])
+        self.assertEqual(self.repository.first_station_at(3005, between_at), self.ticks[2][0])
+        self.assertEqual(self.repository.station_on_or_after(3006, between_at)['at'], between_at)
+
+    def test_appends_after_inserted_ticks(self):
+        self.repository.create(tick_data(AT - timedelta(minutes=5), self.ticks[0][1]))
+        at = self.ticks[5][0] + timedelta(minutes=5)
+        self.repository.create(tick_data(at, self.ticks[0][1]))
+        self.assertEqual(self.documents_at(at), {feature['properties']['kioskId']: feature
+                                                 for feature in self.ticks[0][1]})
+
+    def test_delete_ticks(self):
+        self.repository.delete_ticks([self.ticks[1][0], self.ticks[4][0]])
+        self.assertEqual([tick.keyframe for tick in StationTick.objects.order_by('at')], [True, True, True, True])
+        for index in (0, 2, 3, 5):
+            at, features = self.ticks[index]
+            self.assertEqual(self.documents_at(at), {feature['properties']['kioskId']: feature for feature in features})
+        self.assertFalse(StationChange.objects.filter(at__in=[self.ticks[1][0], self.ticks[4][0]]).exists())
+
+    def test_delete_ticks_before_keyframe(self):
+        self.repository.delete_ticks([self.ticks[1][0], self.ticks[2][0]])
+        self.assertEqual([tick.keyframe for tick in StationTick.objects.order_by('at')], [True, True, False, False])
+        self.assertEqual(self.documents_at(self.ticks[4][0]),
+                         {feature['properties']['kioskId']: feature for feature in self.ticks[4][1]})
+
+    def test_delete_removal_tick_before_keyframe(self):
+        self.repository.delete_ticks([self.ticks[2][0]])
+        self.assertEqual(StationTick.objects.get(at=self.ticks[3][0]).removed, [3006])
+        station = self.repository.station_on_or_after(3006, self.ticks[1][0] + timedelta(seconds=1))
+        self.assertEqual(station['at'], self.ticks[4][0])
+
+
+class TestDeltaStorage(APITestCase):
+
+    URL = '/api/v1/stations/'
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        StationDeltaRepository._latest = None
+        user = User.objects.create_user('test', 'test@example.com', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+    def get(self, url):
+        cache.clear()
+        with override_settings(STATION_PRERENDERED_RESPONSES=False):
+            return self.client.get(url, format='json')
+
+    def test_responses_identical_to_row_storage(self):
+        features = load_features()
+        for feature in features:
+            Station.objects.create(kioskId=feature['properties']['kioskId'], at=AT, document=feature)
+        StationDeltaRepository().create(tick_data(AT, features))
+        Weather.objects.create(at=AT, document={'dummy': 'document'})
+
+        for url in [f'{self.URL}?at=2021-06-25T04:00:00', f'{self.URL}3005?at=2021-06-25T04:00:00',
+                    f'{self.URL}?at=2021-06-25T04:00:00&fields=properties.kioskId',
+                    f'{self.URL}3005/history?from=2021-06-25T00:00:00&to=2021-06-26T00:00:00']:
+            row = self.get(url)
+            with override_settings(STATION_STORAGE_MODE='delta'):
+                delta = self.get(url)
+            self.assertEqual(delta.status_code, 200)
+            self.assertEqual(delta.content, row.content)
@@ -0,0 +1,137 @@
+import ast
+import io
+import os
+import tempfile
+import zipfile
+from array import array
+from datetime import datetime
+from dateutil import tz
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from .. import export
+from ..models import Station, StationSnapshot
+
+
+def read_npz(content: bytes) -> dict:
+    # minimal .npy reader, so that the tests do not depend on NumPy
+    columns = {}
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        for name in archive.namelist():
+            data = archive.read(name)
+            assert data[:8] == b'\x93NUMPY\x01\x00'
+            header_length = int.from_bytes(data[8:10], 'little')
+            header = ast.literal_eval(data[10:10 + header_length].decode('latin1'))
+            values = array('q' if header['descr'] == '<M8[ms]' else 'i', data[10 + header_length:])
+            assert len(values) == header['shape'][0]
+            columns[name[:-len('.npy')]] = (header['descr'], values.tolist())
+    return columns
+
+
+def add_stations(at, stations):
+    for kioskId, bikes, docks in stations:
+        Station.objects.create(kioskId=kioskId, at=at,
+                               document={'properties': {'kioskId': kioskId, 'bikesAvailable': bikes,
+                                                        'docksAvailable': docks}})
+
+
+AT1 = datetime(2021, 6, 25, 20, 0, tzinfo=tz.tzutc())
+AT2 = datetime(2021, 6, 25, 20, 30, tzinfo=tz.tzutc())
+MILLIS1 = 1624651200000
+
+
+class TestExport(TestCase):
+
+    def test_write_npz(self):
+        columns = export.collect_columns([
+            (3000, AT1, {'bikesAvailable': 1, 'docksAvailable': 9, 'electricBikesAvailable': 0}),
+            (3001, AT1, {'bikesAvailable': 5, 'docksAvailable': None}),
+        ])
+        f = io.BytesIO()
+        export.write_npz(columns, f)
+
+        columns = read_npz(f.getvalue())
+        self.assertEqual(set(columns), {'at', 'kioskId', 'bikesAvailable', 'docksAvailable', 'electricBikesAvailable'})
+        self.assertEqual(columns['at'], ('<M8[ms]', [MILLIS1, MILLIS1]))
+        self.assertEqual(columns['kioskId'], ('<i4', [3000, 3001]))
+        self.assertEqual(columns['bikesAvailable'], ('<i4', [1, 5]))
+        self.assertEqual(columns['docksAvailable'], ('<i4', [9, export.MISSING]))
+        self.assertEqual(columns['electricBikesAvailable'], ('<i4', [0, export.MISSING]))
+
+    def test_npy_header_aligned(self):
+        for length in [0, 1, 10 ** 9]:
+            self.assertEqual(len(export._npy_header('<i4', length)) % 64, 0)
+
+    def test_export_station_metrics_command(self):
+        add_stations(AT1, [(3000, 1, 9), (3001, 5, 5)])
+        add_stations(AT2, [(3000, 2, 8)])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stations.npz')
+            out = StringIO()
+            call_command('export_station_metrics', path, '--from', '2021-06-25T20:00:00', '--to',
+                         '2021-06-25T20:10:00', stdout=out)
+            with open(path, 'rb') as f:
+                columns = read_npz(f.read())
+
+        self.assertIn('Exported 2 rows', out.getvalue())
+        self.assertEqual(columns['kioskId'][1], [3000, 3001])
+        self.assertEqual(columns['bikesAvailable'][1], [1, 5])
+
+
+class TestStationExportAPIView(APITestCase):
+
+    URL = '/api/v1/stations-export'
+
+    def setUp(self):
+        user = User.objects.create_user('test', 'test@example.com', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        add_stations(AT1, [(3000, 1, 9), (3001, 5, 5)])
+        add_stations(AT2, [(3000, 2, 8)])
+
+    def test_export(self):
+        response = self.client.get(f'{self.URL}?from=2021-06-25T00:00:00&to=2021-06-26T00:00:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        columns = read_npz(response.content)
+        self.assertEqual(sorted(zip(columns['kioskId'][1], columns['at'][1], columns['bikesAvailable'][1])),
+                         [(3000, MILLIS1, 1), (3000, MILLIS1 + 30 * 60 * 1000, 2), (3001, MILLIS1, 5)])
+
+    def test_export_one_station(self):
+        response = self.client.get(f'{self.URL}?from=2021-06-25T00:00:00&to=2021-06-26T00:00:00&kioskId=3000')
+        columns = read_npz(response.content)
+        self.assertEqual(columns['kioskId'][1], [3000, 3000])
+        self.assertEqual(columns['docksAvailable'][1], [9, 8])
+
+    def test_export_empty(self):
+        response = self.client.get(f'{self.URL}?from=2000-01-01T00:00:00&to=2000-01-02T00:00:00')
+        self.assertEqual(read_npz(response.content)['at'], ('<M8[ms]', []))
+
+    def test_export_400_when_invalid_range(self):
+        response = self.client.get(f'{self.URL}?from=2021-06-26T00:00:00&to=2021-06-25T00:00:00')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_code'], 1004)
+
+    def test_export_400_when_invalid_kiosk_id(self):
+        response = self.client.get(f'{self.URL}?from=2021-06-25T00:00:00&to=2021-06-26T00:00:00&kioskId=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_code'], 1007)
+
+
+@override_settings(STATION_STORAGE_MODE='snapshot')
+class TestStationExportAPIViewSnapshot(TestStationExportAPIView):
+
+    def setUp(self):
+        super().setUp()
+        StationSnapshot.objects.create(at=AT1, stations={
+            '3000': {'properties': {'bikesAvailable': 1, 'docksAvailable': 9}},
+            '3001': {'properties': {'bikesAvailable': 5, 'docksAvailable': 5}},
+        })
+        StationSnapshot.objects.create(at=AT2, stations={
+            '3000': {'properties': {'bikesAvailable': 2, 'docksAvailable': 8}},
+        })
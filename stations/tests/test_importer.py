@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from datetime import datetime, timedelta
+from dateutil import tz
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from common import mongo
+from weathers.models import Weather
+from .. import importer, rollups
+from ..models import Station, StationSnapshot, StationTick
+from ..repositories import StationDeltaRepository, get_station_repository
+
+AT1 = datetime(2021, 6, 25, 20, 0, tzinfo=tz.tzutc())
+AT2 = datetime(2021, 6, 25, 20, 5, tzinfo=tz.tzutc())
+
+
+class TestImportStationArchive(TestCase):
+
+    def setUp(self):
+        database = mongo.get_database()
+        for collection_name, _ in rollups.GRANULARITIES.values():
+            database[collection_name].delete_many({})
+
+        with open('stations/tests/indego_sample.json') as f:
+            self.stations = f.read()
+        with open('weathers/tests/openweatherapi_sample.json') as f:
+            self.weather = f.read()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.write('stations/2021-06-25T20:00:00.json', self.stations)
+        self.write('weathers/2021-06-25T20:00:00.json', self.weather)
+        self.write('stations/2021-06-25T20:05:00.json', self.stations)
+        self.write('weathers/2021-06-25T20:05:00.json', self.weather)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def import_archive(self, path=None, *args):
+        out = StringIO()
+        call_command('import_station_archive', path or self.directory, '--workers', '1', *args,
+                     stdout=out, stderr=out)
+        return out.getvalue()
+
+    def test_import_directory(self):
+        out = self.import_archive()
+        self.assertIn('Imported 2 ticks and 6 rows', out)
+        repository = get_station_repository()
+        self.assertEqual(sorted(repository.all_ats()), [AT1, AT2])
+        self.assertEqual(sorted(station['kioskId'] for station in repository.stations_at(AT1)), [3004, 3005, 3006])
+        self.assertEqual(repository.weather_at(AT2)['document'], json.loads(self.weather))
+        hourly = rollups.find_rollups(mongo.get_database(), 'hour', 3004, AT1, AT2)
+        self.assertEqual(hourly[0]['bikesAvailable']['count'], 2)
+
+    def test_import_resumes(self):
+        self.import_archive()
+        Weather.objects.filter(at=AT2).delete()  # interrupted before the weather of the second tick
+
+        out = self.import_archive()
+        self.assertIn('Imported 1 ticks and 0 rows', out)
+        self.assertIn('1 already imported', out)
+        self.assertEqual(self.count_stations(), 6)
+        self.assertEqual(Weather.objects.count(), 2)
+        hourly = rollups.find_rollups(mongo.get_database(), 'hour', 3004, AT1, AT2)
+        self.assertEqual(hourly[0]['bikesAvailable']['count'], 2)
+
+    def test_import_rejects_invalid_and_incomplete_ticks(self):
+        self.write('stations/2021-06-25T20:10:00.json', '{"features": [{"properties": {"kioskId": "x"}}]}')
+        self.write('weathers/2021-06-25T20:10:00.json', self.weather)
+        self.write('stations/2021-06-25T20:15:00.json', self.stations)
+        self.write('stations/not-a-datetime.json', self.stations)
+
+        out = self.import_archive()
+        self.assertIn('Rejected 2021-06-25T20:10:00+00:00: Invalid stations', out)
+        self.assertIn('Imported 2 ticks and 6 rows', out)
+        self.assertIn('1 rejected, 1 incomplete', out)
+        self.assertEqual(Weather.objects.count(), 2)
+
+    def test_import_tarball(self):
+        path = os.path.join(self.directory, 'archive.tar.gz')
+        with tarfile.open(path, 'w:gz') as archive:
+            archive.add(os.path.join(self.directory, 'stations'), arcname='dump/stations')
+            archive.add(os.path.join(self.directory, 'weathers'), arcname='dump/weathers')
+
+        out = self.import_archive(path, '--batch-size', '1')
+        self.assertIn('Imported 2 ticks and 6 rows', out)
+        self.assertEqual(self.count_stations(), 6)
+
+    def test_import_in_worker_processes(self):
+        out = StringIO()
+        call_command('import_station_archive', self.directory, '--workers', '2', '--batch-size', '1', stdout=out)
+        self.assertIn('Imported 2 ticks and 6 rows', out.getvalue())
+
+    def count_stations(self):
+        return Station.objects.count()
+
+
+@override_settings(STATION_STORAGE_MODE='snapshot')
+class TestImportStationArchiveSnapshot(TestImportStationArchive):
+
+    def count_stations(self):
+        return sum(len(snapshot.stations) for snapshot in StationSnapshot.objects.all())
+
+
+class TestArchive(TestCase):
+
+    def test_at_of(self):
+        self.assertEqual(importer.at_of('dump/stations/2021-06-25T20:00:00.123456.json'),
+                         datetime(2021, 6, 25, 20, 0, 0, 123000, tzinfo=tz.tzutc()))
+        self.assertIsNone(importer.at_of('dump/other/2021-06-25T20:00:00.json'))
+        self.assertIsNone(importer.at_of('dump/stations/2021-06-25T20:00:00.txt'))
+        self.assertIsNone(importer.at_of('dump/stations/2021-13-25T20:00:00.json'))
+
+
+@override_settings(STATION_STORAGE_MODE='delta')
+class TestImportStationArchiveDelta(TestImportStationArchive):
+
+    def setUp(self):
+        super().setUp()
+        StationDeltaRepository._latest = None
+
+    def count_stations(self):
+        repository = get_station_repository()
+        return sum(len(repository.stations_at(at)) for at in repository.all_ats())
+
+    def test_import_behind_live_tick(self):
+        live_at = AT2 + timedelta(days=1)
+        features = json.loads(self.stations)['features'][:2]
+        features[0]['properties']['bikesAvailable'] += 1
+        repository = get_station_repository()
+        repository.create([{'kioskId': feature['properties']['kioskId'], 'at': live_at, 'document': feature}
+                           for feature in features])
+
+        out = self.import_archive()
+        self.assertIn('Imported 2 ticks and 6 rows', out)
+        self.assertEqual(sorted(repository.all_ats()), [AT1, AT2, live_at])
+        archived = {feature['properties']['kioskId']: feature for feature in json.loads(self.stations)['features']}
+        for at in (AT1, AT2):
+            self.assertEqual({station['kioskId']: station['document'] for station in repository.stations_at(at)},
+                             archived)
+        self.assertEqual({station['kioskId']: station['document'] for station in repository.stations_at(live_at)},
+                         {feature['properties']['kioskId']: feature for feature in features})
+        self.assertEqual([tick.keyframe for tick in StationTick.objects.order_by('at')], [True, False, True])
+        self.assertEqual(StationTick.objects.get(at=live_at).removed, [3006])
+        self.assertIsNone(repository.station_on_or_after(3006, AT2 + timedelta(seconds=1)))
@@ -0,0 +1,38 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from common import mongo
+from ..indexes import INDEXES
+
+
+class TestStationIndexes(TestCase):
+
+    def setUp(self):
+        self.database = mongo.get_database()
+        for collection_name in INDEXES:
+            self.database[collection_name].drop_indexes()
+
+    def test_create(self):
+        call_command('station_indexes', stdout=StringIO())
+        indexes = self.database['station'].index_information()
+        self.assertEqual(indexes['kioskId_at_unique']['key'], [('kioskId', 1), ('at', 1)])
+        self.assertTrue(indexes['kioskId_at_unique']['unique'])
+
+    def test_check_fails_when_missing(self):
+        with self.assertRaises(CommandError):
+            call_command('station_indexes', '--check', stdout=StringIO())
+
+    def test_check(self):
+        call_command('station_indexes', stdout=StringIO())
+        out = StringIO()
+        call_command('station_indexes', '--check', stdout=out)
+        self.assertIn('All indexes exist', out.getvalue())
+
+    def test_create_is_idempotent(self):
+        call_command('station_indexes', stdout=StringIO())
+        out = StringIO()
+        call_command('station_indexes', stdout=out)
+        self.assertNotIn('created', out.getvalue())
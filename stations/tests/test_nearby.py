@@ -0,0 +1,119 @@
+import json
+from datetime import datetime
+from dateutil import tz
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from weathers.models import Weather
+from .. import nearby, timeline
+from ..models import Station, StationSnapshot
+
+AT = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+CITY_HALL = (39.95378, -75.16374)  # 3004; 3005 is 1.8km away and 3006 3.4km
+
+
+def load_features():
+    with open('stations/tests/indego_sample.json') as f:
+        return json.load(f)['features']
+
+
+class TestSpatialIndex(TestCase):
+
+    def setUp(self):
+        self.index = nearby.SpatialIndex(
+            [{'kioskId': feature['properties']['kioskId'], 'at': AT, 'document': feature}
+             for feature in load_features()]
+            + [{'kioskId': 1, 'at': AT, 'document': {'dummy': 'document'}}])
+
+    def test_skips_stations_without_geometry(self):
+        self.assertEqual(len(self.index), 3)
+
+    def test_within(self):
+        found = self.index.within(*CITY_HALL, 2000)
+        self.assertEqual([station['kioskId'] for _, station in found], [3004, 3005])
+        self.assertAlmostEqual(found[0][0], 0)
+        self.assertAlmostEqual(found[1][0], 1827, delta=1)
+
+    def test_within_nothing(self):
+        self.assertEqual(self.index.within(40.5, -75.16374, 5000), [])
+
+    def test_haversine(self):
+        # one degree of latitude
+        self.assertAlmostEqual(nearby.haversine(39, -75, 40, -75), 111195, delta=1)
+
+
+class TestStationNearbyAPIView(APITestCase):
+
+    URL = '/api/v1/stations-nearby'
+
+    @classmethod
+    def setUpTestData(cls):
+        for feature in load_features():
+            Station.objects.create(kioskId=feature['properties']['kioskId'], at=AT, document=feature)
+        Weather.objects.create(at=AT, document={'dummy': 'document'})
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        nearby.reset_indexes()
+        user = User.objects.create_user('test', 'test@example.com', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+    def get(self, query):
+        return self.client.get(f'{self.URL}?at=2021-06-25T04:00:00&lat={CITY_HALL[0]}&lon={CITY_HALL[1]}{query}',
+                               format='json')
+
+    def test_nearby(self):
+        response = self.get('&radius=5000')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['at'], '2021-06-25T20:00:00Z')
+        self.assertEqual([station['station']['properties']['kioskId'] for station in response.data['stations']],
+                         [3004, 3005, 3006])
+        self.assertEqual(response.data['stations'][0]['distance'], 0)
+        self.assertEqual(response.data['stations'][0]['station'], load_features()[0])
+
+    def test_nearby_default_radius(self):
+        response = self.get('')
+        self.assertEqual([station['station']['properties']['kioskId'] for station in response.data['stations']],
+                         [3004])
+
+    def test_nearby_min_bikes_and_docks(self):
+        response = self.get('&radius=5000&minBikes=2')
+        self.assertEqual([station['station']['properties']['kioskId'] for station in response.data['stations']],
+                         [3005, 3006])
+        response = self.get('&radius=5000&minBikes=2&minDocks=10')
+        self.assertEqual([station['station']['properties']['kioskId'] for station in response.data['stations']],
+                         [3005])
+
+    def test_nearby_limit(self):
+        response = self.get('&radius=5000&limit=2')
+        self.assertEqual([station['station']['properties']['kioskId'] for station in response.data['stations']],
+                         [3004, 3005])
+
+    def test_nearby_400_when_invalid_query(self):
+        for query in ['&radius=5001', '&radius=abc', '&limit=0', '&minBikes=1.5']:
+            response = self.get(query)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error_code'], 1009)
+        response = self.client.get(f'{self.URL}?at=2021-06-25T04:00:00&lat=91&lon=0', format='json')
+        self.assertEqual(response.data['error_code'], 1009)
+        response = self.client.get(f'{self.URL}?lat=0&lon=0', format='json')
+        self.assertEqual(response.data['error_code'], 1000)
+
+    def test_nearby_404_when_no_snapshot(self):
+        response = self.client.get(f'{self.URL}?at=2021-06-26T00:00:00&lat=0&lon=0', format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['error_code'], 1002)
+
+
+@override_settings(STATION_STORAGE_MODE='snapshot')
+class TestStationNearbyAPIViewSnapshotMode(TestStationNearbyAPIView):
+
+    @classmethod
+    def setUpTestData(cls):
+        StationSnapshot.objects.create(at=AT, stations={
+            str(feature['properties']['kioskId']): feature for feature in load_features()})
@@ -0,0 +1,131 @@
+import json
+from datetime import datetime
+from dateutil import tz
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from unittest import mock
+
+from common import mongo
+from weathers.models import Weather
+from .. import normalized, timeline
+from ..models import Kiosk, Station, StationState
+from ..repositories import StationNormalizedRepository
+
+AT = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+
+
+def load_features():
+    with open('stations/tests/indego_sample.json') as f:
+        return json.load(f)['features']
+
+
+class TestNormalized(TestCase):
+
+    def test_split_rebuild(self):
+        for feature in load_features():
+            template, digest, state = normalized.split(feature)
+            self.assertNotIn('name', json.dumps(state))
+            self.assertEqual(json.dumps(normalized.rebuild(template, state)), json.dumps(feature))
+
+    def test_split_rebuild_unusual_documents(self):
+        feature = load_features()[0]
+        feature['properties']['bikes'] = [{'isAvailable': True, 'dockNumber': 1}]
+        del feature['properties']['kioskStatus']
+        for document in [feature, {'dummy': 'document'}, {'properties': {'bikes': None}}, {'properties': 'x'}]:
+            template, _, state = normalized.split(document)
+            self.assertEqual(json.dumps(normalized.rebuild(template, state)), json.dumps(document))
+
+    def test_digest_changes_with_static_properties_only(self):
+        feature = load_features()[0]
+        _, digest, _ = normalized.split(feature)
+        feature['properties']['bikesAvailable'] += 1
+        self.assertEqual(normalized.split(feature)[1], digest)
+        feature['properties']['name'] = 'Renamed'
+        self.assertNotEqual(normalized.split(feature)[1], digest)
+
+    def test_project(self):
+        document = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [1, 2]},
+                    'properties': {'kioskId': 1, 'bikes': [{'dockNumber': 1, 'battery': None}, 2]}}
+        self.assertEqual(normalized.project(document, ['properties.kioskId', 'type']),
+                         {'type': 'Feature', 'properties': {'kioskId': 1}})
+        self.assertEqual(normalized.project(document, ['properties.bikes.dockNumber']),
+                         {'properties': {'bikes': [{'dockNumber': 1}]}})
+        self.assertEqual(normalized.project(document, ['type.x', 'geometry']),
+                         {'geometry': document['geometry']})
+
+    def test_backfill_normalized_stations(self):
+        for feature in load_features():
+            Station.objects.create(kioskId=feature['properties']['kioskId'], at=AT, document=feature)
+
+        out = StringIO()
+        call_command('backfill_normalized_stations', '--delete-rows', stdout=out)
+        self.assertIn('Converted 3 rows', out.getvalue())
+        self.assertEqual(Station.objects.count(), 0)
+        self.assertEqual(StationState.objects.count(), 3)
+        self.assertEqual([station['document'] for station in StationNormalizedRepository().stations_at(AT)],
+                         load_features())
+
+
+class TestNormalizedStorage(APITestCase):
+
+    URL = '/api/v1/stations/'
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        user = User.objects.create_user('test', 'test@example.com', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+    def get(self, url):
+        cache.clear()
+        with override_settings(STATION_PRERENDERED_RESPONSES=False):
+            return self.client.get(url, format='json')
+
+    def test_responses_identical_to_row_storage(self):
+        features = load_features()
+        for feature in features:
+            Station.objects.create(kioskId=feature['properties']['kioskId'], at=AT, document=feature)
+        StationNormalizedRepository().create(
+            [{'kioskId': feature['properties']['kioskId'], 'at': AT, 'document': feature} for feature in features])
+        Weather.objects.create(at=AT, document={'dummy': 'document'})
+
+        for url in [f'{self.URL}?at=2021-06-25T04:00:00', f'{self.URL}3005?at=2021-06-25T04:00:00',
+                    f'{self.URL}3005?at=2021-06-25T04:00:00&fields=properties.bikes.dockNumber,properties.name',
+                    f'{self.URL}3005/history?from=2021-06-25T00:00:00&to=2021-06-26T00:00:00']:
+            row = self.get(url)
+            with override_settings(STATION_STORAGE_MODE='normalized'):
+                normalized_response = self.get(url)
+            self.assertEqual(normalized_response.status_code, 200)
+            self.assertEqual(normalized_response.content, row.content)
+
+    @override_settings(STATION_STORAGE_MODE='normalized')
+    @mock.patch('common.utils.call_openweathermap_api')
+    @mock.patch('common.utils.call_indego_station_api')
+    def test_create_writes_templates_when_changed_only(self, indego_mock, weather_mock):
+        features = load_features()
+        indego_mock.return_value = {'features': features, 'type': 'FeatureCollection'}
+        with open('weathers/tests/openweatherapi_sample.json') as f:
+            weather_mock.return_value = json.load(f)
+
+        self.assertEqual(self.client.post('/api/v1/indego-data-fetch-and-store-it-db').status_code, 201)
+        features[0]['properties']['bikesAvailable'] += 1
+        self.assertEqual(self.client.post('/api/v1/indego-data-fetch-and-store-it-db').status_code, 201)
+        self.assertEqual(Kiosk.objects.count(), 3)
+        features[0]['properties']['name'] = 'Renamed'
+        self.assertEqual(self.client.post('/api/v1/indego-data-fetch-and-store-it-db').status_code, 201)
+        self.assertEqual(Kiosk.objects.count(), 4)
+        self.assertEqual(StationState.objects.count(), 9)
+
+        states = mongo.get_database()[StationState._meta.db_table]
+        self.assertLess(len(json.dumps(states.find_one({}, {'_id': 0, 'values': 1, 'bikes': 1}))),
+                        len(json.dumps(features[0])) / 2)
+
+        response = self.get(f'{self.URL}3004?at=2000-01-01T00:00:00')
+        self.assertEqual(response.data['station']['properties']['name'], 'Municipal Services Building Plaza')
+        self.assertEqual(response.data['station']['properties']['bikesAvailable'], 1)
@@ -0,0 +1,28 @@
+import gzip
+
+import brotli
+from django.test import SimpleTestCase
+
+from .. import response_cache
+
+
+class TestResponseCache(SimpleTestCase):
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(response_cache.negotiate_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(response_cache.negotiate_encoding('gzip'), 'gzip')
+        self.assertEqual(response_cache.negotiate_encoding('GZIP;q=0.8, br;q=0.5'), 'gzip')
+        self.assertEqual(response_cache.negotiate_encoding('br;q=0, gzip'), 'gzip')
+        self.assertEqual(response_cache.negotiate_encoding('*'), 'br')
+        self.assertEqual(response_cache.negotiate_encoding('*;q=0.5, br;q=0'), 'gzip')
+        self.assertIsNone(response_cache.negotiate_encoding(''))
+        self.assertIsNone(response_cache.negotiate_encoding('identity, deflate'))
+        self.assertIsNone(response_cache.negotiate_encoding('gzip;q=0, br;q=invalid'))
+
+    def test_compress(self):
+        content = b'{"stations":[' + b','.join([b'{"bikesAvailable":1}'] * 100) + b']}'
+        self.assertEqual(gzip.decompress(response_cache.compress(content, 'gzip')), content)
+        self.assertEqual(brotli.decompress(response_cache.compress(content, 'br')), content)
+
+    def test_compress_skips_small_bodies(self):
+        self.assertIsNone(response_cache.compress(b'{"stations":[]}', 'br'))
@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+from io import StringIO
+from dateutil import tz
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from unittest import mock
+
+from common import mongo
+from weathers.models import Weather
+from .. import retention, rollups, timeline
+from ..models import RenderedSnapshot, Station, StationTick
+from ..repositories import StationDeltaRepository, StationRowRepository
+
+NOW = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+
+
+def plan(ats):
+    return retention.plan(ats, NOW, full_resolution=timedelta(days=7), step=timedelta(hours=1),
+                          horizon=timedelta(days=365))
+
+
+class TestPlan(TestCase):
+
+    def test_keeps_recent_ticks(self):
+        ats = [NOW - timedelta(minutes=5 * index) for index in range(100)]
+        self.assertEqual(plan(ats), [])
+
+    def test_keeps_last_tick_of_each_bucket(self):
+        old = datetime(2021, 6, 1, 10, 0, 0, tzinfo=tz.tzutc())
+        ats = [old + timedelta(minutes=5 * index) for index in range(24)]
+        self.assertEqual(plan(ats), ats[:11] + ats[12:23])
+
+    def test_keeps_bucket_partly_in_full_resolution(self):
+        # 19:00 to 19:55 seven days ago, left alone while full resolution still starts inside their hour
+        old = NOW - timedelta(days=7, hours=1)
+        ats = [old + timedelta(minutes=5 * index) for index in range(12)]
+        self.assertEqual(retention.plan(ats, NOW - timedelta(minutes=10), full_resolution=timedelta(days=7),
+                                        step=timedelta(hours=1), horizon=timedelta(days=365)), [])
+        self.assertEqual(plan(ats), ats[:11])
+
+    def test_deletes_beyond_horizon(self):
+        ats = [NOW - timedelta(days=400), NOW - timedelta(days=400, minutes=5)]
+        self.assertEqual(plan(ats), sorted(ats))
+
+    def test_idempotent(self):
+        ats = [NOW - timedelta(days=30, minutes=7 * index) for index in range(500)]
+        kept = sorted(set(ats) - set(plan(ats)))
+        self.assertEqual(plan(kept), [])
+        self.assertEqual(retention.plan(kept, NOW + timedelta(days=1), full_resolution=timedelta(days=7),
+                                        step=timedelta(hours=1), horizon=timedelta(days=365)), [])
+
+
+class TestDeleteAts(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.ats = [datetime(2021, 6, 1, 10, 0, 0, tzinfo=tz.tzutc()) + timedelta(minutes=5 * index)
+                    for index in range(3)]
+        for at in self.ats:
+            Station.objects.create(kioskId=3000, at=at, document={'dummy': 'document'})
+            Weather.objects.create(at=at, document={'dummy': 'document'})
+            RenderedSnapshot.objects.create(at=at, stations_response='{}', station_responses={})
+        self.database = mongo.get_database()
+        self.repository = StationRowRepository()
+        rollups.update_rollups(self.database, [
+            {'kioskId': 3000, 'at': at, 'document': {'properties': {'bikesAvailable': 1}}} for at in self.ats])
+        self.rollups = rollups.find_rollups(self.database, 'hour', 3000, self.ats[0], self.ats[2])
+
+    def test_delete_ats(self):
+        self.assertEqual(timeline.resolve_at(self.repository, self.ats[0] - timedelta(minutes=1)), self.ats[0])
+
+        with mock.patch('time.sleep') as sleep_mock:
+            progress = list(retention.delete_ats(self.repository, self.database, self.ats[:2], batch_size=1, pause=1))
+        self.assertEqual(progress, [1, 2])
+        self.assertEqual(sleep_mock.call_args_list, [mock.call(timeline.GENERATION_CHECK_INTERVAL), mock.call(1)])
+
+        self.assertEqual([station.at for station in Station.objects.all()], [self.ats[2]])
+        self.assertEqual([weather.at for weather in Weather.objects.all()], [self.ats[2]])
+        self.assertEqual([snapshot.at for snapshot in RenderedSnapshot.objects.all()], [self.ats[2]])
+        self.assertEqual(rollups.find_rollups(self.database, 'hour', 3000, self.ats[0], self.ats[2]), self.rollups)
+        self.assertEqual(timeline.resolve_at(self.repository, self.ats[0] - timedelta(minutes=1)), self.ats[2])
+
+    def test_excluded_before_deletion(self):
+        Station.objects.create(kioskId=3001, at=self.ats[1], document={'dummy': 'document'})
+
+        def sleep(seconds):
+            # as any process after a generation check, while the ticks are still stored
+            timeline.reset_indexes()
+            self.assertEqual(Station.objects.count(), 4)
+            self.assertEqual(timeline.resolve_at(self.repository, self.ats[0] - timedelta(minutes=1)), self.ats[2])
+            self.assertIsNone(timeline.resolve_at(self.repository, self.ats[0] - timedelta(minutes=1), 3001))
+
+        with mock.patch('time.sleep', side_effect=sleep) as sleep_mock:
+            list(retention.delete_ats(self.repository, self.database, self.ats[:2], batch_size=10))
+        sleep_mock.assert_called_once_with(timeline.GENERATION_CHECK_INTERVAL)
+
+        document = self.database[timeline.GENERATION_COLLECTION].find_one({'_id': 'generation'})
+        self.assertEqual(document['excluded'], [])
+
+    @override_settings(STATION_RETENTION_FULL_DAYS=7, STATION_RETENTION_DOWNSAMPLE_MINUTES=60,
+                       STATION_RETENTION_HORIZON_DAYS=365)
+    def test_command(self):
+        with mock.patch('django.utils.timezone.now', return_value=NOW), mock.patch('time.sleep'):
+            out = StringIO()
+            call_command('apply_station_retention', '--dry-run', stdout=out)
+            self.assertIn('2 snapshots would be deleted', out.getvalue())
+            self.assertEqual(Station.objects.count(), 3)
+
+            call_command('apply_station_retention', '--pause', '0', stdout=StringIO())
+            self.assertEqual([station.at for station in Station.objects.all()], [self.ats[2]])
+            call_command('apply_station_retention', '--pause', '0', stdout=StringIO())
+            self.assertEqual(Station.objects.count(), 1)
+        # a time inside the bucket still resolves to its snapshot
+        self.assertEqual(timeline.resolve_at(self.repository, self.ats[0] + timedelta(minutes=1)), self.ats[2])
+
+
+@override_settings(STATION_STORAGE_MODE='delta', STATION_DELTA_KEYFRAME_INTERVAL=10)
+class TestDeleteAtsDeltaMode(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        StationDeltaRepository._latest = None
+        self.repository = StationDeltaRepository()
+        self.database = mongo.get_database()
+        # 3001 is removed at the second tick
+        self.ats = [datetime(2021, 6, 1, 10, 0, 0, tzinfo=tz.tzutc()) + timedelta(minutes=5 * index)
+                    for index in range(3)]
+        for index, at in enumerate(self.ats):
+            self.repository.create([{'kioskId': kioskId, 'at': at, 'document': {'kioskId': kioskId}}
+                                    for kioskId in ([3000, 3001] if index == 0 else [3000])])
+
+    def test_delete_removal_tick(self):
+        with mock.patch('time.sleep'):
+            list(retention.delete_ats(self.repository, self.database, self.ats[1:2], batch_size=10))
+
+        self.assertEqual([tick.keyframe for tick in StationTick.objects.order_by('at')], [True, True])
+        self.assertEqual(StationTick.objects.get(at=self.ats[2]).removed, [3001])
+        self.assertEqual([station['kioskId'] for station in self.repository.stations_at(self.ats[2])], [3000])
+        self.assertIsNone(self.repository.first_station_at(3001, self.ats[2]))
+        self.assertIsNone(self.repository.station_on_or_after(3001, self.ats[1]))
+        self.assertEqual(self.repository.station_on_or_after(3001, self.ats[0])['at'], self.ats[0])
+        self.assertEqual(self.repository.station_on_or_after(3000, self.ats[1])['at'], self.ats[2])
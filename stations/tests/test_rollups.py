@@ -0,0 +1,117 @@
+import json
+from datetime import datetime
+from dateutil import tz
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from unittest import mock
+
+from common import mongo
+from .. import rollups
+from ..models import Station
+
+
+def station(kioskId, at, bikes, docks, electric=None):
+    properties = {'kioskId': kioskId, 'bikesAvailable': bikes, 'docksAvailable': docks}
+    if electric is not None:
+        properties['electricBikesAvailable'] = electric
+    return {'kioskId': kioskId, 'at': at, 'document': {'properties': properties}}
+
+
+class TestRollups(TestCase):
+
+    def setUp(self):
+        self.database = mongo.get_database()
+        for collection_name, _ in rollups.GRANULARITIES.values():
+            self.database[collection_name].delete_many({})
+
+    def test_update_rollups(self):
+        rollups.update_rollups(self.database, [
+            station(3000, datetime(2021, 6, 25, 20, 0, tzinfo=tz.tzutc()), 1, 9, 0),
+            station(3001, datetime(2021, 6, 25, 20, 0, tzinfo=tz.tzutc()), 5, 5, 2),
+        ])
+        rollups.update_rollups(self.database, [
+            station(3000, datetime(2021, 6, 25, 20, 30, tzinfo=tz.tzutc()), 3, 7),
+        ])
+        rollups.update_rollups(self.database, [
+            station(3000, datetime(2021, 6, 25, 21, 0, tzinfo=tz.tzutc()), 8, 2, 1),
+        ])
+
+        hourly = rollups.find_rollups(self.database, 'hour', 3000, datetime(2021, 6, 25, tzinfo=tz.tzutc()),
+                                      datetime(2021, 6, 26, tzinfo=tz.tzutc()))
+        self.assertEqual(len(hourly), 2)
+        self.assertEqual(hourly[0]['bucket'], datetime(2021, 6, 25, 20, 0, tzinfo=tz.tzutc()))
+        self.assertEqual(hourly[0]['bikesAvailable'], {'min': 1, 'max': 3, 'mean': 2.0, 'count': 2})
+        self.assertEqual(hourly[0]['docksAvailable'], {'min': 7, 'max': 9, 'mean': 8.0, 'count': 2})
+        self.assertEqual(hourly[0]['electricBikesAvailable'], {'min': 0, 'max': 0, 'mean': 0.0, 'count': 1})
+
+        daily = rollups.find_rollups(self.database, 'day', 3000, datetime(2021, 6, 25, 12, tzinfo=tz.tzutc()),
+                                     datetime(2021, 6, 26, tzinfo=tz.tzutc()))
+        self.assertEqual(len(daily), 1)
+        self.assertEqual(daily[0]['bucket'], datetime(2021, 6, 25, tzinfo=tz.tzutc()))
+        self.assertEqual(daily[0]['bikesAvailable'], {'min': 1, 'max': 8, 'mean': 4.0, 'count': 3})
+
+    def test_update_rollups_skips_documents_without_counters(self):
+        rollups.update_rollups(self.database, [
+            {'kioskId': 3000, 'at': datetime(2021, 6, 25, 20, 0, tzinfo=tz.tzutc()), 'document': {'dummy': 'document'}},
+        ])
+        self.assertEqual(self.database['station_rollup_hourly'].count_documents({}), 0)
+
+    def test_rebuild_station_rollups(self):
+        at = datetime(2021, 6, 25, 20, 0, tzinfo=tz.tzutc())
+        for item in [station(3000, at, 1, 9), station(3001, at, 5, 5)]:
+            Station.objects.create(**item)
+        rollups.update_rollups(self.database, [station(3000, at, 100, 100)])  # drifted
+
+        call_command('rebuild_station_rollups', stdout=StringIO())
+        hourly = rollups.find_rollups(self.database, 'hour', 3000, at, at)
+        self.assertEqual(hourly[0]['bikesAvailable'], {'min': 1, 'max': 1, 'mean': 1.0, 'count': 1})
+
+
+class TestStationRollupAPIView(APITestCase):
+
+    URL = '/api/v1/stations/3004/rollups'
+
+    def setUp(self):
+        database = mongo.get_database()
+        for collection_name, _ in rollups.GRANULARITIES.values():
+            database[collection_name].delete_many({})
+        user = User.objects.create_user('test', 'test@example.com', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+    @mock.patch('common.utils.call_openweathermap_api')
+    @mock.patch('common.utils.call_indego_station_api')
+    def test_rollups_updated_by_create(self, indego_mock, weather_mock):
+        with open('stations/tests/indego_sample.json') as f:
+            indego_mock.return_value = json.load(f)
+        with open('weathers/tests/openweatherapi_sample.json') as f:
+            weather_mock.return_value = json.load(f)
+        self.client.post('/api/v1/indego-data-fetch-and-store-it-db', format='json')
+
+        response = self.client.get(f'{self.URL}?granularity=day&from=2000-01-01T00:00:00&to=2100-01-01T00:00:00',
+                                   format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['kioskId'], 3004)
+        self.assertEqual(response.data[0]['bikesAvailable'], {'min': 1.0, 'max': 1.0, 'mean': 1.0, 'count': 1})
+
+    def test_rollups_400_when_invalid_granularity(self):
+        response = self.client.get(f'{self.URL}?granularity=week&from=2000-01-01T00:00:00&to=2100-01-01T00:00:00',
+                                   format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_code'], 1006)
+
+    def test_rollups_400_when_invalid_range(self):
+        response = self.client.get(f'{self.URL}?granularity=hour&from=2000-01-01T00:00:00', format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_code'], 1004)
+
+    def test_rollups_400_when_invalid_kioskId(self):
+        response = self.client.get('/api/v1/stations/abc/rollups?granularity=hour&from=2000-01-01T00:00:00'
+                                   '&to=2100-01-01T00:00:00', format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_code'], 1007)
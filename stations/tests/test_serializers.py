@@ -1,5 +1,14 @@
+import json
+from datetime import datetime
+from dateutil import tz
+
 from django.test import TestCase
-from stations.serializers import StationSerializer
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from stations.models import Station
+from stations.serializers import StationSerializer, StationListSerializer
+from stations.station_weather_serializers import StationListWeatherSerializer, StationWeatherSerializer
 
 
 class TestStationSerializer(TestCase):
@@ -68,3 +77,88 @@ class TestStationSerializer(TestCase):
         serializer = StationSerializer(data=self.data)
         self.assertEqual(serializer.is_valid(), False)
         self.assertEqual(str(serializer.errors['kioskId'][0]), 'A valid integer is required.')
+
+
+class TestStationListSerializer(TestCase):
+
+    def setUp(self):
+        self.data = [
+            {'kioskId': 3000, 'at': '2019-09-01T10:00:00', 'document': {'dummy': 'document'}},
+            {'kioskId': 3001, 'at': '2019-09-01T10:00:00', 'document': {'dummy': 'document'}},
+            {'kioskId': 3002, 'at': '2019-09-01T10:00:00', 'document': {'dummy': 'document'}},
+        ]
+
+    def test_validate(self):
+        serializer = StationListSerializer(data=self.data)
+        self.assertEqual(serializer.is_valid(), True)
+
+    def test_validate_with_one_query(self):
+        serializer = StationListSerializer(data=self.data)
+        with self.assertNumQueries(1):
+            serializer.is_valid()
+
+    def test_validate_kioskId_at_unique(self):
+        serializer = StationListSerializer(data=self.data[1:2])
+        serializer.is_valid()
+        serializer.save()
+
+        serializer = StationListSerializer(data=self.data)
+        self.assertEqual(serializer.is_valid(), False)
+        self.assertEqual(serializer.errors[0], {})
+        self.assertEqual(str(serializer.errors[1]['non_field_errors'][0]),
+                         'The fields kioskId, at must make a unique set.')
+        self.assertEqual(serializer.errors[2], {})
+
+    def test_validate_kioskId_at_unique_in_batch(self):
+        self.data[2]['kioskId'] = 3000
+        serializer = StationListSerializer(data=self.data)
+        self.assertEqual(serializer.is_valid(), False)
+        self.assertEqual(serializer.errors[0], {})
+        self.assertEqual(serializer.errors[1], {})
+        self.assertEqual(str(serializer.errors[2]['non_field_errors'][0]),
+                         'The fields kioskId, at must make a unique set.')
+
+    def test_validate_kioskId_at_unique_pass_with_different_at(self):
+        serializer = StationListSerializer(data=self.data)
+        serializer.is_valid()
+        serializer.save()
+
+        for item in self.data:
+            item['at'] = '2019-09-01T10:00:01'
+        serializer = StationListSerializer(data=self.data)
+        self.assertEqual(serializer.is_valid(), True)
+
+    def test_invallid_kioskId(self):
+        self.data[1]['kioskId'] = '3001 in string'
+        serializer = StationListSerializer(data=self.data)
+        self.assertEqual(serializer.is_valid(), False)
+        self.assertEqual(str(serializer.errors[1]['kioskId'][0]), 'A valid integer is required.')
+
+
+class TestFastPathRepresentation(TestCase):
+
+    def setUp(self):
+        with open('stations/tests/indego_sample.json') as f:
+            self.features = json.load(f)['features']
+        self.at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        self.stations = [{'kioskId': feature['properties']['kioskId'], 'at': self.at, 'document': feature}
+                         for feature in self.features]
+        self.weather = {'at': self.at, 'document': {'weather': [{'main': 'Clear'}], 'name': 'Philadelphia'}}
+
+    def test_station_representation_same_as_fields(self):
+        instance = Station(kioskId=3004, at=self.at, document=self.features[0])
+        for station in (self.stations[0], instance):
+            self.assertEqual(StationSerializer().to_representation(station),
+                             serializers.ModelSerializer.to_representation(StationSerializer(), station)['document'])
+
+    def test_station_list_rendered_same_as_fields(self):
+        fast = StationListWeatherSerializer({'at': self.at, 'stations': self.stations, 'weather': self.weather}).data
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render({
+            'at': self.at,
+            'stations': self.features,
+            'weather': self.weather['document'],
+        }))
+
+    def test_station_weather_without_weather(self):
+        data = StationWeatherSerializer({'at': self.at, 'station': self.stations[0], 'weather': None}).data
+        self.assertEqual(data, {'at': self.at, 'station': self.features[0], 'weather': None})
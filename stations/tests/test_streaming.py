@@ -0,0 +1,33 @@
+import json
+from datetime import datetime
+from dateutil import tz
+
+from django.test import SimpleTestCase
+from unittest import mock
+
+from .. import streaming
+
+
+class TestStationListResponse(SimpleTestCase):
+
+    def setUp(self):
+        self.at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        self.stations = [{'kioskId': 3000 + i, 'document': {'kioskId': 3000 + i, 'name': 'Ä '}} for i in range(5)]
+        self.weather = {'document': {'dummy': 'document'}}
+
+    def test_content(self):
+        response = streaming.station_list_response(self.at, iter(self.stations), self.weather)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), {
+            'at': '2021-06-25T20:00:00Z',
+            'stations': [station['document'] for station in self.stations],
+            'weather': {'dummy': 'document'},
+        })
+
+    def test_chunks(self):
+        with mock.patch.object(streaming, 'CHUNK_SIZE', 1):
+            chunks = list(streaming.station_list_response(self.at, iter(self.stations), self.weather))
+        self.assertEqual(len(chunks), len(self.stations) + 1)
+
+    def test_empty(self):
+        response = streaming.station_list_response(self.at, iter([]), self.weather)
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['stations'], [])
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+from dateutil import tz
+
+from django.core.cache import cache
+from django.test import TestCase
+from unittest import mock
+
+from common import mongo
+from .. import timeline
+from ..models import Station
+from ..repositories import StationRowRepository
+
+
+class TestSnapshotIndex(TestCase):
+
+    def setUp(self):
+        self.at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        self.later_at = datetime(2021, 6, 25, 20, 0, 1, 500000, tzinfo=tz.tzutc())
+        Station.objects.create(kioskId=3000, at=self.at, document={'dummy': 'document'})
+        Station.objects.create(kioskId=3001, at=self.at, document={'dummy': 'document'})
+        Station.objects.create(kioskId=3000, at=self.later_at, document={'dummy': 'document'})
+        self.repository = StationRowRepository()
+        self.index = timeline.SnapshotIndex()
+
+    def test_first_on_or_after(self):
+        just_before = datetime(2021, 6, 25, tzinfo=tz.tzutc())
+        just_after = datetime(2021, 6, 25, 20, 0, 0, 1, tzinfo=tz.tzutc())
+        self.assertEqual(self.index.first_on_or_after(self.repository, just_before), self.at)
+        self.assertEqual(self.index.first_on_or_after(self.repository, self.at), self.at)
+        self.assertEqual(self.index.first_on_or_after(self.repository, just_after), self.later_at)
+        self.assertEqual(self.index.first_on_or_after(self.repository, self.later_at), self.later_at)
+
+    def test_first_on_or_after_without_query(self):
+        self.index.first_on_or_after(self.repository, self.at)
+        with mock.patch.object(self.repository, 'first_at') as first_at_mock, \
+                mock.patch.object(self.repository, 'all_ats') as all_ats_mock:
+            self.assertEqual(self.index.first_on_or_after(self.repository, self.later_at), self.later_at)
+        first_at_mock.assert_not_called()
+        all_ats_mock.assert_not_called()
+
+    def test_first_on_or_after_falls_back_to_database(self):
+        self.index.first_on_or_after(self.repository, self.at)
+
+        newest_at = datetime(2021, 6, 25, 21, 0, 0, tzinfo=tz.tzutc())
+        Station.objects.create(kioskId=3000, at=newest_at, document={'dummy': 'document'})
+        self.assertEqual(self.index.first_on_or_after(self.repository, newest_at), newest_at)
+
+        with mock.patch.object(self.repository, 'first_at') as first_at_mock:
+            self.assertEqual(self.index.first_on_or_after(self.repository, newest_at), newest_at)
+        first_at_mock.assert_not_called()
+
+    def test_first_on_or_after_not_found(self):
+        self.assertIsNone(self.index.first_on_or_after(self.repository, datetime(2021, 6, 26, tzinfo=tz.tzutc())))
+
+    def test_count(self):
+        self.assertEqual(self.index.count(self.repository, self.at, self.later_at), 1)
+        self.assertEqual(self.index.count(self.repository, self.at, self.later_at + timedelta(milliseconds=1)), 2)
+        self.assertEqual(self.index.count(self.repository, self.later_at, self.later_at), 0)
+
+    def test_add(self):
+        self.index.first_on_or_after(self.repository, self.at)
+        newest_at = datetime(2021, 6, 25, 21, 0, 0, tzinfo=tz.tzutc())
+        self.index.add(newest_at)
+        self.index.add(newest_at)
+        with mock.patch.object(self.repository, 'first_at') as first_at_mock:
+            self.assertEqual(self.index.first_on_or_after(self.repository, newest_at), newest_at)
+        first_at_mock.assert_not_called()
+
+
+class TestResolveAt(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        Station.objects.create(kioskId=3000, at=self.at, document={'dummy': 'document'})
+        self.repository = StationRowRepository()
+
+    def test_resolve_at(self):
+        query_at = datetime(2021, 6, 25, 19, 0, 0)
+        self.assertEqual(timeline.resolve_at(self.repository, query_at), self.at)
+        self.assertEqual(timeline.resolve_at(self.repository, query_at, 3000), self.at)
+        self.assertIsNone(timeline.resolve_at(self.repository, query_at, 3001))
+
+    def test_resolve_at_with_kioskId_is_memoized(self):
+        query_at = datetime(2021, 6, 25, 19, 0, 0, tzinfo=tz.tzutc())
+        with mock.patch.object(self.repository, 'first_station_at',
+                               wraps=self.repository.first_station_at) as first_station_at_mock:
+            timeline.resolve_at(self.repository, query_at, 3000)
+            timeline.resolve_at(self.repository, query_at, 3000)
+        self.assertEqual(first_station_at_mock.call_count, 1)
+
+    def test_resolve_at_with_kioskId_is_memoized_per_snapshot(self):
+        # polling with ever-changing times costs one query and one entry per snapshot
+        with mock.patch.object(self.repository, 'first_station_at',
+                               wraps=self.repository.first_station_at) as first_station_at_mock:
+            for seconds in range(100):
+                query_at = datetime(2021, 6, 25, 19, 0, 0, tzinfo=tz.tzutc()) + timedelta(seconds=seconds)
+                self.assertEqual(timeline.resolve_at(self.repository, query_at, 3000), self.at)
+        self.assertEqual(first_station_at_mock.call_count, 1)
+        self.assertEqual(len(timeline._kiosk_resolutions), 1)
+
+    def test_resolve_at_with_kioskId_does_not_memoize_not_found(self):
+        query_at = datetime(2021, 6, 25, 21, 0, 0, tzinfo=tz.tzutc())
+        self.assertIsNone(timeline.resolve_at(self.repository, query_at, 3000))
+
+        later_at = datetime(2021, 6, 25, 22, 0, 0, tzinfo=tz.tzutc())
+        Station.objects.create(kioskId=3000, at=later_at, document={'dummy': 'document'})
+        self.assertEqual(timeline.resolve_at(self.repository, query_at, 3000), later_at)
+
+    def test_generation_bump_reloads_index(self):
+        query_at = datetime(2021, 6, 25, 19, 0, 0, tzinfo=tz.tzutc())
+        self.assertEqual(timeline.resolve_at(self.repository, query_at), self.at)
+        self.assertEqual(timeline.resolve_at(self.repository, query_at, 3000), self.at)
+
+        # as another process deleting the snapshot would
+        Station.objects.all().delete()
+        timeline.bump_generation()
+        self.assertIsNone(timeline.resolve_at(self.repository, query_at))
+        self.assertIsNone(timeline.resolve_at(self.repository, query_at, 3000))
+
+    def test_generation_is_shared(self):
+        generation = timeline.generation()
+        mongo.get_database()[timeline.GENERATION_COLLECTION].update_one(
+            {'_id': 'generation'}, {'$inc': {'value': 1}}, upsert=True)
+        self.assertEqual(timeline.generation(), generation)  # until the next check
+        timeline.reset_indexes()
+        self.assertEqual(timeline.generation(), generation + 1)
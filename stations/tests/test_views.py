@@ -1,15 +1,22 @@
+import gzip
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from dateutil import tz
 
+import brotli
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 from unittest import mock
 
 
-from common import errors
-from ..models import Station
+from common import errors, mongo
+from .. import response_cache, timeline
+from ..models import RenderedSnapshot, Station, StationSnapshot
+from ..repositories import StationDeltaRepository, StationNormalizedRepository
 from weathers.models import Weather
 
 
@@ -23,6 +30,8 @@ class TestStationCreateAPIView(APITestCase):
     URL = '/api/v1/indego-data-fetch-and-store-it-db'
 
     def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
 
     @mock.patch('common.utils.call_openweathermap_api')
@@ -67,6 +76,32 @@ class TestStationCreateAPIView(APITestCase):
         self.assertEqual(Weather.objects.count(), 0)
 
 
+@override_settings(STATION_STORAGE_MODE='snapshot')
+class TestStationCreateAPIViewSnapshotMode(APITestCase):
+
+    URL = '/api/v1/indego-data-fetch-and-store-it-db'
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
+
+    @mock.patch('common.utils.call_openweathermap_api')
+    @mock.patch('common.utils.call_indego_station_api')
+    def test_create_success(self, indego_mock, weather_mock):
+        with open('stations/tests/indego_sample.json') as f:
+            indego_mock.return_value = json.load(f)
+        with open('weathers/tests/openweatherapi_sample.json') as f:
+            weather_mock.return_value = json.load(f)
+
+        response = self.client.post(self.URL, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Station.objects.count(), 0)
+        self.assertEqual(StationSnapshot.objects.count(), 1)
+        self.assertEqual(len(StationSnapshot.objects.first().stations), 3)
+        self.assertEqual(Weather.objects.count(), 1)
+
+
 class TestStationListRetrieveAPIView(APITestCase):
 
     URL = '/api/v1/stations/'
@@ -79,6 +114,8 @@ class TestStationListRetrieveAPIView(APITestCase):
         Weather.objects.create(at=at, document={'dummy': 'document'})
 
     def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
 
     def test_list_retrieve_success(self):
@@ -116,6 +153,8 @@ class TestStationListRetrieveAPIViewWhenNoWeather(APITestCase):
         Station.objects.create(kioskId=3001, at=at, document={'dummy': 'document'})
 
     def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
 
     def test_list_retrieve_404(self):
@@ -125,6 +164,36 @@ class TestStationListRetrieveAPIViewWhenNoWeather(APITestCase):
         self.assertEqual(response.data['error_code'], 1003)
 
 
+@override_settings(STATION_STORAGE_MODE='snapshot')
+class TestStationListRetrieveAPIViewSnapshotMode(APITestCase):
+
+    URL = '/api/v1/stations/'
+
+    @classmethod
+    def setUpTestData(cls):
+        at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        StationSnapshot.objects.create(at=at, stations={'3000': {'kioskId': 3000}, '3001': {'kioskId': 3001}})
+        Weather.objects.create(at=at, document={'dummy': 'document'})
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
+
+    def test_list_retrieve_success(self):
+        query = 'at=2021-06-25T04:00:00'
+        response = self.client.get(f'{self.URL}?{query}', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stations'], [{'kioskId': 3000}, {'kioskId': 3001}])
+        self.assertEqual(response.data['weather'], {'dummy': 'document'})
+
+    def test_list_retrieve_404_when_no_specified_station(self):
+        query = 'at=2021-06-26T04:00:00'  # future
+        response = self.client.get(f'{self.URL}?{query}', format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['error_code'], 1002)
+
+
 class TestStationRetrieveAPIView(APITestCase):
 
     URL = '/api/v1/stations/'
@@ -137,6 +206,8 @@ class TestStationRetrieveAPIView(APITestCase):
         Weather.objects.create(at=at, document={'dummy': 'document'})
 
     def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
 
     def test_retrieve_success(self):
@@ -166,6 +237,55 @@ class TestStationRetrieveAPIView(APITestCase):
         self.assertEqual(response.status_code, 404)
         self.assertEqual(response.data['error_code'], 1002)
 
+    def test_retrieve_400_when_invalid_kioskId(self):
+        for kioskId in ['abc', '-3000', '3000.0']:
+            response = self.client.get(f'{self.URL}{kioskId}?at=2021-06-25T04:00:00', format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error_code'], 1007)
+
+
+@override_settings(STATION_STORAGE_MODE='snapshot')
+class TestStationRetrieveAPIViewSnapshotMode(APITestCase):
+
+    URL = '/api/v1/stations/'
+
+    @classmethod
+    def setUpTestData(cls):
+        at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        later_at = datetime(2021, 6, 25, 21, 0, 0, tzinfo=tz.tzutc())
+        StationSnapshot.objects.create(at=at, stations={'3000': {'kioskId': 3000}})
+        StationSnapshot.objects.create(at=later_at, stations={'3000': {'kioskId': 3000}, '3001': {'kioskId': 3001}})
+        Weather.objects.create(at=at, document={'dummy': 'document'})
+        Weather.objects.create(at=later_at, document={'dummy': 'later document'})
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
+
+    def test_retrieve_success(self):
+        kioskId = 3000
+        query = 'at=2021-06-25T04:00:00'
+        response = self.client.get(f'{self.URL}{kioskId}?{query}', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['station'], {'kioskId': 3000})
+        self.assertEqual(response.data['weather'], {'dummy': 'document'})
+
+    def test_retrieve_success_from_later_snapshot(self):
+        kioskId = 3001
+        query = 'at=2021-06-25T04:00:00'
+        response = self.client.get(f'{self.URL}{kioskId}?{query}', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['station'], {'kioskId': 3001})
+        self.assertEqual(response.data['weather'], {'dummy': 'later document'})
+
+    def test_retrieve_404_when_no_specified_station(self):
+        kioskId = 3002
+        query = 'at=2021-06-25T04:00:00'
+        response = self.client.get(f'{self.URL}{kioskId}?{query}', format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['error_code'], 1002)
+
 
 class TestStationRetrieveAPIViewWhenNoWeather(APITestCase):
 
@@ -178,6 +298,8 @@ class TestStationRetrieveAPIViewWhenNoWeather(APITestCase):
         Station.objects.create(kioskId=3001, at=at, document={'dummy': 'document'})
 
     def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
 
     def test_retrieve_404(self):
@@ -208,3 +330,787 @@ class TestWithoutToken(APITestCase):
         query = 'at=2021-06-25T04:00:00'
         response = self.client.get(f'{url}{kioskId}?{query}', format='json')
         self.assertEqual(response.status_code, 401)
+
+    def test_station_history_401(self):
+        url = '/api/v1/stations/3000/history'
+        query = 'from=2021-06-25T04:00:00&to=2021-06-25T05:00:00'
+        response = self.client.get(f'{url}?{query}', format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(STATION_PRERENDERED_RESPONSES=True)
+class TestPrerenderedResponses(APITestCase):
+
+    CREATE_URL = '/api/v1/indego-data-fetch-and-store-it-db'
+    URL = '/api/v1/stations/'
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
+
+    @mock.patch('common.utils.call_openweathermap_api')
+    @mock.patch('common.utils.call_indego_station_api')
+    def create(self, indego_mock, weather_mock):
+        with open('stations/tests/indego_sample.json') as f:
+            indego_mock.return_value = json.load(f)
+        with open('weathers/tests/openweatherapi_sample.json') as f:
+            weather_mock.return_value = json.load(f)
+        self.assertEqual(self.client.post(self.CREATE_URL, format='json').status_code, 201)
+
+    def test_create_renders_snapshot(self):
+        self.create()
+        self.assertEqual(RenderedSnapshot.objects.count(), 1)
+        self.assertEqual(len(RenderedSnapshot.objects.first().station_responses), 3)
+
+    def test_weather_rendered_once(self):
+        self.create()
+        rendered = RenderedSnapshot.objects.first()
+        for body in rendered.station_responses.values():
+            self.assertNotIn(rendered.weather_response, body)
+
+    def test_retrieve_rendered_with_whole_body(self):
+        # as rendered before the weather was shared
+        self.create()
+        with override_settings(STATION_PRERENDERED_RESPONSES=False):
+            serialized = self.client.get(f'{self.URL}3004?at=2000-01-01T00:00:00', format='json')
+        cache.clear()
+        mongo.get_database()[RenderedSnapshot._meta.db_table].update_many(
+            {}, {'$set': {'weather_response': None, 'station_responses': {'3004': serialized.content.decode()}}})
+        rendered = self.client.get(f'{self.URL}3004?at=2000-01-01T00:00:00', format='json')
+        self.assertFalse(hasattr(rendered, 'data'))
+        self.assertEqual(rendered.content, serialized.content)
+
+    @override_settings(STATION_PRERENDERED_RESPONSES=False)
+    def test_create_without_rendering(self):
+        self.create()
+        self.assertEqual(RenderedSnapshot.objects.count(), 0)
+
+    def test_list_retrieve_identical(self):
+        self.create()
+        with override_settings(STATION_PRERENDERED_RESPONSES=True):
+            rendered = self.client.get(f'{self.URL}?at=2000-01-01T00:00:00', format='json')
+        cache.clear()
+        with override_settings(STATION_PRERENDERED_RESPONSES=False):
+            serialized = self.client.get(f'{self.URL}?at=2000-01-01T00:00:00', format='json')
+
+        self.assertEqual(rendered.status_code, 200)
+        self.assertFalse(hasattr(rendered, 'data'))
+        self.assertTrue(hasattr(serialized, 'data'))
+        self.assertEqual(rendered.content, serialized.content)
+        self.assertEqual(rendered['Content-Type'], serialized['Content-Type'])
+
+    def test_retrieve_identical(self):
+        self.create()
+        with override_settings(STATION_PRERENDERED_RESPONSES=True):
+            rendered = self.client.get(f'{self.URL}3004?at=2000-01-01T00:00:00', format='json')
+        cache.clear()
+        with override_settings(STATION_PRERENDERED_RESPONSES=False):
+            serialized = self.client.get(f'{self.URL}3004?at=2000-01-01T00:00:00', format='json')
+
+        self.assertEqual(rendered.status_code, 200)
+        self.assertFalse(hasattr(rendered, 'data'))
+        self.assertEqual(rendered.content, serialized.content)
+
+    def test_retrieve_404_when_no_specified_station(self):
+        self.create()
+        response = self.client.get(f'{self.URL}9999?at=2000-01-01T00:00:00', format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['error_code'], 1002)
+
+
+class TestSharedResponseCache(APITestCase):
+
+    URL = '/api/v1/stations/'
+    STATS_URL = '/api/v1/stations-cache-stats'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        Station.objects.create(kioskId=3000, at=cls.at, document={'dummy': 'document'})
+        Station.objects.create(kioskId=3001, at=cls.at, document={'dummy': 'document'})
+        Weather.objects.create(at=cls.at, document={'dummy': 'document'})
+        cls.tokens = [Token.objects.create(user=User.objects.create_user(f'test{i}')).key for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+
+    def get(self, url, token):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        return self.client.get(url, format='json')
+
+    def test_list_retrieve_shared_between_tokens(self):
+        first = self.get(f'{self.URL}?at=2021-06-25T04:00:00', self.tokens[0])
+        second = self.get(f'{self.URL}?at=2021-06-25T04:00:00', self.tokens[1])
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+
+    def test_list_retrieve_keyed_on_resolved_snapshot(self):
+        first = self.get(f'{self.URL}?at=2021-06-25T04:00:00', self.tokens[0])
+        second = self.get(f'{self.URL}?at=2021-06-25T19:59:59', self.tokens[0])
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+
+    def test_retrieve_keyed_on_kioskId(self):
+        first = self.get(f'{self.URL}3000?at=2021-06-25T04:00:00', self.tokens[0])
+        second = self.get(f'{self.URL}3001?at=2021-06-25T04:00:00', self.tokens[1])
+        third = self.get(f'{self.URL}3001?at=2021-06-25T04:00:00', self.tokens[0])
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'MISS')
+        self.assertEqual(third['X-Cache'], 'HIT')
+
+    def test_cache_does_not_bypass_authentication(self):
+        self.get(f'{self.URL}?at=2021-06-25T04:00:00', self.tokens[0])
+        self.client.credentials()
+        response = self.client.get(f'{self.URL}?at=2021-06-25T04:00:00', format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_browsable_api_is_not_cached(self):
+        users = [User.objects.create_user(username) for username in ('alice_secret', 'bob')]
+        responses = []
+        for user in users:
+            self.client.force_authenticate(user)
+            responses.append(self.client.get(f'{self.URL}3000?at=2021-06-25T04:00:00', HTTP_ACCEPT='text/html'))
+        self.client.force_authenticate(None)
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Cache', response)
+        self.assertNotIn(b'alice_secret', responses[1].content)
+        self.assertEqual(self.get(f'{self.URL}3000?at=2021-06-25T04:00:00', self.tokens[0])['X-Cache'], 'MISS')
+
+    def test_errors_are_not_cached(self):
+        Weather.objects.all().delete()
+        self.assertEqual(self.get(f'{self.URL}?at=2021-06-25T04:00:00', self.tokens[0]).status_code, 404)
+        Weather.objects.create(at=self.at, document={'dummy': 'document'})
+        self.assertEqual(self.get(f'{self.URL}?at=2021-06-25T04:00:00', self.tokens[0]).status_code, 200)
+
+    def test_stats(self):
+        self.get(f'{self.URL}?at=2021-06-25T04:00:00', self.tokens[0])
+        self.get(f'{self.URL}?at=2021-06-25T04:00:00', self.tokens[1])
+        response = self.get(self.STATS_URL, self.tokens[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'hits': 1, 'misses': 1})
+
+
+class TestCompressedResponses(APITestCase):
+
+    URL = '/api/v1/stations/'
+
+    @classmethod
+    def setUpTestData(cls):
+        at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        with open('stations/tests/indego_sample.json') as f:
+            for feature in json.load(f)['features']:
+                Station.objects.create(kioskId=feature['properties']['kioskId'], at=at, document=feature)
+        Weather.objects.create(at=at, document={'dummy': 'document'})
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
+
+    def get(self, url, accept_encoding=None):
+        headers = {} if accept_encoding is None else {'HTTP_ACCEPT_ENCODING': accept_encoding}
+        return self.client.get(url, format='json', **headers)
+
+    def test_list_retrieve_compressed(self):
+        plain = self.get(f'{self.URL}?at=2021-06-25T04:00:00')
+        gzipped = self.get(f'{self.URL}?at=2021-06-25T04:00:00', 'gzip')
+        brotlied = self.get(f'{self.URL}?at=2021-06-25T04:00:00', 'gzip, deflate, br')
+
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+        self.assertEqual(brotlied['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(brotlied.content), plain.content)
+        self.assertLess(len(brotlied.content), len(plain.content))
+        for response in (plain, gzipped, brotlied):
+            self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_list_retrieve_compressed_once(self):
+        with mock.patch.dict(response_cache.COMPRESSORS, gzip=mock.Mock(wraps=response_cache.COMPRESSORS['gzip'])):
+            miss = self.get(f'{self.URL}?at=2021-06-25T04:00:00', 'gzip')
+            hit = self.get(f'{self.URL}?at=2021-06-25T04:00:00', 'gzip')
+            self.assertEqual(response_cache.COMPRESSORS['gzip'].call_count, 1)
+        self.assertEqual(miss['X-Cache'], 'MISS')
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertEqual(miss.content, hit.content)
+
+    def test_list_retrieve_compressed_in_negotiated_encoding_only(self):
+        compressors = {encoding: mock.Mock(wraps=compressor)
+                       for encoding, compressor in response_cache.COMPRESSORS.items()}
+        with mock.patch.dict(response_cache.COMPRESSORS, compressors):
+            plain = self.get(f'{self.URL}?at=2021-06-25T04:00:00')
+            self.assertEqual([compressor.call_count for compressor in compressors.values()], [0, 0])
+            gzipped = self.get(f'{self.URL}?at=2021-06-25T04:00:00', 'gzip')
+            self.get(f'{self.URL}?at=2021-06-25T04:00:00', 'gzip')
+            self.assertEqual((compressors['br'].call_count, compressors['gzip'].call_count), (0, 1))
+        self.assertEqual(gzipped['X-Cache'], 'HIT')
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+
+    def test_retrieve_small_body_not_compressed(self):
+        response = self.get(f'{self.URL}3004?at=2021-06-25T04:00:00&fields=properties.kioskId', 'gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_errors_not_compressed(self):
+        response = self.get(f'{self.URL}9999?at=2021-06-25T04:00:00', 'gzip')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('Content-Encoding', response)
+
+
+class TestConditionalGet(APITestCase):
+
+    URL = '/api/v1/stations/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        with open('stations/tests/indego_sample.json') as f:
+            for feature in json.load(f)['features']:
+                Station.objects.create(kioskId=feature['properties']['kioskId'], at=cls.at, document=feature)
+        Weather.objects.create(at=cls.at, document={'dummy': 'document'})
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
+        # downsampled by retention, and far from its horizon
+        now_patcher = mock.patch('django.utils.timezone.now', return_value=self.at + timedelta(days=30))
+        now_patcher.start()
+        self.addCleanup(now_patcher.stop)
+
+    def get(self, url, **headers):
+        return self.client.get(url, format='json', **headers)
+
+    def test_validators(self):
+        for url in [f'{self.URL}?at=2021-06-25T04:00:00', f'{self.URL}3004?at=2021-06-25T04:00:00']:
+            miss = self.get(url)
+            hit = self.get(url)
+            self.assertEqual(miss.status_code, 200)
+            self.assertEqual(miss['ETag'], hit['ETag'])
+            self.assertTrue(miss['ETag'].startswith('"'))
+            self.assertEqual(miss['Last-Modified'], 'Fri, 25 Jun 2021 20:00:00 GMT')
+            self.assertEqual(miss['Cache-Control'], 'private, max-age=86400, immutable')
+            self.assertEqual(hit['Cache-Control'], miss['Cache-Control'])
+
+    def test_recent_snapshot_revalidated(self):
+        # still inside the full resolution tier of retention
+        with mock.patch('django.utils.timezone.now', return_value=self.at + timedelta(days=1)):
+            miss = self.get(f'{self.URL}3004?at=2021-06-25T04:00:00')
+            hit = self.get(f'{self.URL}3004?at=2021-06-25T04:00:00')
+        for response in (miss, hit):
+            self.assertEqual(response['Cache-Control'], 'private, no-cache')
+            self.assertIn('ETag', response)
+
+    def test_unthinned_bucket_revalidated(self):
+        # another tick of the same hour, left for the next retention run to delete
+        Station.objects.create(kioskId=3004, at=self.at + timedelta(minutes=5), document={'dummy': 'document'})
+        for url in [f'{self.URL}?at=2021-06-25T19:58:00', f'{self.URL}3004?at=2021-06-25T19:58:00']:
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    def test_snapshot_near_horizon_revalidated(self):
+        with mock.patch('django.utils.timezone.now', return_value=self.at + timedelta(days=365) - timedelta(hours=1)):
+            response = self.get(f'{self.URL}3004?at=2021-06-25T04:00:00')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    def test_etag_per_representation(self):
+        etags = {self.get(url, **headers)['ETag'] for url, headers in [
+            (f'{self.URL}?at=2021-06-25T04:00:00', {}),
+            (f'{self.URL}?at=2021-06-25T04:00:00', {'HTTP_ACCEPT_ENCODING': 'br'}),
+            (f'{self.URL}?at=2021-06-25T04:00:00&fields=properties.kioskId', {}),
+            (f'{self.URL}3004?at=2021-06-25T04:00:00', {}),
+            (f'{self.URL}3005?at=2021-06-25T04:00:00', {}),
+        ]}
+        self.assertEqual(len(etags), 5)
+        # the same snapshot, resolved from another time
+        self.assertIn(self.get(f'{self.URL}?at=2021-06-25T19:59:59')['ETag'], etags)
+
+    def test_if_none_match(self):
+        for url in [f'{self.URL}?at=2021-06-25T04:00:00', f'{self.URL}3004?at=2021-06-25T04:00:00']:
+            etag = self.get(url)['ETag']
+            cache.clear()
+            with mock.patch.object(response_cache, 'cache') as cache_mock:
+                response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+            cache_mock.get.assert_not_called()
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response['Cache-Control'], 'private, max-age=86400, immutable')
+
+            self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_if_modified_since(self):
+        url = f'{self.URL}3004?at=2021-06-25T04:00:00'
+        self.assertEqual(self.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 25 Jun 2021 20:00:00 GMT').status_code, 304)
+        self.assertEqual(self.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 25 Jun 2021 19:59:59 GMT').status_code, 200)
+        # If-None-Match takes precedence
+        self.assertEqual(self.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 25 Jun 2021 20:00:00 GMT',
+                                  HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_errors_without_validators(self):
+        for url in [f'{self.URL}9999?at=2021-06-25T04:00:00', f'{self.URL}?at=2021-06-26T04:00:00']:
+            response = self.get(url)
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn('ETag', response)
+            self.assertNotIn('Cache-Control', response)
+
+    def test_without_token(self):
+        etag = self.get(f'{self.URL}?at=2021-06-25T04:00:00')['ETag']
+        self.client.credentials()
+        self.assertEqual(self.get(f'{self.URL}?at=2021-06-25T04:00:00', HTTP_IF_NONE_MATCH=etag).status_code, 401)
+
+
+@override_settings(STATION_READ_BACKEND='pymongo')
+class TestStationListRetrieveAPIViewPyMongo(TestStationListRetrieveAPIView):
+    pass
+
+
+@override_settings(STATION_READ_BACKEND='pymongo')
+class TestStationListRetrieveAPIViewWhenNoWeatherPyMongo(TestStationListRetrieveAPIViewWhenNoWeather):
+    pass
+
+
+@override_settings(STATION_READ_BACKEND='pymongo')
+class TestStationRetrieveAPIViewPyMongo(TestStationRetrieveAPIView):
+    pass
+
+
+@override_settings(STATION_READ_BACKEND='pymongo')
+class TestStationRetrieveAPIViewWhenNoWeatherPyMongo(TestStationRetrieveAPIViewWhenNoWeather):
+    pass
+
+
+@override_settings(STATION_READ_BACKEND='pymongo')
+class TestPrerenderedResponsesPyMongo(TestPrerenderedResponses):
+    pass
+
+
+class TestStreamingStationList(APITestCase):
+
+    URL = '/api/v1/stations/'
+
+    @classmethod
+    def setUpTestData(cls):
+        at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        with open('stations/tests/indego_sample.json') as f:
+            for feature in json.load(f)['features']:
+                Station.objects.create(kioskId=feature['properties']['kioskId'], at=at, document=feature)
+        with open('weathers/tests/openweatherapi_sample.json') as f:
+            Weather.objects.create(at=at, document=json.load(f))
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
+
+    def get_both(self):
+        with override_settings(STATION_LIST_STREAMING=True, STATION_PRERENDERED_RESPONSES=False):
+            streamed = self.client.get(f'{self.URL}?at=2021-06-25T04:00:00', format='json')
+        with override_settings(STATION_LIST_STREAMING=False, STATION_PRERENDERED_RESPONSES=False):
+            serialized = self.client.get(f'{self.URL}?at=2021-06-25T04:00:00', format='json')
+        return streamed, serialized
+
+    def test_list_retrieve_identical(self):
+        streamed, serialized = self.get_both()
+        self.assertEqual(streamed.status_code, 200)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(b''.join(streamed.streaming_content), serialized.content)
+        self.assertEqual(streamed['Content-Type'], serialized['Content-Type'])
+
+    def test_streamed_response_is_not_cached(self):
+        streamed, serialized = self.get_both()
+        self.assertEqual(serialized['X-Cache'], 'MISS')
+
+    @override_settings(STATION_LIST_STREAMING=True, STATION_PRERENDERED_RESPONSES=False)
+    def test_list_retrieve_404_when_no_weather(self):
+        Weather.objects.all().delete()
+        response = self.client.get(f'{self.URL}?at=2021-06-25T04:00:00', format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['error_code'], 1003)
+
+
+@override_settings(STATION_READ_BACKEND='pymongo')
+class TestStreamingStationListPyMongo(TestStreamingStationList):
+    pass
+
+
+class TestStationHistoryAPIView(APITestCase):
+
+    URL = '/api/v1/stations/3000/history'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ats = [datetime(2021, 6, 25, 20, minute, 0, tzinfo=tz.tzutc()) for minute in range(0, 50, 10)]
+        for at in cls.ats:
+            Station.objects.create(kioskId=3000, at=at, document={'kioskId': 3000, 'at': at.isoformat()})
+            Station.objects.create(kioskId=3001, at=at, document={'kioskId': 3001, 'at': at.isoformat()})
+        for at in cls.ats[:-1]:
+            Weather.objects.create(at=at, document={'at': at.isoformat()})
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
+
+    def get(self, query):
+        return self.client.get(f'{self.URL}?{query}', format='json')
+
+    def test_history(self):
+        response = self.get('from=2021-06-25T20:00:00&to=2021-06-25T20:30:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual([point['station']['at'] for point in response.data['results']],
+                         [at.isoformat() for at in self.ats[:4]])
+        self.assertEqual([point['weather'] for point in response.data['results']],
+                         [{'at': at.isoformat()} for at in self.ats[:4]])
+
+    def test_history_without_weather(self):
+        response = self.get('from=2021-06-25T20:35:00&to=2021-06-25T21:00:00')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['results'][0]['weather'])
+
+    def test_history_step(self):
+        response = self.get('from=2021-06-25T20:00:00&to=2021-06-25T21:00:00&step=1200')
+        self.assertEqual([point['station']['at'] for point in response.data['results']],
+                         [self.ats[0].isoformat(), self.ats[2].isoformat(), self.ats[4].isoformat()])
+
+    def test_history_pagination(self):
+        response = self.get('from=2021-06-25T20:00:00&to=2021-06-25T21:00:00&limit=2')
+        results = response.data['results']
+        while response.data['next']:
+            response = self.client.get(response.data['next'], format='json')
+            self.assertLessEqual(len(response.data['results']), 2)
+            results += response.data['results']
+        self.assertEqual([point['station']['at'] for point in results], [at.isoformat() for at in self.ats])
+
+    def test_history_pagination_with_step(self):
+        response = self.get('from=2021-06-25T20:00:00&to=2021-06-25T21:00:00&limit=1&step=1200')
+        results = response.data['results']
+        while response.data['next']:
+            response = self.client.get(response.data['next'], format='json')
+            results += response.data['results']
+        self.assertEqual([point['station']['at'] for point in results],
+                         [self.ats[0].isoformat(), self.ats[2].isoformat(), self.ats[4].isoformat()])
+
+    def test_history_empty(self):
+        response = self.get('from=2021-06-26T20:00:00&to=2021-06-26T21:00:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_history_400_when_invalid_range(self):
+        for query in ['', 'from=2021-06-25T20:00:00', 'from=invalid&to=2021-06-25T20:00:00',
+                      'from=2021-06-25T21:00:00&to=2021-06-25T20:00:00',
+                      'from=2021-06-25T20:00:00&to=2021-06-25T21:00:00&step=-1',
+                      'from=2021-06-25T20:00:00&to=2021-06-25T21:00:00&limit=0']:
+            response = self.get(query)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error_code'], 1004)
+
+    def test_history_400_when_invalid_cursor(self):
+        response = self.get('from=2021-06-25T20:00:00&to=2021-06-25T21:00:00&cursor=invalid')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_code'], 1005)
+
+    def test_history_400_when_invalid_kioskId(self):
+        response = self.client.get('/api/v1/stations/abc/history?from=2021-06-25T20:00:00&to=2021-06-25T21:00:00',
+                                   format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_code'], 1007)
+
+
+@override_settings(STATION_READ_BACKEND='pymongo')
+class TestStationHistoryAPIViewPyMongo(TestStationHistoryAPIView):
+    pass
+
+
+@override_settings(STATION_STORAGE_MODE='normalized')
+class TestStationHistoryAPIViewNormalizedMode(TestStationHistoryAPIView):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ats = [datetime(2021, 6, 25, 20, minute, 0, tzinfo=tz.tzutc()) for minute in range(0, 50, 10)]
+        StationNormalizedRepository().create([
+            {'kioskId': kioskId, 'at': at, 'document': {'kioskId': kioskId, 'at': at.isoformat()}}
+            for at in cls.ats for kioskId in (3000, 3001)])
+        for at in cls.ats[:-1]:
+            Weather.objects.create(at=at, document={'at': at.isoformat()})
+
+
+@override_settings(STATION_STORAGE_MODE='delta')
+class TestStationHistoryAPIViewDeltaMode(TestStationHistoryAPIView):
+
+    @classmethod
+    def setUpTestData(cls):
+        StationDeltaRepository._latest = None
+        cls.ats = [datetime(2021, 6, 25, 20, minute, 0, tzinfo=tz.tzutc()) for minute in range(0, 50, 10)]
+        StationDeltaRepository().create([
+            {'kioskId': kioskId, 'at': at, 'document': {'kioskId': kioskId, 'at': at.isoformat()}}
+            for at in cls.ats for kioskId in (3000, 3001)])
+        for at in cls.ats[:-1]:
+            Weather.objects.create(at=at, document={'at': at.isoformat()})
+
+
+@override_settings(STATION_STORAGE_MODE='snapshot')
+class TestStationHistoryAPIViewSnapshotMode(TestStationHistoryAPIView):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ats = [datetime(2021, 6, 25, 20, minute, 0, tzinfo=tz.tzutc()) for minute in range(0, 50, 10)]
+        for at in cls.ats:
+            StationSnapshot.objects.create(at=at, stations={
+                '3000': {'kioskId': 3000, 'at': at.isoformat()},
+                '3001': {'kioskId': 3001, 'at': at.isoformat()},
+            })
+        for at in cls.ats[:-1]:
+            Weather.objects.create(at=at, document={'at': at.isoformat()})
+
+
+class TestFieldProjection(APITestCase):
+
+    URL = '/api/v1/stations/'
+    FIELDS = 'properties.kioskId,properties.bikesAvailable'
+
+    @classmethod
+    def setUpTestData(cls):
+        at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        with open('stations/tests/indego_sample.json') as f:
+            cls.features = json.load(f)['features']
+        for feature in cls.features:
+            Station.objects.create(kioskId=feature['properties']['kioskId'], at=at, document=feature)
+        Weather.objects.create(at=at, document={'dummy': 'document'})
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
+
+    def projected(self, feature):
+        return {'properties': {'kioskId': feature['properties']['kioskId'],
+                               'bikesAvailable': feature['properties']['bikesAvailable']}}
+
+    def test_list_retrieve_fields(self):
+        response = self.client.get(f'{self.URL}?at=2021-06-25T04:00:00&fields={self.FIELDS}', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['stations'], key=lambda station: station['properties']['kioskId']),
+                         [self.projected(feature) for feature in self.features])
+        self.assertEqual(response.data['weather'], {'dummy': 'document'})
+
+    @override_settings(STATION_LIST_STREAMING=True)
+    def test_list_retrieve_fields_streamed(self):
+        response = self.client.get(f'{self.URL}?at=2021-06-25T04:00:00&fields={self.FIELDS}', format='json')
+        stations = json.loads(b''.join(response.streaming_content))['stations']
+        self.assertEqual(sorted(stations, key=lambda station: station['properties']['kioskId']),
+                         [self.projected(feature) for feature in self.features])
+
+    def test_retrieve_fields(self):
+        response = self.client.get(f'{self.URL}3005?at=2021-06-25T04:00:00&fields={self.FIELDS}', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['station'], self.projected(self.features[1]))
+
+    def test_retrieve_nested_fields_collapsed(self):
+        response = self.client.get(f'{self.URL}3005?at=2021-06-25T04:00:00&fields=geometry,geometry.type,type',
+                                   format='json')
+        self.assertEqual(response.data['station'], {'geometry': self.features[1]['geometry'], 'type': 'Feature'})
+
+    def test_fields_in_cache_key(self):
+        first = self.client.get(f'{self.URL}?at=2021-06-25T04:00:00', format='json')
+        second = self.client.get(f'{self.URL}?at=2021-06-25T04:00:00&fields={self.FIELDS}', format='json')
+        third = self.client.get(f'{self.URL}?at=2021-06-25T04:00:00&fields=properties.bikesAvailable,'
+                                'properties.kioskId', format='json')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'MISS')
+        self.assertEqual(third['X-Cache'], 'HIT')
+        self.assertLess(len(second.content) * 5, len(first.content))
+
+    def test_400_when_invalid_fields(self):
+        for fields in ['', 'properties.', 'properties..kioskId', '$where', 'properties.kioskId,']:
+            response = self.client.get(f'{self.URL}3005?at=2021-06-25T04:00:00&fields={fields}', format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error_code'], 1008)
+
+
+@override_settings(STATION_READ_BACKEND='pymongo')
+class TestFieldProjectionPyMongo(TestFieldProjection):
+    pass
+
+
+@override_settings(STATION_STORAGE_MODE='snapshot')
+class TestFieldProjectionSnapshotMode(TestFieldProjection):
+
+    @classmethod
+    def setUpTestData(cls):
+        at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        with open('stations/tests/indego_sample.json') as f:
+            cls.features = json.load(f)['features']
+        StationSnapshot.objects.create(at=at, stations={
+            str(feature['properties']['kioskId']): feature for feature in cls.features})
+        Weather.objects.create(at=at, document={'dummy': 'document'})
+
+
+@override_settings(STATION_STORAGE_MODE='normalized')
+class TestFieldProjectionNormalizedMode(TestFieldProjection):
+
+    @classmethod
+    def setUpTestData(cls):
+        at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        with open('stations/tests/indego_sample.json') as f:
+            cls.features = json.load(f)['features']
+        StationNormalizedRepository().create([
+            {'kioskId': feature['properties']['kioskId'], 'at': at, 'document': feature} for feature in cls.features])
+        Weather.objects.create(at=at, document={'dummy': 'document'})
+
+
+@override_settings(STATION_STORAGE_MODE='delta')
+class TestFieldProjectionDeltaMode(TestFieldProjection):
+
+    @classmethod
+    def setUpTestData(cls):
+        StationDeltaRepository._latest = None
+        at = datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc())
+        with open('stations/tests/indego_sample.json') as f:
+            cls.features = json.load(f)['features']
+        StationDeltaRepository().create([
+            {'kioskId': feature['properties']['kioskId'], 'at': at, 'document': feature} for feature in cls.features])
+        Weather.objects.create(at=at, document={'dummy': 'document'})
+
+
+class TestStationBatchAPIView(APITestCase):
+
+    URL = '/api/v1/stations-batch'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ats = [datetime(2021, 6, 25, 20, 0, 0, tzinfo=tz.tzutc()),
+                   datetime(2021, 6, 25, 20, 10, 0, tzinfo=tz.tzutc())]
+        with open('stations/tests/indego_sample.json') as f:
+            cls.features = json.load(f)['features']
+        # 3006 is missing from the second snapshot
+        cls.store(cls.ats[0], cls.features)
+        cls.store(cls.ats[1], cls.features[:2])
+        for at in cls.ats:
+            Weather.objects.create(at=at, document={'at': at.isoformat()})
+
+    @classmethod
+    def store(cls, at, features):
+        for feature in features:
+            Station.objects.create(kioskId=feature['properties']['kioskId'], at=at, document=feature)
+
+    def setUp(self):
+        cache.clear()
+        timeline.reset_indexes()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + create_token())
+
+    def get(self, query):
+        return self.client.get(f'{self.URL}?{query}', format='json')
+
+    def test_batch(self):
+        response = self.get('kioskIds=3005,3004,3006&at=2021-06-25T19:00:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['at'], self.ats[0])
+        self.assertEqual(list(response.data['stations']), ['3005', '3004', '3006'])
+        self.assertEqual(response.data['stations']['3004'], self.features[0])
+        self.assertEqual(response.data['stations']['3006'], self.features[2])
+        self.assertEqual(response.data['weather'], {'at': self.ats[0].isoformat()})
+
+    def test_same_as_single_station(self):
+        batch = self.get('kioskIds=3004,3005&at=2021-06-25T19:00:00').data
+        for kioskId in ('3004', '3005'):
+            single = self.client.get(f'/api/v1/stations/{kioskId}?at=2021-06-25T19:00:00', format='json').data
+            self.assertEqual(batch['stations'][kioskId], single['station'])
+            self.assertEqual(batch['weather'], single['weather'])
+
+    def test_not_found_entries(self):
+        response = self.get('kioskIds=3004,3006,9999&at=2021-06-25T20:05:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['at'], self.ats[1])
+        self.assertEqual(response.data['stations']['3004'], self.features[0])
+        for kioskId in ('3006', '9999'):
+            self.assertEqual(response.data['stations'][kioskId], {'error_code': 1002, 'message': 'Station not found'})
+
+    def test_fields(self):
+        response = self.get('kioskIds=3004,3005&at=2021-06-25T19:00:00&fields=properties.bikesAvailable')
+        self.assertEqual(response.data['stations'], {
+            str(feature['properties']['kioskId']): {'properties': {
+                'bikesAvailable': feature['properties']['bikesAvailable']}}
+            for feature in self.features[:2]})
+
+    def test_duplicated_kioskIds(self):
+        response = self.get('kioskIds=3004,3004&at=2021-06-25T19:00:00')
+        self.assertEqual(list(response.data['stations']), ['3004'])
+
+    def test_cached_and_conditional(self):
+        miss = self.get('kioskIds=3004,3005&at=2021-06-25T19:00:00')
+        hit = self.get('kioskIds=3004,3005&at=2021-06-25T19:00:00')
+        other = self.get('kioskIds=3005,3004&at=2021-06-25T19:00:00')
+        self.assertEqual((miss['X-Cache'], hit['X-Cache'], other['X-Cache']), ('MISS', 'HIT', 'MISS'))
+        self.assertEqual(miss.content, hit.content)
+        self.assertNotEqual(miss['ETag'], other['ETag'])
+        response = self.client.get(f'{self.URL}?kioskIds=3004,3005&at=2021-06-25T19:00:00', format='json',
+                                   HTTP_IF_NONE_MATCH=miss['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_shared_with_single_station(self):
+        single = self.client.get('/api/v1/stations/3004?at=2021-06-25T19:00:00', format='json')
+        batch = self.get('kioskIds=3004&at=2021-06-25T19:00:00')
+        self.assertEqual((single['X-Cache'], batch['X-Cache']), ('MISS', 'MISS'))
+        self.assertNotEqual(single['ETag'], batch['ETag'])
+        self.assertEqual(list(json.loads(batch.content)['stations']), ['3004'])
+
+    def test_404_when_no_snapshot(self):
+        response = self.get('kioskIds=3004&at=2021-06-26T00:00:00')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['error_code'], 1002)
+
+    def test_400_when_invalid_kioskIds(self):
+        for query in ['at=2021-06-25T19:00:00', 'kioskIds=&at=2021-06-25T19:00:00',
+                      'kioskIds=3004,&at=2021-06-25T19:00:00', 'kioskIds=3004,abc&at=2021-06-25T19:00:00',
+                      'kioskIds=-3004&at=2021-06-25T19:00:00',
+                      'kioskIds=' + ','.join(str(3000 + index) for index in range(101)) + '&at=2021-06-25T19:00:00']:
+            response = self.get(query)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error_code'], 1010)
+
+    def test_400_when_no_at(self):
+        response = self.get('kioskIds=3004')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_code'], 1000)
+
+
+@override_settings(STATION_READ_BACKEND='pymongo')
+class TestStationBatchAPIViewPyMongo(TestStationBatchAPIView):
+    pass
+
+
+@override_settings(STATION_STORAGE_MODE='snapshot')
+class TestStationBatchAPIViewSnapshotMode(TestStationBatchAPIView):
+
+    @classmethod
+    def store(cls, at, features):
+        StationSnapshot.objects.create(at=at, stations={
+            str(feature['properties']['kioskId']): feature for feature in features})
+
+
+@override_settings(STATION_STORAGE_MODE='normalized')
+class TestStationBatchAPIViewNormalizedMode(TestStationBatchAPIView):
+
+    @classmethod
+    def store(cls, at, features):
+        StationNormalizedRepository().create([
+            {'kioskId': feature['properties']['kioskId'], 'at': at, 'document': feature} for feature in features])
+
+
+@override_settings(STATION_STORAGE_MODE='delta')
+class TestStationBatchAPIViewDeltaMode(TestStationBatchAPIView):
+
+    @classmethod
+    def setUpTestData(cls):
+        StationDeltaRepository._latest = None
+        super().setUpTestData()
+
+    @classmethod
+    def store(cls, at, features):
+        StationDeltaRepository().create([
+            {'kioskId': feature['properties']['kioskId'], 'at': at, 'document': feature} for feature in features])
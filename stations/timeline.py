@@ -0,0 +1,174 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from pymongo import ReturnDocument
+
+from common import mongo
+
+# bumped when snapshots are removed, or inserted before known ones, so that every process reloads its index
+GENERATION_COLLECTION = 'station_timeline'
+GENERATION_CHECK_INTERVAL = 60  # seconds
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+class SnapshotIndex:
+    """Process-local sorted array of distinct snapshot timestamps, in epoch milliseconds.
+
+    Loaded lazily from the repository, extended on ingest and on database fallbacks.
+    Timestamps are only ever appended after the known ones by ingests, so a hit is
+    always the same snapshot the database would resolve. Imports and retention change
+    the past and bump the generation, which reloads the index. Retention excludes the
+    snapshots it is about to delete a check interval ahead, so that no index still
+    resolves to them once they are gone.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._millis = None
+        self._generation = None
+
+    def first_on_or_after(self, repository, at):
+        millis = self._current(repository)
+        index = bisect_left(millis, ceil_millis(at))
+        if index < len(millis):
+            return EPOCH + millis[index] * MILLISECOND
+
+        # unknown to this process yet (e.g. ingested by another worker)
+        resolved = repository.first_at(at)
+        if resolved is not None:
+            self.add(resolved)
+        return resolved
+
+    def count(self, repository, start, end) -> int:
+        """Number of snapshots from `start` up to `end` excluded."""
+        millis = self._current(repository)
+        return bisect_left(millis, ceil_millis(end)) - bisect_left(millis, ceil_millis(start))
+
+    def add(self, at):
+        value = ceil_millis(at)
+        with self._lock:
+            if self._millis is None:
+                return
+            index = bisect_left(self._millis, value)
+            if index == len(self._millis) or self._millis[index] != value:
+                self._millis.insert(index, value)
+
+    def reset(self):
+        with self._lock:
+            self._millis = None
+
+    def _current(self, repository):
+        current = generation()
+        millis = self._millis
+        if millis is None or self._generation != current:
+            millis = self._load(repository, current)
+        return millis
+
+    def _load(self, repository, current):
+        millis = array('q', sorted({ceil_millis(at) for at in repository.all_ats()} - _generation['excluded']))
+        with self._lock:
+            if self._millis is None or self._generation != current:
+                self._millis = millis
+                self._generation = current
+            return self._millis
+
+
+_indexes = {}
+
+
+def get_index(repository) -> SnapshotIndex:
+    # one index per storage mode, as each mode has its own collection
+    return _indexes.setdefault(type(repository).__name__, SnapshotIndex())
+
+
+def reset_indexes():
+    for index in _indexes.values():
+        index.reset()
+    with _kiosk_lock:
+        _kiosk_resolutions.clear()
+    _generation['checked_at'] = None
+
+
+_generation = {'value': None, 'checked_at': None, 'excluded': set()}
+
+
+def generation() -> int:
+    # read from MongoDB at most every GENERATION_CHECK_INTERVAL seconds, with the excluded snapshots
+    now = time.monotonic()
+    if _generation['checked_at'] is None or now - _generation['checked_at'] >= GENERATION_CHECK_INTERVAL:
+        _set_generation(mongo.get_database()[GENERATION_COLLECTION].find_one({'_id': 'generation'}))
+    return _generation['value']
+
+
+def bump_generation():
+    _update_generation({'$inc': {'value': 1}})
+
+
+def exclude_ats(ats):
+    """Leaves `ats` out of the index of every process from its next generation check on, ahead of their deletion."""
+    _update_generation({'$inc': {'value': 1}, '$addToSet': {'excluded': {'$each': [ceil_millis(at) for at in ats]}}})
+
+
+def release_ats(ats):
+    # once deleted, as they are left out of the repository anyway
+    _update_generation({'$inc': {'value': 1}, '$pull': {'excluded': {'$in': [ceil_millis(at) for at in ats]}}})
+
+
+def _update_generation(update):
+    _set_generation(mongo.get_database()[GENERATION_COLLECTION].find_one_and_update(
+        {'_id': 'generation'}, update, upsert=True, return_document=ReturnDocument.AFTER))
+
+
+def _set_generation(document):
+    _generation['value'] = 0 if document is None else document['value']
+    _generation['excluded'] = set() if document is None else set(document.get('excluded', []))
+    _generation['checked_at'] = time.monotonic()
+
+
+MAX_KIOSK_RESOLUTIONS = 10000
+_kiosk_lock = threading.Lock()
+_kiosk_resolutions = OrderedDict()
+
+
+def resolve_at(repository, at, kioskId=None):
+    """Canonical snapshot `at` for a requested `at`: the first snapshot on or after it (holding `kioskId`).
+
+    Resolutions go through the in-memory index first. A kiosk may be missing from some snapshots,
+    so kiosk resolutions then hit the database from the resolved snapshot, memoized per generation
+    in a process-local LRU keyed on that snapshot, so that any number of requested times costs
+    one query per snapshot: a found snapshot can never be superseded by a later ingest.
+    """
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+    snapshot_at = get_index(repository).first_on_or_after(repository, at)
+    if kioskId is None or snapshot_at is None:
+        return snapshot_at
+
+    key = (type(repository).__name__, generation(), snapshot_at, int(kioskId))
+    with _kiosk_lock:
+        if key in _kiosk_resolutions:
+            _kiosk_resolutions.move_to_end(key)
+            return _kiosk_resolutions[key]
+
+    resolved = repository.first_station_at(kioskId, snapshot_at)
+    while resolved is not None and ceil_millis(resolved) in _generation['excluded']:
+        resolved = repository.first_station_at(kioskId, resolved + MILLISECOND)
+    if resolved is not None:
+        with _kiosk_lock:
+            _kiosk_resolutions[key] = resolved
+            while len(_kiosk_resolutions) > MAX_KIOSK_RESOLUTIONS:
+                _kiosk_resolutions.popitem(last=False)
+    return resolved
+
+
+def ceil_millis(at) -> int:
+    # ms precision as stored by MongoDB, rounded up so that it never precedes `at`
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+    return -((EPOCH - at) // MILLISECOND)
@@ -1,18 +1,21 @@
-from datetime import datetime
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_headers
+import re
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from rest_framework import status, views
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
 
-from common import utils, errors
-from .models import Station
-from .serializers import StationListSerializer
-from .station_weather_serializers import StationListWeatherSerializer, StationWeatherSerializer
-from weathers.models import Weather
+from common import mongo, timing, utils, errors
+from . import export, nearby, pagination, prerender, response_cache, rollups, streaming, timeline
+from .repositories import get_station_repository
+from .serializers import StationListSerializer, StationNearbySerializer, StationRollupSerializer
+from .station_weather_serializers import (
+    StationBatchWeatherSerializer, StationHistorySerializer, StationListWeatherSerializer, StationWeatherSerializer)
 from weathers.serializers import WeatherSerializer
 
 
@@ -32,14 +35,16 @@ class StationCreateAPIView(views.APIView):
         })
     def post(self, request, *args, **kwargs):
         now = datetime.now()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)  # MongoDB keeps milliseconds only
+
+        with timing.phase('fetch'):
+            station_json, weather_json = utils.call_indego_station_and_openweathermap_apis()
 
-        station_json = utils.call_indego_station_api()
         station_list_data = [{'at': now, 'kioskId': feature['properties']['kioskId'], 'document': feature}
                              for feature in station_json['features']]
         station_list_serializer = StationListSerializer(data=station_list_data)
         station_list_serializer.is_valid(raise_exception=True)
 
-        weather_json = utils.call_openweathermap_api()
         weather_data = {'at': now, 'document': weather_json}
         weather_serializer = WeatherSerializer(data=weather_data)
         weather_serializer.is_valid(raise_exception=True)
@@ -48,9 +53,18 @@ class StationCreateAPIView(views.APIView):
         station_list_serializer.save()
         weather_serializer.save()
 
+        rollups.update_rollups(mongo.get_database(), station_list_serializer.validated_data)
+        timeline.get_index(get_station_repository()).add(weather_serializer.validated_data['at'])
+        if settings.STATION_PRERENDERED_RESPONSES:
+            prerender.render_snapshot(weather_serializer.validated_data['at'])
+
         return Response(status=status.HTTP_201_CREATED)
 
 
+STATION_HISTORY_MAX_LIMIT = 1000
+FIELD_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*')
+
+
 def get_at_or_raise(query_params: dict) -> str:
     if 'at' not in query_params:
         raise errors.NoAtError()
@@ -64,6 +78,35 @@ def get_at_or_raise(query_params: dict) -> str:
     return parsed_at
 
 
+def get_kioskId_or_raise(kioskId: str) -> int:
+    # the path converter takes any string, while kioskIds are stored as integers
+    if not kioskId.isdigit():
+        raise errors.InvalidKioskIdError()
+    return int(kioskId)
+
+
+def get_fields_or_raise(query_params: dict) -> list:
+    """Sorted dotted paths of `fields`, without those inside another one, or None when not given."""
+    if 'fields' not in query_params:
+        return None
+    fields = query_params['fields'].split(',')
+    if not all(FIELD_PATTERN.fullmatch(field) for field in fields):
+        raise errors.InvalidFieldsError()
+
+    # MongoDB rejects a projection of both a path and one of its descendants
+    projected = []
+    for field in sorted(set(fields)):
+        if not projected or not field.startswith(projected[-1] + '.'):
+            projected.append(field)
+    return projected
+
+
+FIELDS_PARAMETER = OpenApiParameter(
+    name='fields', required=False, type=str,
+    description=('Comma separated paths of the station document to return, the rest being left out '
+                 '(e.g. properties.kioskId,properties.bikesAvailable)'))
+
+
 class StationListRetrieveAPIView(views.APIView):
 
     permission_classes = (IsAuthenticated, )
@@ -78,35 +121,53 @@ class StationListRetrieveAPIView(views.APIView):
         parameters=[
             OpenApiParameter(
                 name='at', description='Specific Datetime (e.g. 2019-09-01T10:00:00)', required=True,
-                type=str), ],
+                type=str),
+            FIELDS_PARAMETER, ],
         responses={
             200: StationListWeatherSerializer,
             400: OpenApiResponse('400', description=('When no or invalid *at* query parameter.<br>'
-                                                     '**[error_code]** 1000: No *at* query param, 1001: Invalid *at* format')),  # noqa
+                                                     '**[error_code]** 1000: No *at* query param, 1001: Invalid *at* format, '  # noqa
+                                                     '1008: Invalid *fields*')),
             404: OpenApiResponse('404', description=('When no stations or no weather for requested *at*.<br>'
                                                      '**[error_code]** 1002: No stations, 1003: No weather'))
         })
-    @method_decorator(cache_page(60*60*24))
-    @method_decorator(vary_on_headers("Authorization",))
     def get(self, request, *args, **kwargs):
         query_at = get_at_or_raise(request.query_params)
+        fields = get_fields_or_raise(request.query_params)
 
-        first_station = Station.objects.filter(at__gte=query_at).order_by('at').first()
-        if first_station is None:
+        repository = get_station_repository()
+        with timing.phase('resolve'):
+            first_at = timeline.resolve_at(repository, query_at)
+        if first_at is None:
             raise errors.StationNotFoundError()
 
-        stations = Station.objects.filter(at=first_station.at)
-        weather = Weather.objects.filter(at=first_station.at).first()
+        return response_cache.get_or_build(
+            request, response_cache.make_key(request, first_at, fields=fields),
+            lambda: self.build_response(request, repository, first_at, fields), at=first_at)
+
+    def build_response(self, request, repository, first_at, fields=None):
+        if fields is None and prerender.accepts_rendered_response(request):
+            response = prerender.rendered_stations_response(first_at)
+            if response is not None:
+                return response
+
+        weather = repository.weather_at(first_at)
         if weather is None:
             raise errors.WeatherNotFoundError()
 
+        if streaming.accepts_streaming_response(request):
+            return streaming.station_list_response(first_at, repository.iter_stations_at(first_at, fields), weather)
+
+        stations = repository.stations_at(first_at, fields)
         serializer = StationListWeatherSerializer({
-            'at': first_station.at,
+            'at': first_at,
             'stations': stations,
             'weather': weather,
         })
+        with timing.phase('serialize'):
+            data = serializer.data
 
-        return Response(serializer.data, status.HTTP_200_OK)
+        return Response(data, status.HTTP_200_OK)
 
 
 class StationRetrieveAPIView(views.APIView):
@@ -120,30 +181,356 @@ class StationRetrieveAPIView(views.APIView):
         request=StationWeatherSerializer,
         parameters=[OpenApiParameter(
             name='at', description='Specific Datetime (e.g. 2019-09-01T10:00:00)',
-            required=True, type=str), ],
+            required=True, type=str),
+            FIELDS_PARAMETER, ],
         responses={
             200: StationWeatherSerializer,
             400: OpenApiResponse('400', description=('When no *at* query parameter.<br>'
-                                                     '**[error_code]** 1000: No *at* query param, 1001: Invalid *at* format')),  # noqa
+                                                     '**[error_code]** 1000: No *at* query param, 1001: Invalid *at* format, '  # noqa
+                                                     '1007: Invalid *kioskId*, 1008: Invalid *fields*')),
             404: OpenApiResponse('404', description=('When no stations or no weather for requested *kiosId* and *at*.<br>'  # noqa
                                                      '**[error_code]** 1002: No station, 1003: No weather'))
         })
-    @method_decorator(cache_page(60*60*24))
-    @method_decorator(vary_on_headers("Authorization",))
     def get(self, request, kioskId, *args, **kwargs):
+        kioskId = get_kioskId_or_raise(kioskId)
         query_at = get_at_or_raise(request.query_params)
+        fields = get_fields_or_raise(request.query_params)
+
+        repository = get_station_repository()
+        with timing.phase('resolve'):
+            station_at = timeline.resolve_at(repository, query_at, kioskId)
+        if station_at is None:
+            raise errors.StationNotFoundError()
+
+        return response_cache.get_or_build(
+            request, response_cache.make_key(request, station_at, kioskId, fields),
+            lambda: self.build_response(request, repository, kioskId, station_at, fields), at=station_at)
 
-        station = Station.objects.filter(at__gte=query_at).order_by('at').filter(kioskId=kioskId).first()
+    def build_response(self, request, repository, kioskId, station_at, fields=None):
+        if fields is None and prerender.accepts_rendered_response(request):
+            response = prerender.rendered_station_response(kioskId, station_at)
+            if response is not None:
+                return response
+
+        station = repository.station_on_or_after(kioskId, station_at, fields)
         if station is None:
             raise errors.StationNotFoundError()
-        weather = Weather.objects.filter(at=station.at).first()
+        weather = repository.weather_at(station['at'])
         if weather is None:
             raise errors.WeatherNotFoundError()
 
         serializer = StationWeatherSerializer({
-            'at': station.at,
+            'at': station['at'],
             'station': station,
             'weather': weather,
         })
+        with timing.phase('serialize'):
+            data = serializer.data
+
+        return Response(data, status.HTTP_200_OK)
+
+
+STATION_BATCH_MAX_KIOSKS = 100
+
+
+def get_kioskIds_or_raise(query_params: dict) -> list:
+    """Distinct kioskIds of `kioskIds`, in the requested order."""
+    kioskIds = query_params.get('kioskIds', '').split(',')
+    if not all(kioskId.isdigit() for kioskId in kioskIds):
+        raise errors.InvalidKioskIdsError()
+    kioskIds = list(dict.fromkeys(int(kioskId) for kioskId in kioskIds))
+    if len(kioskIds) > STATION_BATCH_MAX_KIOSKS:
+        raise errors.InvalidKioskIdsError()
+    return kioskIds
+
+
+class StationBatchAPIView(views.APIView):
+
+    permission_classes = (IsAuthenticated, )
+
+    @extend_schema(
+        description=('Snapshot of several stations at a specified time, keyed by kioskId.<br>'
+                     'The snapshot is the first one on or after the requested time, shared by every station '
+                     'and resolved once, so a station missing from it is reported as not found, with the '
+                     'body of a single station request, instead of failing the whole request.'),
+        parameters=[
+            OpenApiParameter(name='kioskIds', required=True, type=str,
+                             description=f'Comma separated kioskIds, up to {STATION_BATCH_MAX_KIOSKS} '
+                                         '(e.g. 3004,3005)'),
+            OpenApiParameter(name='at', description='Specific Datetime (e.g. 2019-09-01T10:00:00)',
+                             required=True, type=str),
+            FIELDS_PARAMETER, ],
+        responses={
+            200: StationBatchWeatherSerializer,
+            400: OpenApiResponse('400', description=('When invalid query parameters.<br>'
+                                                     '**[error_code]** 1000: No *at* query param, 1001: Invalid *at* format, '  # noqa
+                                                     '1008: Invalid *fields*, 1010: Invalid *kioskIds*')),
+            404: OpenApiResponse('404', description=('When no snapshot or no weather for requested *at*.<br>'
+                                                     '**[error_code]** 1002: No stations, 1003: No weather'))
+        })
+    def get(self, request, *args, **kwargs):
+        kioskIds = get_kioskIds_or_raise(request.query_params)
+        query_at = get_at_or_raise(request.query_params)
+        fields = get_fields_or_raise(request.query_params)
+
+        repository = get_station_repository()
+        with timing.phase('resolve'):
+            first_at = timeline.resolve_at(repository, query_at)
+        if first_at is None:
+            raise errors.StationNotFoundError()
+
+        return response_cache.get_or_build(
+            request, response_cache.make_key(request, first_at, ','.join(map(str, kioskIds)), fields),
+            lambda: self.build_response(repository, kioskIds, first_at, fields), at=first_at)
+
+    def build_response(self, repository, kioskIds, first_at, fields=None):
+        weather = repository.weather_at(first_at)
+        if weather is None:
+            raise errors.WeatherNotFoundError()
+
+        found = {station['kioskId']: station for station in repository.stations_of(kioskIds, first_at, fields)}
+        serializer = StationBatchWeatherSerializer({
+            'at': first_at,
+            'stations': {kioskId: found.get(kioskId) for kioskId in kioskIds},
+            'weather': weather,
+        })
+        with timing.phase('serialize'):
+            data = serializer.data
+
+        return Response(data, status.HTTP_200_OK)
+
+
+def get_range_or_raise(query_params: dict) -> tuple:
+    try:
+        from_at = parse_datetime(query_params.get('from', ''))
+        to_at = parse_datetime(query_params.get('to', ''))
+    except ValueError:
+        raise errors.InvalidHistoryRangeError()
+    if from_at is None or to_at is None:
+        raise errors.InvalidHistoryRangeError()
+    from_at, to_at = [timezone.make_aware(at) if timezone.is_naive(at) else at for at in (from_at, to_at)]
+    if from_at > to_at:
+        raise errors.InvalidHistoryRangeError()
+
+    return from_at, to_at
+
+
+class StationHistoryAPIView(views.APIView):
+
+    permission_classes = (IsAuthenticated, )
+
+    @extend_schema(
+        description=('History of one station between two times, with the weather of each point.<br>'
+                     'Points are ordered by time and paginated with an opaque *cursor*; '
+                     '*next* is the link to the following page, or null on the last one.'),
+        parameters=[
+            OpenApiParameter(name='from', description='Start Datetime, inclusive (e.g. 2019-09-01T10:00:00)',
+                             required=True, type=str),
+            OpenApiParameter(name='to', description='End Datetime, inclusive (e.g. 2019-09-01T12:00:00)',
+                             required=True, type=str),
+            OpenApiParameter(name='step', description='Minimum seconds between two points (default: every point)',
+                             required=False, type=int),
+            OpenApiParameter(name='limit', description='Points per page (default and maximum: 1000)',
+                             required=False, type=int),
+            OpenApiParameter(name='cursor', description='Cursor from the *next* link', required=False, type=str),
+        ],
+        responses={
+            200: StationHistorySerializer,
+            400: OpenApiResponse('400', description=('When invalid query parameters.<br>'
+                                                     '**[error_code]** 1004: Invalid *from*, *to* or *step*, '
+                                                     '1005: Invalid *cursor*, 1007: Invalid *kioskId*')),
+        })
+    def get(self, request, kioskId, *args, **kwargs):
+        kioskId = get_kioskId_or_raise(kioskId)
+        from_at, to_at = get_range_or_raise(request.query_params)
+        try:
+            step = timedelta(seconds=int(request.query_params.get('step', 0)))
+            limit = min(int(request.query_params.get('limit', STATION_HISTORY_MAX_LIMIT)), STATION_HISTORY_MAX_LIMIT)
+        except ValueError:
+            raise errors.InvalidHistoryRangeError()
+        if step < timedelta(0) or limit < 1:
+            raise errors.InvalidHistoryRangeError()
+        if pagination.CURSOR_QUERY_PARAM in request.query_params:
+            from_at = pagination.decode_cursor(request.query_params[pagination.CURSOR_QUERY_PARAM])
+
+        # one range scan over (kioskId, at), thinned out to one point per step
+        repository = get_station_repository()
+        stations = []
+        next_from = None
+        for station in repository.station_history(kioskId, from_at, to_at):
+            if station['at'] < from_at:
+                continue
+            if len(stations) == limit:
+                next_from = station['at']
+                break
+            stations.append(station)
+            from_at = station['at'] + max(step, timedelta(milliseconds=1))
+
+        weathers = repository.weathers_at([station['at'] for station in stations])
+        serializer = StationHistorySerializer({
+            'next': pagination.next_link(request, next_from),
+            'results': [
+                {'at': station['at'], 'station': station, 'weather': weathers.get(station['at'])}
+                for station in stations
+            ],
+        })
+
+        return Response(serializer.data, status.HTTP_200_OK)
+
+
+class StationRollupAPIView(views.APIView):
+
+    permission_classes = (IsAuthenticated, )
+
+    @extend_schema(
+        description=('Hourly or daily availability summaries (min, max, mean, sample count) of one station.<br>'
+                     'Buckets start on the hour / at midnight UTC and are updated by every ingest.'),
+        parameters=[
+            OpenApiParameter(name='granularity', description='*hour* or *day*', required=True, type=str),
+            OpenApiParameter(name='from', description='Start Datetime, its bucket included (e.g. 2019-09-01T10:00:00)',
+                             required=True, type=str),
+            OpenApiParameter(name='to', description='End Datetime, inclusive (e.g. 2019-09-02T10:00:00)',
+                             required=True, type=str),
+        ],
+        responses={
+            200: StationRollupSerializer(many=True),
+            400: OpenApiResponse('400', description=('When invalid query parameters.<br>'
+                                                     '**[error_code]** 1004: Invalid *from* or *to*, '
+                                                     '1006: Invalid *granularity*, 1007: Invalid *kioskId*')),
+        })
+    def get(self, request, kioskId, *args, **kwargs):
+        kioskId = get_kioskId_or_raise(kioskId)
+        granularity = request.query_params.get('granularity')
+        if granularity not in rollups.GRANULARITIES:
+            raise errors.InvalidGranularityError()
+        from_at, to_at = get_range_or_raise(request.query_params)
+
+        serializer = StationRollupSerializer(
+            rollups.find_rollups(mongo.get_database(), granularity, kioskId, from_at, to_at), many=True)
 
         return Response(serializer.data, status.HTTP_200_OK)
+
+
+NEARBY_MAX_RADIUS = 5000
+NEARBY_MAX_LIMIT = 100
+
+
+class StationNearbyAPIView(views.APIView):
+
+    permission_classes = (IsAuthenticated, )
+
+    @extend_schema(
+        description=('Stations within *radius* metres of a location in the snapshot at a specified time, '
+                     'nearest first.<br>'
+                     'The snapshot is the first one on or after the requested time.'),
+        parameters=[
+            OpenApiParameter(name='at', description='Specific Datetime (e.g. 2019-09-01T10:00:00)',
+                             required=True, type=str),
+            OpenApiParameter(name='lat', description='Latitude (e.g. 39.9526)', required=True, type=float),
+            OpenApiParameter(name='lon', description='Longitude (e.g. -75.1652)', required=True, type=float),
+            OpenApiParameter(name='radius', description=f'Metres, up to {NEARBY_MAX_RADIUS} (default: 500)',
+                             required=False, type=float),
+            OpenApiParameter(name='minBikes', description='Minimum bikesAvailable (default: 0)',
+                             required=False, type=int),
+            OpenApiParameter(name='minDocks', description='Minimum docksAvailable (default: 0)',
+                             required=False, type=int),
+            OpenApiParameter(name='limit', description=f'Maximum number of stations, up to {NEARBY_MAX_LIMIT}',
+                             required=False, type=int),
+        ],
+        responses={
+            200: StationNearbySerializer,
+            400: OpenApiResponse('400', description=('When invalid query parameters.<br>'
+                                                     '**[error_code]** 1000: No *at* query param, '
+                                                     '1001: Invalid *at* format, 1009: Invalid location or filters')),
+            404: OpenApiResponse('404', description=('When no snapshot for requested *at*.<br>'
+                                                     '**[error_code]** 1002: No stations')),
+        })
+    def get(self, request, *args, **kwargs):
+        query_at = get_at_or_raise(request.query_params)
+        query_params = request.query_params
+        try:
+            lat, lon = float(query_params['lat']), float(query_params['lon'])
+            radius = float(query_params.get('radius', 500))
+            min_bikes, min_docks = int(query_params.get('minBikes', 0)), int(query_params.get('minDocks', 0))
+            limit = int(query_params.get('limit', NEARBY_MAX_LIMIT))
+        except (KeyError, ValueError):
+            raise errors.InvalidNearbyQueryError()
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180 and 0 <= radius <= NEARBY_MAX_RADIUS) \
+                or not 1 <= limit <= NEARBY_MAX_LIMIT:
+            raise errors.InvalidNearbyQueryError()
+
+        repository = get_station_repository()
+        first_at = timeline.resolve_at(repository, query_at)
+        if first_at is None:
+            raise errors.StationNotFoundError()
+
+        serializer = StationNearbySerializer({
+            'at': first_at,
+            'stations': nearby.nearby_stations(repository, first_at, lat, lon, radius, min_bikes, min_docks, limit),
+        })
+
+        return Response(serializer.data, status.HTTP_200_OK)
+
+
+class StationExportAPIView(views.APIView):
+
+    permission_classes = (IsAuthenticated, )
+
+    @extend_schema(
+        description=('Numeric properties of one or every station over a time range, as a NumPy .npz archive '
+                     'with one typed column per property: *at* (datetime64[ms]), *kioskId*, *bikesAvailable*, '
+                     '*docksAvailable* and *electricBikesAvailable* (int32, -1 when missing).<br>'
+                     'Rows of one station are in time order.'),
+        parameters=[
+            OpenApiParameter(name='from', description='Start Datetime, inclusive (e.g. 2019-09-01T10:00:00)',
+                             required=True, type=str),
+            OpenApiParameter(name='to', description='End Datetime, inclusive (e.g. 2019-09-02T10:00:00)',
+                             required=True, type=str),
+            OpenApiParameter(name='kioskId', description='Only this station (default: every station)',
+                             required=False, type=int),
+        ],
+        responses={
+            (200, 'application/octet-stream'): OpenApiTypes.BINARY,
+            400: OpenApiResponse('400', description=('When invalid query parameters.<br>'
+                                                     '**[error_code]** 1004: Invalid *from* or *to*<br>'
+                                                     '**[error_code]** 1007: Invalid *kioskId*')),
+        })
+    def get(self, request, *args, **kwargs):
+        from_at, to_at = get_range_or_raise(request.query_params)
+        kioskId = request.query_params.get('kioskId')
+        if kioskId is not None and not kioskId.isdigit():
+            raise errors.InvalidKioskIdError()
+
+        rows = get_station_repository().iter_station_properties(kioskId, from_at, to_at, export.METRICS)
+        response = HttpResponse(content_type='application/octet-stream')
+        response['Content-Disposition'] = 'attachment; filename="stations.npz"'
+        export.write_npz(export.collect_columns(rows), response)
+
+        return response
+
+
+class StationResponseCacheStatsAPIView(views.APIView):
+
+    permission_classes = (IsAuthenticated, )
+
+    @extend_schema(
+        description='Hit and miss counters of the response cache shared by both station GET endpoints.',
+        responses={
+            200: OpenApiResponse('200', description='*hits* and *misses* counters'),
+        })
+    def get(self, request, *args, **kwargs):
+        return Response(response_cache.stats(), status.HTTP_200_OK)
+
+
+class MetricsAPIView(views.APIView):
+
+    permission_classes = (IsAuthenticated, )
+
+    @extend_schema(
+        description=('Latency histograms per endpoint and phase (auth, resolve, db, serialize, render, total) '
+                     'of this process, in the Prometheus text format.'),
+        responses={
+            200: OpenApiResponse(OpenApiTypes.STR, description='Prometheus text exposition format'),
+        })
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(timing.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,9 +1,10 @@
 from rest_framework import serializers, validators
 
+from common.serializers import DocumentSerializerMixin
 from .models import Weather
 
 
-class WeatherSerializer(serializers.ModelSerializer):
+class WeatherSerializer(DocumentSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Weather
@@ -14,6 +15,3 @@ class WeatherSerializer(serializers.ModelSerializer):
 
     at = serializers.DateTimeField(validators=[validators.UniqueValidator(queryset=Weather.objects.all())])
     document = serializers.DictField()
-
-    def to_representation(self, instance):
-        return super().to_representation(instance)['document']